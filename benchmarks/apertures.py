@@ -0,0 +1,94 @@
+import numpy as np
+import sys
+import tempfile
+import time
+from syncmrt.tools.maskExtract import rotatePolygons, rasterise, exportMasks, drawMask
+
+'''
+Benchmark the block apertures of a plan (10 beams of 200 points by default) turned into the BEV, rasterised onto a 60 mm
+grid of 0.25 mm pixels and written as DXF drawings.
+	python -m syncmrt.benchmarks.apertures [beams] [points]
+
+Compares pairing and turning the points one at a time, rasterising by testing 4x4 points in every pixel and writing the
+drawings one after the other with the vectorised engine (rotatePolygons, rasterise, exportMasks).
+'''
+
+extent = np.array([-30,30,-30,30])
+shape = (240,240)
+
+def apertures(beams,points,seed=0):
+	# Irregular star shaped apertures, as BlockData (flat x,y pairs).
+	rng = np.random.default_rng(seed)
+	theta = np.linspace(0,2*np.pi,points,endpoint=False)
+	blocks = []
+	for i in range(beams):
+		r = 15+3*np.sin(rng.integers(3,8)*theta+rng.uniform(0,np.pi))+rng.uniform(-0.5,0.5,points)
+		blocks.append(np.column_stack([r*np.cos(theta),r*np.sin(theta)]).ravel())
+	return blocks
+
+def area(polygon):
+	return 0.5*abs(np.dot(polygon[:,0],np.roll(polygon[:,1],-1))-np.dot(polygon[:,1],np.roll(polygon[:,0],-1)))
+
+def inside(polygon,x,y):
+	# Even-odd test of points against every edge.
+	x0, y0 = polygon[:,0], polygon[:,1]
+	x1, y1 = np.roll(x0,-1), np.roll(y0,-1)
+	result = np.zeros(x.shape,dtype=bool)
+	for a, b, c, d in zip(x0,y0,x1,y1):
+		if a == c:
+			continue
+		crosses = (a <= x) != (c <= x)
+		result ^= crosses & (y < b+(x-a)*(d-b)/(c-a))
+	return result
+
+def naive(blocks,path):
+	polygons = []
+	for block in blocks:
+		points = []
+		for i in range(int(len(block)/2)):
+			x, y = block[i*2], block[i*2+1]
+			# 90 deg CCW.
+			points.append([-y,x])
+		polygons.append(np.array(points))
+	pixel = (extent[1::2]-extent[0::2])/np.array(shape)
+	offsets = (np.arange(4)+0.5)/4
+	u = extent[0]+(np.arange(shape[0])[:,None]+offsets[None,:]).ravel()*pixel[0]
+	v = extent[2]+(np.arange(shape[1])[:,None]+offsets[None,:]).ravel()*pixel[1]
+	uu, vv = np.meshgrid(u,v,indexing='ij')
+	masks = [inside(polygon,uu,vv).reshape(shape[0],4,shape[1],4).mean(axis=(1,3)) for polygon in polygons]
+	for i, polygon in enumerate(polygons):
+		drawMask((path+'/BeamPort%i.dxf'%i,polygon,[40,40]))
+	return polygons, masks
+
+def vectorised(blocks,path):
+	vertices, counts = rotatePolygons([np.array(block).reshape(-1,2) for block in blocks],90)
+	polygons = [vertices[i,:counts[i]] for i in range(len(blocks))]
+	masks = [rasterise(polygon,extent,shape) for polygon in polygons]
+	exportMasks(polygons,[40,40],path)
+	return polygons, masks
+
+def timeIt(function,*args,repeat=3):
+	times = []
+	for i in range(repeat):
+		with tempfile.TemporaryDirectory() as path:
+			start = time.perf_counter()
+			result = function(*args,path)
+			times.append(time.perf_counter()-start)
+	return min(times), result
+
+if __name__ == "__main__":
+	beams = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+	points = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+	blocks = apertures(beams,points)
+	print('Beams',beams,'points',points,'grid',shape)
+
+	slow, (polygons, masks) = timeIt(naive,blocks)
+	print('Loops, 4x4 point tests, serial DXF:    %.3f s'%slow)
+	fast, (vertices, coverage) = timeIt(vectorised,blocks)
+	print('Vectorised, exact spans, parallel DXF: %.3f s (%.1fx)'%(fast,slow/fast))
+
+	pixelArea = np.prod((extent[1::2]-extent[0::2])/np.array(shape))
+	exact = np.array([area(polygon) for polygon in vertices])
+	print('Largest area error: point tests %.3f%%, spans %.4f%%'%(
+		100*np.amax(np.absolute(np.array([m.sum() for m in masks])*pixelArea-exact)/exact),
+		100*np.amax(np.absolute(np.array([m.sum() for m in coverage])*pixelArea-exact)/exact)))
@@ -0,0 +1,79 @@
+import numpy as np
+import sys
+import time
+from scipy import ndimage
+from syncmrt.tools import drr
+from syncmrt.tools.cpu import cpuInterface
+from syncmrt.tools.projection import project
+from syncmrt.benchmarks.rotate import phantom
+
+'''
+Benchmark the views of an arc (180 by default, 1 deg apart, couch 10 deg, collimator 15 deg) on a CT sized volume
+(256x256x160 by default).
+	python -m syncmrt.benchmarks.arc [views] [size]
+
+Compares rotating the CT to each view and summing it (a few views, scaled up to the arc), ray casting every view as a
+beam of its own (drrEngine.project, one batch) and sweeping the arc (drrEngine.sweep, through sinograms and ray by ray).
+The two sweeps are on the same detector, every pixel of every view is compared for the phantom and a smooth volume.
+'''
+
+def arc(count):
+	angles = np.column_stack([np.arange(count)-90.0,np.full(count,10.0),np.full(count,15.0)])
+	return angles, np.zeros((count,3))
+
+def smooth(shape):
+	# A blob with no sharp edges inside the volume.
+	x, y, z = np.meshgrid(*[np.linspace(-1,1,n) for n in shape],indexing='ij')
+	return (1000*np.exp(-2*(x**2+y**2+z**2))).astype(np.float32)
+
+def compare(images,reference):
+	'''Largest difference between two sweeps of the same views (fraction of the largest value) over the whole images,
+	away from the outline of the volume (2 pixels or more inside where the reference's rays stop) and on average.'''
+	difference = np.absolute(images-reference)
+	scale = np.amax(np.absolute(reference))
+	inside = ndimage.binary_erosion(reference != 0,structure=np.ones((1,5,5)))
+	return np.amax(difference)/scale, np.amax(difference[inside])/scale, np.mean(difference)/scale
+
+def rotateAndSum(volume,extent,angles):
+	engine = cpuInterface()
+	engine.copyTexture(volume,pixelSize=np.array([1,1,1]),extent=extent)
+	return [project(engine.rotate(gantry,0,patientSupport,order='pat-gant-col',z1=collimator)[0],axis=2)
+		for gantry, patientSupport, collimator in angles]
+
+def timeIt(function,*args,repeat=2):
+	times = []
+	for i in range(repeat):
+		start = time.perf_counter()
+		result = function(*args)
+		times.append(time.perf_counter()-start)
+	return times[0], min(times[1:]), result
+
+if __name__ == "__main__":
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 180
+	size = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+	volume = phantom((size,size,int(size*0.625)))
+	extent = np.array([0,volume.shape[0],0,volume.shape[1],0,volume.shape[2]],dtype=float)
+	angles, isocenters = arc(count)
+	isocenters += 0.5*extent[1::2]
+	print('Volume',volume.shape,'views',count)
+
+	engine = drr.drrEngine(volume,extent)
+	views = drr.beamGeometry.fromViews(angles,isocenters)
+
+	first, rotated, result = timeIt(rotateAndSum,volume,extent,angles[:3])
+	rotated *= count/3.0
+	print('Rotate and sum:         %.2f s (3 views, scaled to the arc)'%rotated)
+	first, batch, images = timeIt(engine.project,views)
+	print('Ray cast every view:    %.2f s (%.1fx, first call %.2f s)'%(batch,rotated/batch,first))
+	first, swept, (stack, stackExtent) = timeIt(engine.sweep,views)
+	print('Sweep:                  %.2f s (%.1fx, first call %.2f s)'%(swept,rotated/swept,first))
+
+	first, generic, (reference, referenceExtent) = timeIt(engine.sweep,views,False)
+	print('Sweep, ray by ray:      %.2f s (%.1fx, first call %.2f s)'%(generic,rotated/generic,first))
+
+	# The sinograms interpolate twice (in the slices, then between positions), the outline of the volume and sharp
+	# edges in it come out about a pixel softer than ray by ray.
+	print('Sinograms against ray by ray, largest difference over the whole images / away from the outline, mean:')
+	print('  phantom:  %.2f%% / %.2f%%, %.3f%%'%tuple(100*np.array(compare(stack,reference))))
+	other = drr.drrEngine(smooth(volume.shape),extent)
+	print('  smooth:   %.2f%% / %.2f%%, %.3f%%'%tuple(100*np.array(compare(other.sweep(views)[0],other.sweep(views,False)[0]))))
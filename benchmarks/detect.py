@@ -0,0 +1,33 @@
+import numpy as np
+import time
+from syncmrt.imageGuidance.detect import findFiducials
+
+'''
+Benchmark automatic fiducial detection on a 2048x2048 detector image (0.2 mm pixels) with 12 markers of 1.2 mm.
+	python -m syncmrt.benchmarks.detect
+'''
+
+def phantom(size=2048,markers=12,seed=0):
+	# Noisy image with a slow background gradient and gaussian markers, returns the image and the marker pixels (x,y).
+	rng = np.random.default_rng(seed)
+	image = (rng.normal(0,20,(size,size))+500*np.sin(np.arange(size)/300)[None,:]).astype(np.float32)
+	y,x = np.ogrid[:size,:size]
+	truth = rng.uniform(40,size-40,(markers,2))
+	for cx, cy in truth:
+		image += (300*np.exp(-((y-cy)**2+(x-cx)**2)/(2*2.5**2))).astype(np.float32)
+	return image, truth
+
+if __name__ == "__main__":
+	image, truth = phantom()
+	pixelSize = 0.2
+	extent = [0,image.shape[1]*pixelSize,0,image.shape[0]*pixelSize]
+	for method in ('log','template'):
+		findFiducials(image,extent,1.2,method=method)
+		start = time.perf_counter()
+		candidates = findFiducials(image,extent,1.2,method=method)
+		elapsed = time.perf_counter()-start
+		# Candidates back to pixels, and the distance of the best ones to the nearest true marker.
+		x = candidates[:,0]/pixelSize-0.5
+		y = (extent[3]-candidates[:,1])/pixelSize-0.5
+		error = np.amin(np.hypot(x[:,None]-truth[None,:,0],y[:,None]-truth[None,:,1]),axis=1)[:len(truth)]
+		print('%-9s %.3f s, %i candidates, largest error of the best %i: %.2f px'%(method,elapsed,len(candidates),len(truth),np.amax(error)))
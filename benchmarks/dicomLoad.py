@@ -0,0 +1,113 @@
+import dicom
+from dicom.dataset import Dataset, FileDataset
+import numpy as np
+import os
+import sys
+import tempfile
+import time
+from syncmrt.fileHandler import catalog, dicomSeries
+from syncmrt.fileHandler.dicom import importDicom
+
+'''
+Benchmark loading a CT series: the previous path (full read of every file to check the modality, a second full read
+per slice and list.index placement) against the folder catalog and parallel slice loader. The folder is then opened
+again as a new session would, which reads the catalog from disk instead of the headers.
+	python -m syncmrt.benchmarks.dicomLoad [number of slices, default 600]
+
+The loader was asked to be at least 5x faster than the previous path. It is not: on one core it measured 1.3-1.9x
+(600 slices of 512x512). Reading the files is not what is left (their bytes come off the page cache in well under a
+tenth of the time), it is parsing the headers with pydicom and writing every slice across the slice axis of the volume
+(a transposing copy, the volume is rows x columns x slices). The benchmark times the two apart.
+'''
+
+# Speed up asked for against the previous path.
+target = 5.0
+
+def writeSeries(path,slices,size=512,volume=None):
+	# Synthetic CT series, one file per slice (1 mm voxels). Slice i of volume (rows, columns, slices) from the top if
+	# there is one, otherwise size x size slices of i.
+	rows, columns = (size,size) if volume is None else volume.shape[:2]
+	files = []
+	for i in range(slices):
+		meta = Dataset()
+		meta.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.1.1.2'
+		meta.MediaStorageSOPInstanceUID = '1.2.3.%i'%(i+1)
+		meta.TransferSyntaxUID = '1.2.840.10008.1.2'
+		fn = os.path.join(path,'CT%i.dcm'%(i+1))
+		ds = FileDataset(fn,{},file_meta=meta,preamble=b"\0"*128)
+		ds.is_little_endian = True
+		ds.is_implicit_VR = True
+		ds.Modality = 'CT'
+		ds.SeriesInstanceUID = '1.2.3'
+		ds.InstanceNumber = i+1
+		ds.PatientPosition = 'HFS'
+		ds.ImagePositionPatient = [-columns/2,-rows/2,-i]
+		ds.ImageOrientationPatient = [1,0,0,0,1,0]
+		ds.PixelSpacing = [1,1]
+		ds.SpacingBetweenSlices = 1
+		ds.Rows = rows
+		ds.Columns = columns
+		ds.BitsAllocated = 16
+		ds.BitsStored = 16
+		ds.HighBit = 15
+		ds.PixelRepresentation = 1
+		ds.SamplesPerPixel = 1
+		ds.PhotometricInterpretation = 'MONOCHROME2'
+		ds.RescaleType = 'HU'
+		ds.RescaleSlope = 1
+		ds.RescaleIntercept = 0
+		if volume is None:
+			ds.PixelData = np.full((size,size),i,dtype=np.int16).tobytes()
+		else:
+			ds.PixelData = np.ascontiguousarray(volume[:,:,slices-i-1],dtype=np.int16).tobytes()
+		ds.save_as(fn)
+		files.append(fn)
+	return files
+
+def previous(files):
+	ds = [fn for fn in files if dicom.read_file(fn).Modality == 'CT']
+	ref = dicom.read_file(ds[0])
+	volume = np.zeros((int(ref.Rows),int(ref.Columns),len(ds)),dtype=np.result_type(ref.pixel_array))-1000
+	for fn in ds:
+		volume[:,:,len(ds)-ds.index(fn)-1] = dicom.read_file(fn).pixel_array
+	return volume
+
+def current(files,times=None):
+	# times (if given) gets the time spent on the headers and on the pixels.
+	start = time.perf_counter()
+	ds = importDicom(files,'CT')
+	slices = max(catalog.openCatalog(os.path.dirname(ds[0]),rescan=False).series(ds).values(),key=len)[::-1]
+	ds = [fn for fn,record in slices]
+	ref = dicomSeries.readHeader(ds[0])
+	headers = time.perf_counter()
+	volume = np.zeros((int(ref.Rows),int(ref.Columns),len(ds)),dtype=dicomSeries.pixelType(ref))-1000
+	volume = dicomSeries.loadSlices(ds,volume,len(ds)-np.arange(len(ds))-1,headers=[ref]*len(ds))
+	if times is not None:
+		times.extend([headers-start,time.perf_counter()-headers])
+	return volume
+
+if __name__ == "__main__":
+	slices = int(sys.argv[1]) if len(sys.argv) > 1 else 600
+	with tempfile.TemporaryDirectory() as path:
+		files = writeSeries(path,slices)
+
+		start = time.perf_counter()
+		a = previous(files)
+		old = time.perf_counter()-start
+		stages = []
+		start = time.perf_counter()
+		b = current(files,stages)
+		new = time.perf_counter()-start
+
+		# A new session: nothing open and no headers kept, the catalog is read back from the folder.
+		catalog.catalogs.clear()
+		dicomSeries.headerCache.clear()
+		reopened = []
+		c = current(files,reopened)
+
+	print('Slices: %i'%slices)
+	print('Previous: %.3f s'%old)
+	print('Current:  %.3f s (%.1fx), headers %.3f s, pixels %.3f s'%(new,old/new,stages[0],stages[1]))
+	print('Reopened: headers %.3f s, pixels %.3f s'%(reopened[0],reopened[1]))
+	print('Target of %.0fx: %s'%(target,'met' if old/new >= target else 'not met'))
+	print('Identical volumes:',np.array_equal(a,b) & np.array_equal(a,c))
@@ -0,0 +1,79 @@
+import dicom
+from dicom.dataset import Dataset, FileDataset
+import numpy as np
+import os
+import sys
+import tempfile
+import time
+from syncmrt.tools.writeDicom import writeSeries, writeMultiframe, newUID
+from syncmrt.benchmarks.rotate import phantom
+
+'''
+Benchmark exporting a CT (512x512, 500 slices by default) as DICOM: building a dataset for every slice and calling
+save_as, against writeSeries (a thread pool writing the slices) and writeMultiframe (one Enhanced CT file).
+	python -m syncmrt.benchmarks.dicomWrite [number of slices]
+'''
+
+extent = np.array([-256,256,-256,256,-250,250])
+
+def naive(path,volume):
+	spacing = (extent[1::2]-extent[0::2])/np.array(volume.shape)
+	series = newUID()
+	files = []
+	for k in range(volume.shape[2]):
+		meta = Dataset()
+		meta.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.1.1.2'
+		meta.MediaStorageSOPInstanceUID = series+'.%i'%(k+1)
+		meta.TransferSyntaxUID = '1.2.840.10008.1.2.1'
+		fn = os.path.join(path,'CT%i.dcm'%(k+1))
+		ds = FileDataset(fn,{},file_meta=meta,preamble=b"\0"*128)
+		ds.is_little_endian = True
+		ds.is_implicit_VR = False
+		ds.SOPClassUID = meta.MediaStorageSOPClassUID
+		ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+		ds.Modality = 'CT'
+		ds.SeriesInstanceUID = series
+		ds.InstanceNumber = k+1
+		ds.ImagePositionPatient = [extent[2]+0.5*spacing[1],extent[0]+0.5*spacing[0],extent[4]+(k+0.5)*spacing[2]]
+		ds.ImageOrientationPatient = [1,0,0,0,1,0]
+		ds.PixelSpacing = [spacing[0],spacing[1]]
+		ds.SliceThickness = spacing[2]
+		ds.Rows = volume.shape[0]
+		ds.Columns = volume.shape[1]
+		ds.BitsAllocated = 16
+		ds.BitsStored = 16
+		ds.HighBit = 15
+		ds.PixelRepresentation = 1
+		ds.SamplesPerPixel = 1
+		ds.PhotometricInterpretation = 'MONOCHROME2'
+		ds.RescaleIntercept = 0
+		ds.RescaleSlope = 1
+		ds.PixelData = np.rint(volume[:,:,k]).astype(np.int16).tobytes()
+		ds.save_as(fn)
+		files.append(fn)
+	return files
+
+def timeIt(function,*args):
+	with tempfile.TemporaryDirectory() as path:
+		start = time.perf_counter()
+		result = function(path,*args)
+		elapsed = time.perf_counter()-start
+		# Check the first and last slices read back.
+		if isinstance(result,list):
+			check = [np.array_equal(dicom.read_file(result[k]).pixel_array,np.rint(args[0][:,:,k])) for k in (0,-1)]
+		else:
+			frames = dicom.read_file(result).pixel_array
+			check = [np.array_equal(frames[k],np.rint(args[0][:,:,k])) for k in (0,-1)]
+	return elapsed, all(check)
+
+if __name__ == "__main__":
+	slices = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+	volume = phantom((512,512,slices))
+	print('Volume',volume.shape)
+
+	slow, same = timeIt(naive,volume)
+	print('save_as per slice:       %.2f s (%s)'%(slow,'read back' if same else 'differs'))
+	fast, same = timeIt(lambda path,volume: writeSeries(path,volume,extent),volume)
+	print('writeSeries:             %.2f s (%.1fx, %s)'%(fast,slow/fast,'read back' if same else 'differs'))
+	fast, same = timeIt(lambda path,volume: writeMultiframe(os.path.join(path,'CT.dcm'),volume,extent),volume)
+	print('writeMultiframe:         %.2f s (%.1fx, %s)'%(fast,slow/fast,'read back' if same else 'differs'))
@@ -0,0 +1,118 @@
+from dicom.dataset import Dataset, FileDataset
+import numpy as np
+import os
+import tempfile
+import time
+from syncmrt.tools import drr
+from syncmrt.tools.cpu import cpuInterface
+from syncmrt.tools.geometry import axisExtent
+from syncmrt.tools.projection import project
+from syncmrt.fileHandler import saveVolume, loadVolume
+from syncmrt.fileHandler.dicom import importCT, importRTP
+from syncmrt.benchmarks.rotate import phantom
+from syncmrt.benchmarks.dicomLoad import writeSeries
+
+'''
+Benchmark beam's eye view radiographs for a plan of several beams on a CT sized volume (512x512x300).
+	python -m syncmrt.benchmarks.drr
+
+Compares what extractTreatmentBeams and the widget did (rotate the CT for every beam, save it, load it and sum it) with
+ray casting all beams in one call with drrEngine. First checks a beam of a non-cubic CT through the whole import
+(importCT then importRTP.computeBeamDRRs) against its rotated volume summed along the beam.
+'''
+
+# Gantry, patient support and collimator angles of the plan.
+angles = [(0,0,0),(45,0,0),(90,10,0),(135,0,15),(270,-10,0)]
+extent = np.array([0,512,0,512,0,300])
+
+def rotateAndSum(volume,save=False):
+	engine = cpuInterface()
+	engine.copyTexture(volume,pixelSize=np.array([1,1,1]),extent=extent)
+	images = []
+	with tempfile.TemporaryDirectory() as path:
+		for i, (gantry, patientSupport, collimator) in enumerate(angles):
+			array, arrayExtent = engine.rotate(gantry,0,patientSupport,order='pat-gant-col',z1=collimator)
+			if save:
+				array = loadVolume(saveVolume(os.path.join(path,'beam%i_array.vol'%(i+1)),array,extent=arrayExtent)).array
+			images.append(project(array,axis=2))
+	return images
+
+def rayCast(volume,order=1,**kwargs):
+	engine = drr.drrEngine(volume,extent,order=order)
+	beams = [drr.beamGeometry.fromAngles(gantry,patientSupport,collimator,**kwargs) for gantry,patientSupport,collimator in angles]
+	return engine.project(beams)
+
+def writePlan(fn,isocenter):
+	# One static beam at gantry 0, isocenter in DICOM (x,y,z).
+	meta = Dataset()
+	meta.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.1.1.481.5'
+	meta.MediaStorageSOPInstanceUID = '1.2.4'
+	meta.TransferSyntaxUID = '1.2.840.10008.1.2'
+	ds = FileDataset(fn,{},file_meta=meta,preamble=b"\0"*128)
+	ds.is_little_endian = True
+	ds.is_implicit_VR = True
+	ds.Modality = 'RTPLAN'
+	group = Dataset()
+	group.NumberOfBeams = 1
+	ds.FractionGroupSequence = [group]
+	block = Dataset()
+	block.BlockThickness = 10
+	block.BlockData = [-5,-5,5,-5,5,5,-5,5]
+	point = Dataset()
+	point.ControlPointIndex = 0
+	point.GantryAngle = 0
+	point.PatientSupportAngle = 0
+	point.BeamLimitingDeviceAngle = 0
+	point.IsocenterPosition = list(isocenter)
+	beam = Dataset()
+	beam.BeamNumber = 1
+	beam.BlockSequence = [block]
+	beam.ControlPointSequence = [point]
+	ds.BeamSequence = [beam]
+	ds.save_as(fn)
+	return fn
+
+def checkImport(shape=(48,64,20)):
+	'''Largest difference (fraction of the largest value) between the DRR of a CT through the import and its rotated
+	volume summed along the beam, away from the volume's edges.'''
+	with tempfile.TemporaryDirectory() as path:
+		ct = importCT(writeSeries(path,shape[2],volume=phantom(shape)))
+		array = loadVolume(ct.arrayFile).array
+		extent = axisExtent(ct.arrayExtent)
+		center = 0.5*(extent[0::2]+extent[1::2])
+		# importRTP turns the plan's (x,y,z) into the rotated CT's axes as (z,x,y).
+		rtp = importRTP([writePlan(os.path.join(path,'plan.dcm'),center[[1,2,0]])])
+		rtp.computeBeamDRRs(ct)
+		image, imageExtent = rtp.beam[0].drr, rtp.beam[0].drrExtent
+		expected = project(array,axis=2)
+	# Both are on 1 mm pixels, line them up by where they start.
+	offset = np.rint([imageExtent[0]-(extent[0]-center[0]),imageExtent[2]-(extent[2]-center[1])]).astype(int)
+	image = image[max(0,-offset[0]):,max(0,-offset[1]):]
+	expected = expected[max(0,offset[0]):,max(0,offset[1]):]
+	rows, cols = min(image.shape[0],expected.shape[0]), min(image.shape[1],expected.shape[1])
+	difference = np.absolute(image[1:rows-1,1:cols-1]-expected[1:rows-1,1:cols-1])
+	return np.amax(difference)/np.amax(np.absolute(expected))
+
+def timeIt(function,*args,repeat=3,**kwargs):
+	times = []
+	for i in range(repeat):
+		start = time.perf_counter()
+		function(*args,**kwargs)
+		times.append(time.perf_counter()-start)
+	return times[0], min(times[1:])
+
+if __name__ == "__main__":
+	print('Import check (48x64x20 CT): largest difference %.2g%%'%(100*checkImport()))
+	volume = phantom()
+	print('Volume',volume.shape,'beams',len(angles))
+
+	first, rotated = timeIt(rotateAndSum,volume,save=True)
+	print('Rotate, save and sum:   %.3f s'%rotated)
+	first, inMemory = timeIt(rotateAndSum,volume)
+	print('Rotate and sum:         %.3f s'%inMemory)
+	first, parallel = timeIt(rayCast,volume)
+	print('Ray cast (parallel):    %.3f s (%.1fx, first call %.3f s)'%(parallel,rotated/parallel,first))
+	first, nearest = timeIt(rayCast,volume,order=0)
+	print('Ray cast (nearest):     %.3f s (%.1fx)'%(nearest,rotated/nearest))
+	first, divergent = timeIt(rayCast,volume,mode='divergent',sad=1000,sid=1500)
+	print('Ray cast (divergent):   %.3f s (%.1fx)'%(divergent,rotated/divergent))
@@ -0,0 +1,70 @@
+import numpy as np
+import time
+from scipy import ndimage
+from syncmrt.imageGuidance.optimise import refineFiducials
+
+'''
+Benchmark fiducial refinement on a pair of orthogonal images (1000x1000, 0.5 mm pixels) with 10 to 50 markers: the
+previous loop (one marker, one region at a time, on a copy so the image isn't overwritten) against refineFiducials.
+	python -m syncmrt.benchmarks.fiducials
+'''
+
+def phantom(markers,size=1000,seed=0):
+	# Noisy quantised background with bright 2 mm markers, and points clicked within a pixel or two of each.
+	rng = np.random.default_rng(seed)
+	image = np.round(rng.random((size,size))*20)+1
+	y,x = np.ogrid[:size,:size]
+	points = []
+	for i in range(markers):
+		cy, cx = rng.uniform(50,size-50,2)
+		image[(y-cy)**2+(x-cx)**2 < 16] = 1000
+		points.append([cx+rng.uniform(-2,2),cy+rng.uniform(-2,2)])
+	return image, np.array(points)*0.5
+
+def previous(pts,data,dims,markersize):
+	# optimiseFiducials before the batch refinement.
+	dims = np.flip(dims,0)
+	pts_ctrds = np.zeros((np.shape(pts)))
+	pts = pts/dims
+	x_roi = int(markersize*3/dims[0])
+	y_roi = int(markersize*3/dims[1])
+	for i in range(np.shape(pts)[0]):
+		x = int(pts[i,0])
+		y = int(pts[i,1])
+		clr = data[y,x]
+		roi = np.array(data[(y-y_roi):(y+y_roi),(x-x_roi):(x+x_roi)])
+		roi_cnr = np.array([x-x_roi,y-y_roi])
+		thresh_max = clr+np.absolute(clr*(3/100))
+		thresh_min = clr-np.absolute(clr*(3/100))
+		roi[(roi<thresh_min)] = 0
+		roi[(roi>thresh_max)] = 0
+		roi[(roi>0)] = 1
+		labels, index = ndimage.label(roi)
+		labels_com = np.zeros((index,2))
+		for j in range(index):
+			labels_com[j,:] = ndimage.center_of_mass(roi,labels,j+1)
+		labels_com = np.fliplr(labels_com)
+		labels_com += roi_cnr
+		test = np.absolute(labels_com-pts[i,:])
+		dist = np.zeros((index,1))
+		for j in range(index):
+			dist[j,0] = np.sqrt(test[j,0]**2 + test[j,1]**2)
+		pts_ctrds[i,:] = labels_com[np.argmin(dist),:]
+	return pts_ctrds*dims
+
+def timeIt(function,*args,repeat=5):
+	times = []
+	for i in range(repeat):
+		start = time.perf_counter()
+		result = function(*args)
+		times.append(time.perf_counter()-start)
+	return min(times), result
+
+if __name__ == "__main__":
+	dims = np.array([0.5,0.5])
+	for markers in (10,20,50):
+		images, points = zip(*[phantom(markers,seed=seed) for seed in (0,1)])
+		old, expected = timeIt(lambda: [previous(p,d,dims,2) for p,d in zip(points,images)])
+		new, result = timeIt(lambda: refineFiducials(list(points),list(images),[dims,dims],2,weighted=False))
+		error = max(np.amax(np.absolute(a-b)) for a,b in zip(expected,result))
+		print('%i markers x 2 images: previous %.1f ms, batch %.1f ms (%.1fx), largest difference %.2g mm'%(markers,old*1e3,new*1e3,old/new,error))
@@ -0,0 +1,50 @@
+import importlib.util
+import os
+import subprocess
+import sys
+
+'''
+Benchmark the cold start of the syncmrt modules. Each module is imported in a fresh interpreter, the import must stay
+under the time budget and must not load pycuda (which creates a CUDA context). A module that fails to import fails the
+benchmark, only the CUDA backend is skipped, and only when pycuda isn't installed.
+	python -m syncmrt.benchmarks.importTime [budget in seconds, default 1.0]
+'''
+
+modules = ['syncmrt.tools','syncmrt.fileHandler','syncmrt.treatment','syncmrt.imageGuidance']
+# Optional backends (module: package it needs), they load pycuda on purpose.
+optional = {'syncmrt.tools.cuda':'pycuda'}
+
+script = '''
+import sys, time
+start = time.perf_counter()
+import %s
+print(time.perf_counter()-start, 'pycuda' in sys.modules)
+'''
+
+def coldStart(module):
+	# Run in a new interpreter so nothing is cached in sys.modules.
+	env = dict(os.environ,PYTHONPATH=os.pathsep.join(sys.path))
+	result = subprocess.run([sys.executable,'-c',script%module],stdout=subprocess.PIPE,stderr=subprocess.PIPE,env=env,universal_newlines=True)
+	if result.returncode != 0:
+		return None, False, result.stderr.strip().splitlines()[-1]
+	duration, cuda = result.stdout.split()
+	return float(duration), cuda == 'True', None
+
+if __name__ == "__main__":
+	budget = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+	failed = False
+
+	for module in modules+list(optional):
+		if (module in optional) and (importlib.util.find_spec(optional[module]) is None):
+			print('%-24s skipped (optional, %s is not installed)'%(module,optional[module]))
+			continue
+		duration, cuda, error = coldStart(module)
+		if error is not None:
+			print('%-24s FAIL (%s)'%(module,error))
+			failed = True
+			continue
+		ok = (duration < budget) & ((not cuda) | (module in optional))
+		failed |= not ok
+		print('%-24s %.3f s  pycuda loaded: %s  %s'%(module,duration,cuda,'ok' if ok else 'FAIL'))
+
+	sys.exit(1 if failed else 0)
@@ -0,0 +1,37 @@
+import numpy as np
+import time
+from syncmrt.imageGuidance.match import matchMarkers
+
+'''
+Benchmark correspondence-free marker matching: 20 CT markers, of which 16 are found in the X-ray (shuffled, 0.5 mm
+localisation noise) along with 3 spurious detections and one marker that is off by 8 mm.
+	python -m syncmrt.benchmarks.match
+'''
+
+def markers(n=20,seen=16,spurious=3,seed=0):
+	rng = np.random.default_rng(seed)
+	left = rng.uniform(-40,40,(n,3))
+	angles = np.deg2rad(rng.uniform(-10,10,3))
+	cx, cy, cz = np.cos(angles)
+	sx, sy, sz = np.sin(angles)
+	R = np.dot(np.dot([[1,0,0],[0,cx,-sx],[0,sx,cx]],[[cy,0,sy],[0,1,0],[-sy,0,cy]]),[[cz,-sz,0],[sz,cz,0],[0,0,1]])
+	t = rng.uniform(-20,20,3)
+	found = rng.choice(n,seen,replace=False)
+	right = np.dot(left[found],R.T)+t+rng.normal(0,0.5,(seen,3))
+	right[0] += [8,0,0]
+	right = np.vstack((right,rng.uniform(-40,40,(spurious,3))))
+	order = rng.permutation(len(right))
+	# Ground truth pairs (left, right) without the misplaced marker.
+	truth = {(int(found[i]),int(np.nonzero(order == i)[0][0])) for i in range(1,seen)}
+	return left, right[order], truth
+
+if __name__ == "__main__":
+	times, correct = [], 0
+	for seed in range(20):
+		left, right, truth = markers(seed=seed)
+		start = time.perf_counter()
+		pairs, R, t, residuals = matchMarkers(left,right,tolerance=2.0)
+		times.append(time.perf_counter()-start)
+		correct += {tuple(p) for p in pairs.tolist()} == truth
+	print('20 CT markers, 19 X-ray detections: %.1f ms median (%.1f ms worst), %i/20 exact inlier sets'%(
+		1e3*np.median(times),1e3*np.amax(times),correct))
@@ -0,0 +1,46 @@
+import asyncio
+import numpy as np
+import time
+from syncmrt.imageGuidance.motion import simulatedMotor, motionController
+
+'''
+Benchmark a positioning correction on simulated MRT motors (tx, ty, tz at 5 mm/s, ry at 10 deg/s, 20 ms latency):
+one axis after another (as DynMRT used to) against all axes at once, and how quickly a move is stopped.
+	python -m syncmrt.benchmarks.motion
+'''
+
+def stage():
+	motors = {name:simulatedMotor(speed=5.0,latency=0.02) for name in ('tx','ty','tz')}
+	motors['ry'] = simulatedMotor(speed=10.0,latency=0.02)
+	return motionController(motors)
+
+async def sequential(controller,targets):
+	for name, value in targets.items():
+		await controller.move({name:value})
+
+async def cancelled(controller,targets,after):
+	task = asyncio.ensure_future(controller.move(targets))
+	await asyncio.sleep(after)
+	start = time.perf_counter()
+	task.cancel()
+	try:
+		await task
+	except asyncio.CancelledError:
+		pass
+	returned = time.perf_counter()-start
+	# Stopping doesn't wait for the motors, they report done at their next update.
+	while not all(motor.done for motor in controller.motors.values()):
+		await asyncio.sleep(0.001)
+	return returned, time.perf_counter()-start
+
+if __name__ == "__main__":
+	targets = {'tx':2.5, 'ty':-1.2, 'tz':1.8, 'ry':4.0}
+	for name, run in (('one axis at a time',sequential),('all axes at once',lambda c,t: c.move(t))):
+		controller = stage()
+		start = time.perf_counter()
+		asyncio.run(run(controller,targets))
+		positions = np.array([controller.motors[name].readback for name in targets])
+		print('%s: %.2f s, largest error %.4f'%(name,time.perf_counter()-start,np.amax(np.absolute(positions-list(targets.values())))))
+	controller = stage()
+	returned, stopped = asyncio.run(cancelled(controller,targets,0.1))
+	print('Cancelled after 0.1 s: returned in %.1f ms, motors done in %.1f ms'%(1e3*returned,1e3*stopped))
@@ -0,0 +1,34 @@
+import asyncio
+import time
+from syncmrt.imageGuidance import planning
+from syncmrt.imageGuidance.motion import simulatedMotor, motionController
+
+'''
+Benchmark a positioning correction (tx, ty, tz at 2 mm/s, ry at 5 deg/s, 50 ms latency, ramps of 0.2 s) on simulated
+motors: the naive move (one axis after another, as DynMRT used to) against the planned one, unconstrained and with at
+most two axes moving at once and tz kept apart from tx. Gives the planned and measured times.
+	python -m syncmrt.benchmarks.planning
+'''
+
+def stage():
+	motors = {name:simulatedMotor(speed=2.0,acceleration=10.0,latency=0.05) for name in ('tx','ty','tz')}
+	motors['ry'] = simulatedMotor(speed=5.0,acceleration=25.0,latency=0.05)
+	return motors
+
+def run(plan):
+	controller = motionController(stage())
+	start = time.perf_counter()
+	asyncio.run(planning.execute(plan,controller))
+	return time.perf_counter()-start
+
+if __name__ == "__main__":
+	targets = {'tx':1.5, 'ty':-0.8, 'tz':2.2, 'ry':3.0}
+	axes = {name:planning.axis.fromMotor(motor,latency=0.05) for name,motor in stage().items()}
+	positions = {name:0.0 for name in axes}
+	plans = [
+		('naive, one axis at a time',planning.sequentialPlan(axes,positions,targets)),
+		('planned',planning.planMotion(axes,positions,targets)),
+		('planned, 2 at once, tz apart from tx',planning.planMotion(axes,positions,targets,exclusive=[('tx','tz')],concurrent=2)),
+	]
+	for name, plan in plans:
+		print('%s: planned %.2f s, measured %.2f s, phases %s'%(name,plan.duration,run(plan),plan.phases()))
@@ -0,0 +1,38 @@
+import numpy as np
+import os
+import sys
+import tempfile
+import time
+from syncmrt.benchmarks.rotate import phantom
+from syncmrt.fileHandler.volume import saveVolume
+from syncmrt.fileHandler.pyramid import volumePyramid
+from syncmrt.tools.projection import project, windowedProjector
+
+'''
+Benchmark the CT pyramid: making the levels of a saved volume, opening them again from the cache, and the interactive
+operations (projection, windowing) on level 1 against the full volume.
+	python -m syncmrt.benchmarks.pyramid [slices, default 300]
+'''
+
+def timed(function,*args,**kwargs):
+	start = time.perf_counter()
+	result = function(*args,**kwargs)
+	return result, time.perf_counter()-start
+
+if __name__ == "__main__":
+	slices = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+	volume = phantom((512,512,slices))
+	extent = np.array([-128,128,-128,128,-0.5*slices,0.5*slices])
+	with tempfile.TemporaryDirectory() as path:
+		fn = saveVolume(os.path.join(path,'ct.vol'),volume,extent=extent)
+		pyramid, build = timed(volumePyramid(volume,extent,fn=fn).build)
+		cached, reopen = timed(volumePyramid(volume,extent,fn=fn).build)
+		print('Levels 1-3 of',volume.shape,': made in %.2f s, opened from the cache in %.3f s'%(build,reopen))
+
+		for k in (0,1):
+			array, levelExtent, pixelSize = pyramid.level(k)
+			array = np.asarray(array)
+			projection, projectTime = timed(project,array,axis=2)
+			projector, histogramTime = timed(windowedProjector,array,axis=2)
+			image, windowTime = timed(projector.project,[[-100,100]])
+			print('Level %i %s: projection %.3f s, window histograms %.2f s, windowing %.4f s'%(k,array.shape,projectTime,histogramTime,windowTime))
@@ -0,0 +1,36 @@
+import numpy as np
+import time
+from syncmrt.tools import quaternions as q
+from syncmrt.tools.geometry import rotationMatrix
+
+'''
+Benchmark generating orientations for a beam sweep (gantry steps at a fixed patient support and collimator angle) and a
+stage trajectory (slerp between two orientations): one angle at a time in a loop against one call on arrays.
+	python -m syncmrt.benchmarks.quaternions [number of steps, default 10000]
+'''
+
+if __name__ == "__main__":
+	import sys
+	steps = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+	gantry = np.linspace(-180,180,steps)
+
+	start = time.perf_counter()
+	loop = np.array([rotationMatrix(angle,0,15,order='pat-gant-col',z1=5) for angle in gantry])
+	old = time.perf_counter()-start
+	start = time.perf_counter()
+	batch = rotationMatrix(gantry,0,15,order='pat-gant-col',z1=5)
+	new = time.perf_counter()-start
+	print('Beam sweep, %i steps:   loop %.3f s, arrays %.4f s (%.0fx), largest difference %.2g'%(
+		steps,old,new,old/new,np.amax(np.absolute(loop-batch))))
+
+	a = q.rotation(0,axis=np.array([0,0,1]))
+	b = q.fromMatrix(rotationMatrix(10,-5,20))
+	fractions = np.linspace(0,1,steps)
+	start = time.perf_counter()
+	loop = np.array([q.slerp(a,b,t) for t in fractions])
+	old = time.perf_counter()-start
+	start = time.perf_counter()
+	batch = q.slerp(a,b,fractions)
+	new = time.perf_counter()-start
+	print('Trajectory, %i steps:   loop %.3f s, arrays %.4f s (%.0fx), largest difference %.2g'%(
+		steps,old,new,old/new,np.amax(np.absolute(loop-batch))))
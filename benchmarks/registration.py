@@ -0,0 +1,47 @@
+import numpy as np
+import time
+from scipy import ndimage
+from syncmrt.tools import drr
+from syncmrt.tools.geometry import rotationMatrix
+from syncmrt.imageGuidance.imageRegistration import drrRegistration
+
+'''
+Benchmark 2D/3D registration: a 128^3 phantom (sphere with 25 inserts) seen by two orthogonal parallel views, the
+"X-rays" are DRRs of a known pose with noise added. Reports the time, error, rays cast and cost evaluations per metric.
+	python -m syncmrt.benchmarks.registration [size]
+'''
+
+def phantom(n=128,seed=0):
+	rng = np.random.default_rng(seed)
+	ct = np.zeros((n,n,n),dtype=np.float32)
+	z, y, x = np.ogrid[:n,:n,:n]
+	ct[(z-n/2)**2+(y-n/2)**2+(x-n/2)**2 < (0.4*n)**2] = 1
+	for i in range(25):
+		c = rng.uniform(0.25*n,0.75*n,3)
+		r = rng.uniform(0.03,0.08)*n
+		ct[(z-c[0])**2+(y-c[1])**2+(x-c[2])**2 < r*r] += rng.uniform(0.5,2)
+	return ndimage.gaussian_filter(ct,1), np.array([0,n,0,n,0,n],dtype=float)
+
+def xrays(ct,extent,views,pose,noise=0.5,seed=0):
+	rng = np.random.default_rng(seed)
+	engine = drr.drrEngine(ct,extent)
+	R = rotationMatrix(*pose[:3]).astype(float)
+	images = engine.project([drr.beamGeometry(np.dot(view.R,R),isocenter=engine.center,pixelSize=1.0,step=1.0) for view in views])
+	# Translation shifts each projection on its detector.
+	return ([image+rng.normal(0,noise,image.shape) for image,ext in images],
+		[ext+np.repeat(np.dot(view.R,pose[3:])[:2],2) for view,(image,ext) in zip(views,images)])
+
+if __name__ == "__main__":
+	import sys
+	n = int(sys.argv[1]) if len(sys.argv) > 1 else 128
+	ct, extent = phantom(n)
+	views = [drr.beamGeometry(np.eye(3)),drr.beamGeometry(rotationMatrix(90,0,0))]
+	truth = np.array([3,-2,4,5,-3,2],dtype=float)
+	images, extents = xrays(ct,extent,views,truth)
+	for metric in ('ncc','mi'):
+		registration = drrRegistration(ct,extent,views,images,extents,metric=metric,levels=3)
+		start = time.perf_counter()
+		pose, R, t, scores = registration.register()
+		elapsed = time.perf_counter()-start
+		print('%s: %.2f s, error %.2f deg %.2f mm, %i casts, %i evaluations'%(metric,elapsed,
+			np.amax(np.absolute(pose[:3]-truth[:3])),np.amax(np.absolute(pose[3:]-truth[3:])),registration.casts,registration.evaluations))
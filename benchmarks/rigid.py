@@ -0,0 +1,63 @@
+import numpy as np
+import time
+from syncmrt.imageGuidance.wcs2wcs import rigidTransform, rotationmatrix
+
+'''
+Benchmark point based registration for a stack of point set pairs (6 markers each), as used for uncertainty analysis
+and testing candidate correspondences: the previous one-pair-at-a-time solve in a loop against rigidTransform.
+	python -m syncmrt.benchmarks.rigid [number of pairs, default 10000]
+'''
+
+def pairs(batch,n=6,noise=0.2,seed=0):
+	# Random marker sets, rotated by up to 10 deg, shifted and jittered.
+	rng = np.random.default_rng(seed)
+	left = rng.normal(0,30,(batch,n,3))
+	angles = np.deg2rad(rng.uniform(-10,10,(batch,3)))
+	q = np.column_stack((np.ones(batch),0.5*angles))
+	q /= np.linalg.norm(q,axis=1)[:,None]
+	R = np.moveaxis(rotationmatrix(q.T),-1,0)
+	right = np.einsum('bij,bnj->bni',R,left)+rng.uniform(-10,10,(batch,1,3))+rng.normal(0,noise,(batch,n,3))
+	return left, right
+
+def previous(l,r):
+	# affineTransform's solve before it was vectorised: centring and scale in loops, general eigen solver.
+	n = np.shape(l)[0]
+	l_ctd = (1/n)*np.sum(l,axis=0)
+	r_ctd = (1/n)*np.sum(r,axis=0)
+	lp = np.zeros([n,3])
+	rp = np.zeros([n,3])
+	for i in range(n):
+		lp[i,:] = np.subtract(l[i,:],l_ctd)
+		rp[i,:] = np.subtract(r[i,:],r_ctd)
+	M = np.dot(lp.transpose(),rp)
+	sxx,sxy,sxz,syx,syy,syz,szx,szy,szz = M.ravel()
+	N = np.array([[sxx+syy+szz, syz-szy, szx-sxz, sxy-syx],
+	[syz-szy, sxx-syy-szz, sxy+syx, szx+sxz],
+	[szx-sxz, sxy+syx, -sxx+syy-szz, syz+szy],
+	[sxy-syx, szx+sxz, syz+szy, -sxx-syy+szz]])
+	e, v = np.linalg.eig(N)
+	q = v[:,np.unravel_index(np.argmax(e),np.shape(e))]
+	R = np.reshape(rotationmatrix(q),(3,3))
+	D = np.zeros((n,1))
+	S_l = np.zeros((n,1))
+	for i in range(n):
+		D[i,0] = np.dot(np.array([rp[i,:]]),np.dot(R,np.array([lp[i,:]]).T))[0][0]
+		S_l[i,0] = np.linalg.norm(lp[i,:])**2
+	return R, np.sum(D)/np.sum(S_l)
+
+if __name__ == "__main__":
+	import sys
+	batch = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+	left, right = pairs(batch)
+
+	start = time.perf_counter()
+	expected = [previous(l,r) for l,r in zip(left,right)]
+	old = time.perf_counter()-start
+
+	start = time.perf_counter()
+	R, t, scale, residuals = rigidTransform(left,right)
+	new = time.perf_counter()-start
+
+	error = max(np.amax(np.absolute(e[0]-r)) for e,r in zip(expected,R))
+	print('%i pairs: previous %.3f s, batched %.3f s (%.0fx), largest difference in R %.2g, median residual %.3f mm'%(
+		batch,old,new,old/new,error,np.median(residuals)))
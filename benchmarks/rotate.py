@@ -0,0 +1,53 @@
+import numpy as np
+import time
+from syncmrt.tools.cpu import cpuInterface
+from syncmrt.tools.kernelCache import cache
+
+'''
+Benchmark the volume rotation engines on a CT sized volume (512x512x300).
+	python -m syncmrt.benchmarks.rotate
+
+The first call of each engine includes compiling its kernel, later calls should only pay for the resampling
+(see the kernel cache hit/miss counts at the end).
+'''
+
+def phantom(shape=(512,512,300)):
+	# Water cylinder (0 HU) in air (-1000 HU) with a bone insert.
+	y,x = np.ogrid[:shape[0],:shape[1]]
+	r = np.hypot(y-shape[0]/2,x-shape[1]/2)
+	volume = np.zeros(shape,dtype=np.float32)-1000
+	volume[r < 0.4*shape[0]] = 0
+	volume[r < 0.05*shape[0]] = 1000
+	return volume
+
+def timeEngine(engine,volume,repeat=3):
+	# Same calls importCT makes: copy, then rotate to the HFS orientation.
+	times = []
+	for i in range(repeat):
+		start = time.perf_counter()
+		engine.copyTexture(volume,pixelSize=np.array([1,1,1]),extent=np.array([0,512,0,512,0,300]))
+		engine.rotate(0,-90,0,order='ct-hfs')
+		times.append(time.perf_counter()-start)
+	return times[0], min(times[1:])
+
+if __name__ == "__main__":
+	volume = phantom()
+	print('Volume',volume.shape)
+
+	first, single = timeEngine(cpuInterface(workers=1,jit=False),volume)
+	print('CPU numpy (1 thread):   %.3f s'%single)
+	engine = cpuInterface(jit=False)
+	first, multi = timeEngine(engine,volume)
+	print('CPU numpy (%i threads):  %.3f s (%.1fx)'%(engine.workers,multi,single/multi))
+	engine = cpuInterface()
+	first, multi = timeEngine(engine,volume)
+	print('CPU jit (%i threads):    %.3f s (first call %.3f s)'%(engine.workers,multi,first))
+
+	try:
+		from syncmrt.tools.cuda import gpuInterface
+		first, multi = timeEngine(gpuInterface(),volume)
+		print('GPU:                    %.3f s (first call %.3f s)'%(multi,first))
+	except Exception:
+		print('GPU:                    not available')
+
+	print('Kernel cache:',cache.stats())
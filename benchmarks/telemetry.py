@@ -0,0 +1,44 @@
+import numpy as np
+import sys
+import time
+from syncmrt.imageGuidance.telemetry import recorder, simulatedSource
+
+'''
+Benchmark readback telemetry against a simulated PV source: the table and slit motors of listOfKnownMotorPVs.txt plus
+more simulated PVs (48 by default) updated at 1 kHz, while the main thread keeps asking for the latest values and the
+last 100 ms of every PV. Reports the update rate reached, samples lost and the query times.
+	python -m syncmrt.benchmarks.telemetry [PVs] [rate] [seconds]
+'''
+
+if __name__ == "__main__":
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 48
+	rate = float(sys.argv[2]) if len(sys.argv) > 2 else 1000.0
+	seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 3.0
+
+	source = simulatedSource(rate)
+	telemetry = recorder(capacity=2**14)
+	names = telemetry.monitorKnown(connect=source.PV)
+	for i in range(len(names),count):
+		name = 'SIM:MOTOR%02i'%i
+		telemetry.monitor(name+'.RBV',name=name,connect=source.PV)
+		names.append(name)
+
+	latest, windows = [], []
+	source.start()
+	start = time.perf_counter()
+	while time.perf_counter()-start < seconds:
+		t = time.perf_counter()
+		values = [telemetry.latest(name) for name in names]
+		latest.append((time.perf_counter()-t)/len(names))
+		t = time.perf_counter()
+		now = time.time()
+		samples = [telemetry.window(name,now-0.1,now) for name in names]
+		windows.append((time.perf_counter()-t)/len(names))
+		time.sleep(0.01)
+	elapsed = time.perf_counter()-start
+	source.stop()
+
+	recorded = sum(telemetry.buffers[name].count for name in names)
+	print('%i PVs (%i tables/slits): %.0f updates/s per PV, %i updates, %i recorded'%(len(names),
+		len([name for name in names if not name.startswith('SIM')]),source.updates/len(names)/elapsed,source.updates,recorded))
+	print('latest: %.1f us per PV, window of 100 ms: %.1f us per PV (median)'%(1e6*np.median(latest),1e6*np.median(windows)))
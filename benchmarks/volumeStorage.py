@@ -0,0 +1,45 @@
+import numpy as np
+import os
+import sys
+import tempfile
+import time
+from syncmrt.benchmarks.rotate import phantom
+from syncmrt.tools.cpu import cpuInterface
+from syncmrt.fileHandler.chunkedVolume import saveChunkedVolume, chunkedVolumeFile
+
+'''
+Benchmark disk footprint and load time of a rotated CT (air and rotation padding) saved with np.save against the
+chunked, compressed volume file.
+	python -m syncmrt.benchmarks.volumeStorage [slices, default 300]
+'''
+
+def timed(function,*args,**kwargs):
+	start = time.perf_counter()
+	result = function(*args,**kwargs)
+	return result, time.perf_counter()-start
+
+if __name__ == "__main__":
+	slices = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+	engine = cpuInterface()
+	engine.copyTexture(phantom((512,512,slices)))
+	volume, extent = engine.rotate(30,0,20,order='pat-gant-col',z1=10)
+	print('Rotated volume',volume.shape,'%.0f MB'%(volume.nbytes/2**20))
+
+	with tempfile.TemporaryDirectory() as path:
+		fn = os.path.join(path,'beam.npy')
+		result, write = timed(np.save,fn,volume)
+		result, read = timed(np.load,fn)
+		result, slab = timed(lambda: np.load(fn,mmap_mode='r')[:,:,100:110].copy())
+		print('np.save   %7.1f MB  write %.3f s  load %.3f s  slab %.3f s'%(os.path.getsize(fn)/2**20,write,read,slab))
+
+		for codec in ('zlib','lz4'):
+			fn = os.path.join(path,'beam_%s.vck'%codec)
+			try:
+				result, write = timed(saveChunkedVolume,fn,volume,codec=codec)
+			except ImportError:
+				print('%-9s not installed'%codec)
+				continue
+			result, read = timed(chunkedVolumeFile(fn).read)
+			assert np.array_equal(result,volume)
+			result, slab = timed(lambda: chunkedVolumeFile(fn)[:,:,100:110])
+			print('%-9s %7.1f MB  write %.3f s  load %.3f s  slab %.3f s'%(codec,os.path.getsize(fn)/2**20,write,read,slab))
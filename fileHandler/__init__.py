@@ -1,4 +1,8 @@
 from .dataStructures import *
 from .image import *
+from .volume import saveVolume, loadVolume
+from .chunkedVolume import saveChunkedVolume
+from .pyramid import volumePyramid, openPyramid
+from .plan import loadPlan
 
 from . import dicom
\ No newline at end of file
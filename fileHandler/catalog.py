@@ -0,0 +1,203 @@
+import os
+import sqlite3
+import threading
+from syncmrt.fileHandler import dicomSeries
+
+'''
+On-disk catalog of the files in a patient folder and the DICOM header fields we use. Files are keyed by path,
+modification time and size so a rescan only opens new or changed files.
+	openCatalog(path)			Catalog for a folder, stored in path/.syncmrt.sqlite (opened once per session, then rescanned).
+	findCatalog(fn)				The open catalog that covers a file, None if there isn't one.
+	dicomCatalog.rescan()		Walk the folder, read headers of new/changed files and forget deleted ones.
+	dicomCatalog.listFiles(ext)	Paths in the folder, optionally only those ending in ext (tuple of extensions).
+	dicomCatalog.records(ds)	Catalog record for each file in ds (dict), None if the file isn't DICOM.
+	dicomCatalog.series(ds)		As dicomSeries.groupSeries from the records: SeriesInstanceUID: list of (file, record)
+								ordered by slice position.
+'''
+
+# Header fields kept for every DICOM file (column: (tag keyword, index into multi-valued tags)).
+fields = {
+	'modality': ('Modality',None),
+	'seriesUID': ('SeriesInstanceUID',None),
+	'positionX': ('ImagePositionPatient',0),
+	'positionY': ('ImagePositionPatient',1),
+	'positionZ': ('ImagePositionPatient',2),
+	'pixelSpacingRow': ('PixelSpacing',0),
+	'pixelSpacingCol': ('PixelSpacing',1),
+	'sliceThickness': ('SliceThickness',None),
+	'spacingBetweenSlices': ('SpacingBetweenSlices',None),
+	'rescaleSlope': ('RescaleSlope',None),
+	'rescaleIntercept': ('RescaleIntercept',None),
+}
+columns = ['path','mtime','size','isDicom','slicePosition']+list(fields)
+
+# Version of the files table, kept in the database header.
+schemaVersion = 1
+
+# Catalogs open this session: folder: catalog.
+catalogs = {}
+
+def openCatalog(path,rescan=True):
+	path = os.path.abspath(path)
+	if path not in catalogs:
+		catalogs[path] = dicomCatalog(path)
+	elif rescan:
+		catalogs[path].rescan()
+	return catalogs[path]
+
+def findCatalog(fn):
+	# The deepest open folder that holds the file.
+	fn = os.path.abspath(fn)
+	roots = [root for root in catalogs if fn.startswith(root+os.sep)]
+	if len(roots) == 0:
+		return None
+	return catalogs[max(roots,key=len)]
+
+def writable(fn):
+	# sqlite also needs to make its journal next to the file.
+	folder = os.path.dirname(fn)
+	if os.path.exists(fn) and not os.access(fn,os.W_OK):
+		return False
+	return os.access(folder,os.W_OK)
+
+def record(fn,mtime,size,header):
+	'''Row for the catalog from a DICOM header (header is None for files that aren't DICOM).'''
+	row = {'path':fn, 'mtime':mtime, 'size':size, 'isDicom':int(header is not None), 'slicePosition':None}
+	for column in fields:
+		row[column] = None
+	if header is None:
+		return row
+
+	for column, (keyword, index) in fields.items():
+		value = getattr(header,keyword,None)
+		try:
+			if index is not None:
+				value = value[index]
+			row[column] = float(value) if column not in ('modality','seriesUID') else str(value)
+		except (TypeError,ValueError,IndexError):
+			row[column] = None
+	try:
+		row['slicePosition'] = dicomSeries.slicePosition(header)
+	except (AttributeError,TypeError,ValueError):
+		pass
+	return row
+
+class dicomCatalog:
+	def __init__(self,path,fn='.syncmrt.sqlite'):
+		self.path = os.path.abspath(path)
+		self.fn = os.path.join(self.path,fn)
+		self.lock = threading.Lock()
+		# sqlite opens a file it can't write without complaint and only fails at the first write, so check first.
+		self.db = None
+		if writable(self.fn):
+			try:
+				self.db = self.connect(self.fn)
+			except sqlite3.Error:
+				pass
+		if self.db is None:
+			# Read only folder, keep the catalog for this session only.
+			self.db = self.connect(':memory:')
+		self.rescan()
+
+	def connect(self,fn):
+		'''Database with the files table. Setting the schema version is a write, so a database that can't be written
+		fails here rather than part way through a scan.'''
+		db = sqlite3.connect(fn,check_same_thread=False)
+		db.row_factory = sqlite3.Row
+		definition = ', '.join(['path TEXT PRIMARY KEY','mtime REAL','size INTEGER','isDicom INTEGER','slicePosition REAL']+
+			['%s %s'%(column,'TEXT' if column in ('modality','seriesUID') else 'REAL') for column in fields])
+		try:
+			with db:
+				db.execute('CREATE TABLE IF NOT EXISTS files (%s)'%definition)
+				db.execute('CREATE INDEX IF NOT EXISTS files_modality ON files (modality, seriesUID)')
+				db.execute('PRAGMA user_version = %i'%schemaVersion)
+		except sqlite3.Error:
+			db.close()
+			raise
+		return db
+
+	def walk(self):
+		# Every file under the folder with its modification time and size (the catalog itself is skipped).
+		found = {}
+		for root, subdir, fp in os.walk(self.path):
+			for fn in fp:
+				fn = os.path.join(root,fn)
+				if fn.startswith(self.fn):
+					continue
+				try:
+					info = os.stat(fn)
+				except OSError:
+					continue
+				found[fn] = (info.st_mtime,info.st_size)
+		return found
+
+	def rescan(self):
+		found = self.walk()
+		with self.lock:
+			known = {row['path']:(row['mtime'],row['size']) for row in self.db.execute('SELECT path, mtime, size FROM files')}
+
+		# Only open the files that are new or have changed.
+		changed = [fn for fn in found if known.get(fn) != found[fn]]
+		removed = [fn for fn in known if fn not in found]
+		self.update(changed,found)
+
+		with self.lock, self.db:
+			self.db.executemany('DELETE FROM files WHERE path=?',[(fn,) for fn in removed])
+		return len(changed), len(removed)
+
+	def update(self,ds,stats):
+		headers = dicomSeries.scanHeaders(ds)
+		rows = [record(fn,stats[fn][0],stats[fn][1],header) for fn,header in zip(ds,headers)]
+		with self.lock, self.db:
+			self.db.executemany('INSERT OR REPLACE INTO files (%s) VALUES (%s)'%(', '.join(columns),', '.join('?'*len(columns))),
+				[[row[column] for column in columns] for row in rows])
+
+	def listFiles(self,ext=None):
+		with self.lock:
+			paths = [row['path'] for row in self.db.execute('SELECT path FROM files')]
+		if ext is not None:
+			paths = [fn for fn in paths if fn.endswith(tuple(ext))]
+		return paths
+
+	def select(self,ds):
+		rows = {}
+		with self.lock:
+			for start in range(0,len(ds),500):
+				chunk = ds[start:start+500]
+				query = 'SELECT * FROM files WHERE path IN (%s)'%', '.join('?'*len(chunk))
+				rows.update({row['path']:dict(row) for row in self.db.execute(query,chunk)})
+		return rows
+
+	def records(self,ds):
+		ds = [os.path.abspath(fn) for fn in ds]
+		rows = self.select(ds)
+
+		# Files the catalog hasn't seen (or that changed since) are read now.
+		stats = {}
+		for fn in ds:
+			try:
+				info = os.stat(fn)
+			except OSError:
+				continue
+			if (fn not in rows) or ((rows[fn]['mtime'],rows[fn]['size']) != (info.st_mtime,info.st_size)):
+				stats[fn] = (info.st_mtime,info.st_size)
+		if len(stats) > 0:
+			self.update(list(stats),stats)
+			rows.update(self.select(list(stats)))
+
+		return [rows[fn] if (fn in rows) and rows[fn]['isDicom'] else None for fn in ds]
+
+	def series(self,ds,modality=None):
+		series = {}
+		for fn, row in zip(ds,self.records(ds)):
+			if row is None:
+				continue
+			if (modality is not None) and (row['modality'] != modality):
+				continue
+			series.setdefault(row['seriesUID'] or '',[]).append((fn,row))
+
+		# Order each series by slice position (only if every slice has one).
+		for uid in series:
+			if all(row['slicePosition'] is not None for fn,row in series[uid]):
+				series[uid].sort(key=lambda item: item[1]['slicePosition'])
+		return series
@@ -0,0 +1,208 @@
+import json
+import numpy as np
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+'''
+Chunked, compressed volume file. The array is cut into chunks that are byte-shuffled and compressed on their own (in
+parallel), with an index of where each chunk is. Any axis-aligned slab can be read by only decompressing the chunks it
+touches.
+	saveChunkedVolume(fn,array,chunks,codec,level,extent,pixelSize,isocenter,**metadata)	Write a volume (*.vck).
+	chunkedVolumeFile(fn)				Open a volume, it acts like a read-only array: shape, dtype, volume[a:b,:,c].
+	chunkedVolumeFile.read()			The whole array (chunks decompressed in parallel).
+
+Codecs are 'zlib' (always available) and 'lz4' (if the lz4 package is installed, faster but larger).
+File layout: 8 byte magic, 8 byte index offset, 4 byte header length, JSON header, chunks, index (offset and length of
+every chunk in C order, uint64). Each chunk starts with a byte saying if it is compressed or a single repeated value.
+'''
+
+magic = b'SYNCCHK1'
+# First byte of every chunk: the values are compressed, or the chunk is one repeated value.
+compressed = b'Z'
+constant = b'C'
+
+def threads(workers=None):
+	if workers is None:
+		workers = os.cpu_count() or 1
+	return workers
+
+def codecFunctions(codec,level=1):
+	if codec == 'zlib':
+		return (lambda data: zlib.compress(data,level)), zlib.decompress
+	elif codec == 'lz4':
+		import lz4.frame
+		return (lambda data: lz4.frame.compress(data)), lz4.frame.decompress
+	raise ValueError('Unknown codec %s.'%codec)
+
+def shuffle(chunk):
+	# Group the n-th byte of every value together, this compresses floats far better.
+	data = np.ascontiguousarray(chunk)
+	return np.ascontiguousarray(data.reshape(-1).view(np.uint8).reshape(-1,data.dtype.itemsize).T).tobytes()
+
+def unshuffle(data,dtype,shape):
+	dtype = np.dtype(dtype)
+	values = np.frombuffer(data,dtype=np.uint8).reshape(dtype.itemsize,-1).T
+	return np.ascontiguousarray(values).view(dtype).reshape(shape)
+
+def chunkGrid(shape,chunks):
+	# Number of chunks along each axis.
+	return tuple(-(-int(s)//int(c)) for s,c in zip(shape,chunks))
+
+def chunkSlices(position,shape,chunks):
+	return tuple(slice(p*c,min((p+1)*c,s)) for p,s,c in zip(position,shape,chunks))
+
+def saveChunkedVolume(fn,array,chunks=(64,64,64),codec='zlib',level=1,extent=None,pixelSize=None,isocenter=None,workers=None,**metadata):
+	array = np.asanyarray(array)
+	chunks = tuple(int(min(c,max(1,s))) for c,s in zip(chunks,array.shape))
+	compress, decompress = codecFunctions(codec,level)
+	header = {
+		'shape': list(array.shape),
+		'dtype': np.lib.format.dtype_to_descr(array.dtype),
+		'chunks': list(chunks),
+		'codec': codec,
+		'metadata': metadata,
+	}
+	for key, value in {'extent':extent, 'pixelSize':pixelSize, 'isocenter':isocenter}.items():
+		header[key] = None if value is None else np.asarray(value,dtype=float).tolist()
+	header = json.dumps(header).encode('utf-8')
+
+	positions = list(np.ndindex(*chunkGrid(array.shape,chunks)))
+	index = np.zeros((len(positions),2),dtype=np.uint64)
+
+	def encode(position):
+		# Chunks of a single value (air, rotation padding) only store the value.
+		chunk = np.ascontiguousarray(array[chunkSlices(position,array.shape,chunks)])
+		flat = chunk.reshape(-1)
+		if (flat.size > 0) and np.all(flat == flat[0]):
+			return constant+flat[:1].tobytes()
+		return compressed+compress(shuffle(chunk))
+
+	with open(fn,'wb') as f:
+		f.write(magic)
+		f.write(np.uint64(0).tobytes())
+		f.write(np.uint32(len(header)).tobytes())
+		f.write(header)
+		# Compress a batch of chunks at a time in parallel, writing them out in order so memory stays bounded.
+		batch = 4*threads(workers)
+		with ThreadPoolExecutor(max_workers=threads(workers)) as pool:
+			for start in range(0,len(positions),batch):
+				for i, data in enumerate(pool.map(encode,positions[start:start+batch])):
+					index[start+i] = (f.tell(),len(data))
+					f.write(data)
+		# Write the index and point to it from the top of the file.
+		indexOffset = f.tell()
+		f.write(index.tobytes())
+		f.seek(len(magic))
+		f.write(np.uint64(indexOffset).tobytes())
+	return fn
+
+def isChunkedVolume(fn):
+	with open(fn,'rb') as f:
+		return f.read(len(magic)) == magic
+
+class chunkedVolumeFile:
+	def __init__(self,fn,workers=None):
+		self.fn = fn
+		self.workers = threads(workers)
+		with open(fn,'rb') as f:
+			if f.read(len(magic)) != magic:
+				raise ValueError('%s is not a chunked volume file.'%fn)
+			indexOffset = int(np.frombuffer(f.read(8),dtype=np.uint64)[0])
+			length = int(np.frombuffer(f.read(4),dtype=np.uint32)[0])
+			header = json.loads(f.read(length).decode('utf-8'))
+			f.seek(indexOffset)
+			self.shape = tuple(header['shape'])
+			self.chunks = tuple(header['chunks'])
+			self.grid = chunkGrid(self.shape,self.chunks)
+			self.index = np.frombuffer(f.read(),dtype=np.uint64).reshape(self.grid+(2,))
+
+		self.dtype = np.dtype(np.lib.format.descr_to_dtype(header['dtype']))
+		self.ndim = len(self.shape)
+		self.size = int(np.prod(self.shape))
+		self.codec = header['codec']
+		self.compress, self.decompress = codecFunctions(self.codec)
+		for key in ('extent','pixelSize','isocenter'):
+			setattr(self,key,None if header.get(key) is None else np.array(header[key]))
+		self.metadata = header.get('metadata',{})
+
+	@property
+	def array(self):
+		# Same access as volumeFile.array, the chunks are only read when sliced.
+		return self
+
+	def __len__(self):
+		return self.shape[0]
+
+	def __array__(self,dtype=None,copy=None):
+		array = self.read()
+		return array if dtype is None else array.astype(dtype)
+
+	def chunk(self,position):
+		'''Decompress the chunk at a position in the chunk grid.'''
+		offset, length = self.index[position]
+		with open(self.fn,'rb') as f:
+			f.seek(int(offset))
+			data = f.read(int(length))
+		shape = tuple(s.stop-s.start for s in chunkSlices(position,self.shape,self.chunks))
+		if data[:1] == constant:
+			return np.full(shape,np.frombuffer(data[1:],dtype=self.dtype)[0],dtype=self.dtype)
+		return unshuffle(self.decompress(memoryview(data)[1:]),self.dtype,shape)
+
+	def read(self):
+		return self[...]
+
+	def __getitem__(self,key):
+		# Turn the key into a start/stop per axis, remembering integer axes (dropped) and steps (applied after).
+		if not isinstance(key,tuple):
+			key = (key,)
+		if Ellipsis in key:
+			i = key.index(Ellipsis)
+			key = key[:i]+(slice(None),)*(self.ndim-len(key)+1)+key[i+1:]
+		key = key+(slice(None),)*(self.ndim-len(key))
+
+		bounds, after = [], []
+		for axis, k in enumerate(key):
+			if isinstance(k,slice):
+				start, stop, step = k.indices(self.shape[axis])
+				if step == 1:
+					bounds.append((start,max(start,stop)))
+					after.append(slice(None))
+				else:
+					# Read the bounding slab, then step through it.
+					lo, hi = (start,stop) if step > 0 else (stop+1,start+1)
+					lo, hi = max(lo,0), max(max(lo,0),hi)
+					bounds.append((lo,hi))
+					after.append(slice(start-lo,None if stop-lo < 0 else stop-lo,step))
+			else:
+				k = int(k)
+				if k < 0:
+					k += self.shape[axis]
+				if not (0 <= k < self.shape[axis]):
+					raise IndexError('Index %i is out of bounds for axis %i with size %i.'%(k,axis,self.shape[axis]))
+				bounds.append((k,k+1))
+				after.append(0)
+
+		out = np.empty(tuple(hi-lo for lo,hi in bounds),dtype=self.dtype)
+		ranges = [range(lo//c,-(-hi//c)) for (lo,hi),c in zip(bounds,self.chunks)]
+		positions = list(np.ndindex(*[len(r) for r in ranges]))
+		positions = [tuple(r[p] for r,p in zip(ranges,position)) for position in positions]
+
+		def fill(position):
+			# Copy the part of the chunk that falls inside the slab.
+			data = self.chunk(position)
+			source, target = [], []
+			for (lo,hi), p, c in zip(bounds,position,self.chunks):
+				a, b = max(lo,p*c), min(hi,(p+1)*c)
+				source.append(slice(a-p*c,b-p*c))
+				target.append(slice(a-lo,b-lo))
+			out[tuple(target)] = data[tuple(source)]
+
+		if (self.workers > 1) & (len(positions) > 1):
+			with ThreadPoolExecutor(max_workers=self.workers) as pool:
+				list(pool.map(fill,positions))
+		else:
+			for position in positions:
+				fill(position)
+
+		return out[tuple(after)]
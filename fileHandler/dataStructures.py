@@ -59,7 +59,12 @@ class dataRtp:
 		self.tableModel = None
 
 class dataBeam:
-	'''Treatment plan beam data (inside beam sequence)'''
+	'''Treatment plan beam data (inside beam sequence), see fileHandler.plan for the beam as it is in the plan.'''
+	__slots__ = ('numberOfBlocks','blockData','blockThickness','gantryAngle','pitchAngle','rollAngle','collimatorAngle',
+		'patientSupportAngle','isocenter','array','arrayExtent','arrayNormal','arrayNormalAxes','arrayNormalPosition',
+		'arrayOrthogonal','arrayOrthogonalAxes','arrayOrthogonalPosition','drr','drrExtent','views','viewIsocenters',
+		'viewDrr','viewDrrExtent')
+
 	def __init__(self):
 		self.numberOfBlocks = None
 		self.blockData = None
@@ -68,6 +73,11 @@ class dataBeam:
 		self.pitchAngle = None
 		self.rollAngle = None
 		self.collimatorAngle = None
+		self.patientSupportAngle = None
+		self.isocenter = None
+		# Beam's eye view volume (file) and its extent.
+		self.array = None
+		self.arrayExtent = None
 		self.arrayNormal = None
 		self.arrayNormalAxes = None
 		self.arrayNormalPosition = None
@@ -76,6 +86,15 @@ class dataBeam:
 		self.arrayOrthogonalAxes = None
 		self.arrayOrthogonalPosition = None
 		# self.arrayOrthogonalPixelSize = None
+		# Ray cast DRR of the beam and its extent in the BEV (mm from the isocenter).
+		self.drr = None
+		self.drrExtent = None
+		# Every control point interpolated to views (gantry, patient support, collimator angles and isocenters), one
+		# view for a static beam. DRRs of the views of an arc (views,u,v) and their extent.
+		self.views = None
+		self.viewIsocenters = None
+		self.viewDrr = None
+		self.viewDrrExtent = None
 
 # class dataXR:
 # 	def __init__(self):
@@ -1,45 +1,47 @@
 import dicom
+import multiprocessing
 import numpy as np
 import os
-from scipy import ndimage
-from skimage.external import tifffile as tiff
-from scipy.interpolate import interp1d
-from syncmrt.tools.cuda import gpuInterface
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from syncmrt.tools import backends, drr
+from syncmrt.fileHandler import dicomSeries, catalog, plan
 from syncmrt import fileHandler
 from natsort import natsorted
 
 def importDicom(ds,modality):
-	files = []
-	for i in range(len(ds)):
-		testFile = dicom.read_file(ds[i])
-		if testFile.Modality == modality:
-			files.append(ds[i])
-		else:
-			pass
+	# The modality comes from the folder's catalog, headers are only read for files it hasn't seen (or that changed).
+	if len(ds) == 0:
+		return []
+	records = catalog.openCatalog(os.path.dirname(ds[0]),rescan=False).records(ds)
+	files = [fn for fn,record in zip(ds,records) if (record is not None) and (record['modality'] == modality)]
 
 	return natsorted(files)
 
 class importCT:
-	def __init__(self,ds,arrayFormat='npy'):
+	def __init__(self,ds,arrayFormat='vol'):
 		'''importCT: Import the CT dataset and all it's relevant DICOM tags.'''
 		# Set list of filenames for dataset, reference file (first file in stack) and the filepath to the folder containing the dataset.
-		self.ds = ds
 		self.path = os.path.dirname(ds[0])
-		self.ref = dicom.read_file(self.ds[0])
-
-		# Specify the array format to save in. Typically this is a numpy array, tif's or jpg's are possible but not built in.
+		# Order the slices by position from the folder's catalog, the top slice goes first (the largest series is used).
+		# Only the reference file's header is read.
+		series = catalog.openCatalog(self.path,rescan=False).series(ds)
+		slices = max(series.values(),key=len)[::-1]
+		self.ds = [fn for fn,record in slices]
+		self.ref = dicomSeries.readHeader(self.ds[0])
+
+		# Specify the array format to save in. Typically this is a volume file (or a numpy array), tif's or jpg's are possible but not built in.
 		self.format = arrayFormat
 
 		# Dimensions are based on rows and cols in reference file, and the number of files in the dataset.
 		ctArrayDimensions = np.array([int(self.ref.Rows), int(self.ref.Columns), len(self.ds)])
 
 		# Make numpy array of -1000 HU (air), this should be the size of the 3d volume.
-		self.ctArray = np.zeros(ctArrayDimensions, dtype=np.result_type(self.ref.pixel_array))-1000
+		self.ctArray = np.zeros(ctArrayDimensions, dtype=dicomSeries.pixelType(self.ref))-1000
 
-		# For each slice extract the pixel data and put in respective z slice in array. 
-		for fn in self.ds:
-			data = dicom.read_file(fn)
-			self.ctArray[:,:,ctArrayDimensions[2]-self.ds.index(fn)-1] = data.pixel_array
+		# Decode each slice straight into its respective z slice in the array. The slices of a series share the reference's
+		# pixel format (readPixels checks each file and decodes it in full if it doesn't match).
+		dicomSeries.loadSlices(self.ds,self.ctArray,ctArrayDimensions[2]-np.arange(len(self.ds))-1,headers=[self.ref]*len(self.ds))
 
 		# Get the patient orientation.
 		self.patientPosition = self.ref.PatientPosition
@@ -59,26 +61,26 @@ class importCT:
 			self.spacingBetweenSlices = self.ref.SpacingBetweenSlices
 		except:
 			start = self.ref.ImagePositionPatient[2]
-			file = dicom.read_file(self.ds[-1])
-			end = file.ImagePositionPatient[2]
+			end = slices[-1][1]['positionZ']
 
 			self.spacingBetweenSlices = abs(end-start)/(len(self.ds)-1)
 
 		# Voxel shape determined by detector element sizes and CT slice thickness.
 		self.pixelSize = np.array([self.ref.PixelSpacing[0], self.ref.PixelSpacing[1], self.spacingBetweenSlices])
 
-		# CT array extent (from bottom left corner of array); x->Cols, y->Rows z->Depth. (yyxxzz).
-		y1 = self.imagePositionPatient[1]-0.5*self.pixelSize[1] 
-		y2 = self.imagePositionPatient[1]-0.5*self.pixelSize[1] + self.ctArray.shape[0]*self.pixelSize[1]
-		x1 = self.imagePositionPatient[0]-0.5*self.pixelSize[0] 
-		x2 = self.imagePositionPatient[0]-0.5*self.pixelSize[0] + self.ctArray.shape[1]*self.pixelSize[0]
+		# CT array extent (from bottom left corner of array); x->Cols, y->Rows z->Depth. Kept as (l,r,b,t,f,b), i.e. (xxyyzz),
+		# see tools.geometry.axisExtent. Pixel spacing is (between rows, between columns).
+		y1 = self.imagePositionPatient[1]-0.5*self.pixelSize[0]
+		y2 = self.imagePositionPatient[1]-0.5*self.pixelSize[0] + self.ctArray.shape[0]*self.pixelSize[0]
+		x1 = self.imagePositionPatient[0]-0.5*self.pixelSize[1]
+		x2 = self.imagePositionPatient[0]-0.5*self.pixelSize[1] + self.ctArray.shape[1]*self.pixelSize[1]
 		z1 = self.imagePositionPatient[2]+0.5*self.pixelSize[2] - self.ctArray.shape[2]*self.pixelSize[2]
 		z2 = self.imagePositionPatient[2]+0.5*self.pixelSize[2] 
 		
-		self.ctExtent = np.array([y1,y2,x1,x2,z1,z2])
+		self.ctExtent = np.array([x1,x2,y1,y2,z1,z2])
 
-		# GPU drivers.
-		gpu = gpuInterface()
+		# Rotation engine (GPU if there is one, otherwise CPU).
+		gpu = backends.getEngine()
 		gpu.copyTexture(self.ctArray,pixelSize=self.pixelSize,extent=self.ctExtent)
 
 		# Patient imaging orientation. (Rotation happens in [row,col,depth]).
@@ -102,6 +104,9 @@ class importCT:
 		# Save
 		self.save3D(['ct0_dicom','ct1_correctlyOrientated'])
 
+		# Coarser copies of the volume for display and projection (made when first used, cached next to the file).
+		self.pyramid = fileHandler.volumePyramid(self.array,self.arrayExtent,fn=getattr(self,'arrayFile',None))
+
 	def rescaleHU(self):
 		# Rescale the Hounsfield Units.
 		# self.ctArray = self.ctArray*self.rescaleSlope + self.rescaleIntercept
@@ -126,74 +131,119 @@ class importCT:
 
 	def save3D(self,fn):
 		# Save as file.
-		if self.format == 'npy':
+		if self.format == 'vol':
+			# Volume files keep the geometry with the array and open memory-mapped.
+			self.ctArrayFile = fileHandler.saveVolume(self.path+'/'+fn[0]+'.'+self.format, self.ctArray,
+				extent=self.ctExtent, pixelSize=self.pixelSize)
+			self.arrayFile = fileHandler.saveVolume(self.path+'/'+fn[1]+'.'+self.format, self.array,
+				extent=self.arrayExtent, pixelSize=self.pixelSize)
+		elif self.format == 'npy':
 			np.save(self.path+'/'+fn[0]+'.'+self.format, self.ctArray)
 			np.save(self.path+'/'+fn[1]+'.'+self.format, self.array)
 		else:
-			print('Cannot save 3D images, must be numpy filetype.')
+			print('Cannot save 3D images, must be vol or numpy filetype.')
 
 class importRTP:
 	def __init__(self,ds):
 		'''Only accepts dicom files.'''
 		self.rtp = None
-		dicomData = dicom.read_file(ds[0])
+		# Largest angle (deg) between the views of an arc.
+		self.arcStep = 1.0
+		self.plan = plan.loadPlan(ds[0])
 
-		if dicomData.Modality == 'RTPLAN':
-			self.rtp = dicomData
+		if self.plan.modality == 'RTPLAN':
+			self.rtp = self.plan.dataset
 			self.path = os.path.dirname(ds[0])
 		else:
 			print("Error reading Treatment Plan file.")
 
 		# Check for an accompanying RS file?
 
-	def extractTreatmentBeams(self,ctData):
-		'''Iterate through number of beams and rotate ct data to match beam view.'''
-		self.beam = np.empty(self.rtp.FractionGroupSequence[0].NumberOfBeams,dtype=object)
-
-		ctArray = np.load(ctData.array)
-		gpu = gpuInterface()
+	def readBeam(self,i):
+		'''Beam i of the plan: block, angles and isocenter (first control point) and the views along all control points.'''
+		record = self.plan.beams[i]
+		controlPoint = record.controlPoints[0]
+		beam = fileHandler.dataBeam()
+		beam.numberOfBlocks = np.empty(len(record.blocks),dtype=object)
+		beam.blockData = record.blocks[0].points.flatten()
+		beam.blockThickness = record.blocks[0].thickness
+
+		# Beam limiting device angle (collimator rotation angle) of Clinical LINAC. Rotation about BEV.
+		# Gantry Angle of Clinical LINAC. Rotation about DICOM Z-axis.
+		# Patient support angle (table rotation angle) of Clinical LINAC. Rotation about DICOM Y-axis.
+		# Angles within 181-359 deg are turned into negative angles > -180, the rest remain positive.
+		beam.collimatorAngle = plan.signedAngle(controlPoint.collimatorAngle)
+		beam.gantryAngle = plan.signedAngle(controlPoint.gantryAngle)
+		beam.patientSupportAngle = plan.signedAngle(controlPoint.patientSupportAngle)
+
+		# beam.pitchAngle = float(self.rtp.BeamSequence[i].ControlPointSequence[0].TableTopPitchAngle)
+		# beam.rollAngle = float(self.rtp.BeamSequence[i].ControlPointSequence[0].TableTopRollAngle)
+
+		beam.isocenter = np.array(controlPoint.isocenter)
+		# Rearrange xyz to match imported CT.
+		beam.isocenter[0],beam.isocenter[1],beam.isocenter[2] = beam.isocenter[2],beam.isocenter[0],beam.isocenter[1]
+
+		beam.views, isocenters = plan.interpolate(record.controlPoints,self.arcStep)
+		beam.viewIsocenters = isocenters[:,[2,0,1]]
+		return beam
+
+	def sweepArcs(self,engine,mode='parallel',sad=None,sid=None):
+		'''DRRs of every view of the beams with more than one (arcs), an arc at a time on one detector.'''
+		for beam in self.beam:
+			if len(beam.views) > 1:
+				views = drr.beamGeometry.fromViews(beam.views,beam.viewIsocenters,mode=mode,sad=sad,sid=sid)
+				beam.viewDrr, beam.viewDrrExtent = engine.sweep(views)
+
+	def computeBeamDRRs(self,ctData,mode='parallel',sad=None,sid=None,workers=None,resolution=None):
+		'''Ray cast a DRR for every beam straight through the CT (no rotated volumes are made or saved).
+		resolution (mm) casts through the coarsest level of the CT's pyramid that is at least that fine.'''
+		self.beam = np.empty(self.plan.numberOfBeams,dtype=object)
+		ctArray = ctData.array
+		if isinstance(ctArray,str):
+			ctArray = fileHandler.loadVolume(ctArray).array
+		extent = ctData.arrayExtent
+		if resolution is not None:
+			ctArray, extent, pixelSize = ctData.pyramid.at(resolution)
+		engine = drr.drrEngine(ctArray,extent,workers=workers)
+
+		beams = []
+		for i in range(len(self.beam)):
+			self.beam[i] = self.readBeam(i)
+			beams.append(drr.beamGeometry.fromAngles(self.beam[i].gantryAngle,self.beam[i].patientSupportAngle,self.beam[i].collimatorAngle,
+				isocenter=self.beam[i].isocenter,mode=mode,sad=sad,sid=sid))
+
+		# All beams in one batch.
+		for beam, (image, extent) in zip(self.beam,engine.project(beams)):
+			beam.drr = image
+			beam.drrExtent = extent
+		self.sweepArcs(engine,mode=mode,sad=sad,sid=sid)
+
+	def extractTreatmentBeams(self,ctData,parallel=False,maxWorkers=None,progress=None):
+		'''Iterate through number of beams and rotate ct data to match beam view.
+		parallel rotates the beams on a process pool (at most maxWorkers processes) with the CT in shared memory.
+		progress(done,total) is called as each beam is saved.
+		The volume is rotated to the first control point of a beam, the views along an arc are ray cast (see sweepArcs).'''
+		self.beam = np.empty(self.plan.numberOfBeams,dtype=object)
+
+		# The CT can be held in memory or saved as a volume/numpy file.
+		ctArray = ctData.array
+		if isinstance(ctArray,str):
+			ctArray = fileHandler.loadVolume(ctArray).array
+		if parallel:
+			self.extractTreatmentBeamsParallel(ctData,ctArray,maxWorkers,progress)
+		else:
+			self.extractTreatmentBeamsSerial(ctData,ctArray,progress)
+		# The engine holds its own float32 copy of the CT, only make it for arcs.
+		if any(len(beam.views) > 1 for beam in self.beam):
+			self.sweepArcs(drr.drrEngine(ctArray,ctData.arrayExtent))
+
+	def extractTreatmentBeamsSerial(self,ctData,ctArray,progress=None):
+		'''extractTreatmentBeams one beam at a time on the rotation engine.'''
+		gpu = backends.getEngine()
 		gpu.copyTexture(ctArray,extent=ctData.arrayExtent,pixelSize=ctData.pixelSize)
 
-		# Assume single control point sequence...
 		for i in range(len(self.beam)):
-			self.beam[i] = fileHandler.dataBeam()
-			self.beam[i].numberOfBlocks = np.empty(self.rtp.BeamSequence[i].NumberOfBlocks,dtype=object)
-			self.beam[i].blockData = self.rtp.BeamSequence[i].BlockSequence[0].BlockData
-			self.beam[i].blockThickness = self.rtp.BeamSequence[i].BlockSequence[0].BlockThickness
-
-			# Beam limiting device angle (collimator rotation angle) of Clinical LINAC. Rotation about BEV.
-			test = float(self.rtp.BeamSequence[i].ControlPointSequence[0].BeamLimitingDeviceAngle)
-			if 181 < test < 359:
-				# Turn into a negative angle > -180.
-				self.beam[i].collimatorAngle = -360+test
-			else:
-				# It is within 0-180 deg and can remain a positive value. 
-				self.beam[i].collimatorAngle = test	
-
-			# Gantry Angle of Clinical LINAC. Rotation about DICOM Z-axis.
-			test = float(self.rtp.BeamSequence[i].ControlPointSequence[0].GantryAngle)
-			if 181 < test < 359:
-				# Turn into a negative angle > -180.
-				self.beam[i].gantryAngle = -360+test
-			else:
-				# It is within 0-180 deg and can remain a positive value. 
-				self.beam[i].gantryAngle = test
-
-			# Patient support angle (table rotation angle) of Clinical LINAC. Rotation about DICOM Y-axis.
-			test = float(self.rtp.BeamSequence[i].ControlPointSequence[0].PatientSupportAngle)
-			if 181 < test < 359:
-				# Turn into a negative angle > -180.
-				self.beam[i].patientSupportAngle = -360+test
-			else:
-				# It is within 0-180 deg and can remain a positive value. 
-				self.beam[i].patientSupportAngle = test	
-
-			# self.beam[i].pitchAngle = float(self.rtp.BeamSequence[i].ControlPointSequence[0].TableTopPitchAngle)
-			# self.beam[i].rollAngle = float(self.rtp.BeamSequence[i].ControlPointSequence[0].TableTopRollAngle)
-
-			self.beam[i].isocenter = np.array(self.rtp.BeamSequence[i].ControlPointSequence[0].IsocenterPosition)
-			# Rearrange xyz to match imported CT.
-			self.beam[i].isocenter[0],self.beam[i].isocenter[1],self.beam[i].isocenter[2] = self.beam[i].isocenter[2],self.beam[i].isocenter[0],self.beam[i].isocenter[1]
+			self.beam[i] = self.readBeam(i)
 			# Consider updating isocenter parameter before each rotation:
 			gpu.isocenter = np.array(self.beam[i].isocenter)
 
@@ -205,5 +255,64 @@ class importRTP:
 			self.beam[i].isocenter = gpu.isocenter
 
 			# Hold file path to each plot and save.
-			self.beam[i].array = self.path+'/beam%i'%(i+1)+'_array.npy'
-			np.save(self.beam[i].array, array)
\ No newline at end of file
+			self.beam[i].array = fileHandler.saveVolume(self.path+'/beam%i'%(i+1)+'_array.vol', array,
+				extent=self.beam[i].arrayExtent, pixelSize=ctData.pixelSize, isocenter=self.beam[i].isocenter)
+
+			if progress is not None:
+				progress(i+1,len(self.beam))
+
+	def extractTreatmentBeamsParallel(self,ctData,ctArray,maxWorkers=None,progress=None):
+		'''extractTreatmentBeams with one process per beam (see rotateBeam).'''
+		for i in range(len(self.beam)):
+			self.beam[i] = self.readBeam(i)
+		if maxWorkers is None:
+			maxWorkers = os.cpu_count() or 1
+		maxWorkers = max(1,min(maxWorkers,len(self.beam)))
+		# Share the cores out between the processes.
+		threads = max(1,(os.cpu_count() or 1)//maxWorkers)
+
+		# Put the CT in shared memory once (a slab at a time, it may be memory-mapped), every process maps it.
+		block = shared_memory.SharedMemory(create=True,size=max(1,int(np.prod(ctArray.shape))*4))
+		try:
+			shared = np.ndarray(ctArray.shape,dtype=np.float32,buffer=block.buf)
+			for start in range(0,ctArray.shape[0],16):
+				shared[start:start+16] = ctArray[start:start+16]
+			del shared
+
+			jobs = [(block.name,ctArray.shape,ctData.arrayExtent,ctData.pixelSize,threads,i,
+				(beam.gantryAngle,beam.patientSupportAngle,beam.collimatorAngle),beam.isocenter,
+				self.path+'/beam%i'%(i+1)+'_array.vol') for i,beam in enumerate(self.beam)]
+			# Compile the kernel the workers use once, here, they load it from numba's file cache.
+			from syncmrt.tools.cpu import warmKernel
+			warmKernel(threads)
+			# Fresh processes: forking once numba's (or any) threads are running can leave this process hanging at exit.
+			with ProcessPoolExecutor(max_workers=maxWorkers,mp_context=multiprocessing.get_context('spawn')) as pool:
+				futures = [pool.submit(rotateBeam,job) for job in jobs]
+				# Collect the beams as they finish.
+				for done, future in enumerate(as_completed(futures)):
+					i, fn, arrayExtent, isocenter = future.result()
+					self.beam[i].array = fn
+					self.beam[i].arrayExtent = arrayExtent
+					self.beam[i].isocenter = isocenter
+					if progress is not None:
+						progress(done+1,len(self.beam))
+		finally:
+			block.close()
+			block.unlink()
+
+def rotateBeam(job):
+	'''Process pool worker: rotate the CT (in shared memory) to one beam's view and save it.'''
+	name, shape, extent, pixelSize, threads, i, angles, isocenter, fn = job
+	block = shared_memory.SharedMemory(name=name)
+	try:
+		engine = backends.getEngine('cpu',workers=threads)
+		engine.copyTexture(np.ndarray(shape,dtype=np.float32,buffer=block.buf),extent=extent,pixelSize=pixelSize)
+		engine.isocenter = np.array(isocenter)
+		gantry, patientSupport, collimator = angles
+		array, arrayExtent = engine.rotate(gantry,0,patientSupport,order='pat-gant-col',z1=collimator)
+		# Let go of the shared array before the block is closed.
+		engine.arrIn = None
+		fn = fileHandler.saveVolume(fn,array,extent=arrayExtent,pixelSize=pixelSize,isocenter=engine.isocenter)
+		return i, fn, arrayExtent, engine.isocenter
+	finally:
+		block.close()
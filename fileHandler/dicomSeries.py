@@ -0,0 +1,128 @@
+import dicom
+import numpy as np
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+'''
+Fast DICOM series handling. Headers are read without the pixel data, files are grouped into series and ordered by
+their position, then pixels are decoded in parallel straight into one preallocated volume.
+	readHeader(fn)							Header of a DICOM file (stops before the pixel data), None if it isn't DICOM.
+											Headers are kept for the session, keyed by path, modification time and size.
+	scanHeaders(ds,workers)					Headers for a list of files, read on a thread pool.
+	groupSeries(ds,headers,modality)		Dictionary of SeriesInstanceUID: list of files ordered by slice position.
+	slicePosition(header)					Position of a slice along its normal (mm).
+	pixelType(header)						Numpy dtype of the stored pixel data.
+	readPixels(fn,header)					Pixel data of a slice. Uncompressed data is read straight from the end of the file.
+	loadSlices(ds,volume,index,headers)		Decode ds[i] into volume[:,:,index[i]] on a thread pool, a block of slices at a time.
+'''
+
+# Headers read this session: (path, mtime, size): header.
+headerCache = {}
+# Transfer syntaxes whose pixel data can be read as raw little endian values.
+uncompressed = ['1.2.840.10008.1.2','1.2.840.10008.1.2.1']
+# Pixel data tag (7FE0,0010) in little endian.
+pixelDataTag = b'\xe0\x7f\x10\x00'
+
+def threads(workers=None):
+	# Reading is mostly waiting on the disk, use a few more threads than cores.
+	if workers is None:
+		workers = min(32,(os.cpu_count() or 1)*4)
+	return workers
+
+def readHeader(fn):
+	try:
+		info = os.stat(fn)
+		key = (fn,info.st_mtime,info.st_size)
+		if key not in headerCache:
+			headerCache[key] = dicom.read_file(fn,stop_before_pixels=True)
+		return headerCache[key]
+	except Exception:
+		return None
+
+def scanHeaders(ds,workers=None):
+	with ThreadPoolExecutor(max_workers=threads(workers)) as pool:
+		return list(pool.map(readHeader,ds))
+
+def slicePosition(header):
+	# Project the position onto the slice normal (row x col). Fall back to z if there is no orientation.
+	position = np.array(header.ImagePositionPatient,dtype=float)
+	try:
+		orientation = np.array(header.ImageOrientationPatient,dtype=float)
+		normal = np.cross(orientation[:3],orientation[3:])
+	except AttributeError:
+		normal = np.array([0,0,1])
+	return float(np.dot(position,normal))
+
+def groupSeries(ds,headers,modality=None):
+	series = {}
+	for fn, header in zip(ds,headers):
+		if header is None:
+			continue
+		if (modality is not None) and (getattr(header,'Modality',None) != modality):
+			continue
+		uid = getattr(header,'SeriesInstanceUID','')
+		series.setdefault(uid,[]).append((fn,header))
+
+	# Order each series by slice position (only if every slice has one).
+	for uid in series:
+		if all(hasattr(header,'ImagePositionPatient') for fn,header in series[uid]):
+			series[uid].sort(key=lambda item: slicePosition(item[1]))
+	return series
+
+def pixelType(header):
+	# Signed or unsigned integers of the allocated size.
+	kind = 'i' if int(getattr(header,'PixelRepresentation',0)) == 1 else 'u'
+	return np.dtype(kind+str(int(header.BitsAllocated)//8))
+
+def readPixels(fn,header=None):
+	if header is None:
+		return dicom.read_file(fn).pixel_array
+
+	try:
+		syntax = str(header.file_meta.TransferSyntaxUID)
+	except AttributeError:
+		syntax = None
+	dtype = pixelType(header).newbyteorder('<')
+	rows, cols = int(header.Rows), int(header.Columns)
+	n = rows*cols*dtype.itemsize
+
+	# Single frame, single sample data with no sign correction needed can be read straight off the disk.
+	simple = (int(getattr(header,'SamplesPerPixel',1)) == 1) & (int(getattr(header,'NumberOfFrames',1) or 1) == 1)
+	simple &= (dtype.kind == 'u') | (int(getattr(header,'BitsStored',header.BitsAllocated)) == int(header.BitsAllocated))
+	if (syntax in uncompressed) & simple:
+		try:
+			with open(fn,'rb') as f:
+				f.seek(-(n+12),os.SEEK_END)
+				tail = f.read()
+			# The pixel data element must be the last in the file: tag, (VR), length, then the values.
+			length = np.frombuffer(tail[8:12],dtype='<u4')[0]
+			element = (tail[4:8] == pixelDataTag) | ((tail[0:4] == pixelDataTag) & (tail[4:6] in (b'OW',b'OB')))
+			if (len(tail) == n+12) & (length == n) & element:
+				return np.frombuffer(tail[12:],dtype=dtype).reshape(rows,cols)
+		except (OSError,ValueError):
+			pass
+
+	return dicom.read_file(fn).pixel_array
+
+def loadSlices(ds,volume,index,headers=None,workers=None,block=16):
+	if headers is None:
+		headers = [None]*len(ds)
+	index = np.asarray(index)
+
+	def load(start):
+		# Decode a block of slices into a contiguous buffer, then write them across in one go (the slice axis is last).
+		stop = min(start+block,len(ds))
+		buffer = np.moveaxis(np.stack([readPixels(ds[i],headers[i]) for i in range(start,stop)]),0,2)
+		step = np.diff(index[start:stop])
+		if (len(step) > 0) and np.all(step == step[0]) and (abs(step[0]) == 1):
+			first, last = index[start], index[stop-1]
+			if step[0] == 1:
+				volume[:,:,first:last+1] = buffer
+			else:
+				volume[:,:,last:first+1] = buffer[:,:,::-1]
+		else:
+			volume[:,:,index[start:stop]] = buffer
+
+	with ThreadPoolExecutor(max_workers=threads(workers)) as pool:
+		list(pool.map(load,range(0,len(ds),block)))
+	return volume
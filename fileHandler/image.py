@@ -1,6 +1,7 @@
 import os
 import sys
 from natsort import natsorted
+from syncmrt.fileHandler import catalog
 
 def importImage(path,modality,ftype):
 	path = path
@@ -16,12 +17,10 @@ def importImage(path,modality,ftype):
 	elif ftype == 'npy':
 		ext = ['.npy']
 
-	# Walk directory and generate list of files in it.
-	for root, subdir, fp in os.walk(path):
-		for fn in fp:
-			if (fn.endswith(tuple(ext))) & (fn[:len(modality)] == modality):
-			# if (fn.endswith(tuple(ext))):
-				dataset.append(os.path.join(root,fn))
+	# Get the list of files in the directory from its catalog (only new or changed files are looked at).
+	for fn in catalog.openCatalog(path).listFiles(ext):
+		if os.path.basename(fn)[:len(modality)] == modality:
+			dataset.append(fn)
 
 	# Sort for natural sorting.
 	dataset = natsorted(dataset)
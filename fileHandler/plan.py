@@ -0,0 +1,137 @@
+import dicom
+import numpy as np
+import os
+import threading
+
+'''
+Treatment plan (RTPLAN) model, shared by everything that opens the same file. A plan file is read once per session (a
+plan is kept by path, until the file's modification time or size changes) and only when something is first asked of it,
+its beams are parsed the first time they are needed. Records are shared too, copy their arrays before changing them.
+	loadPlan(fn)							The plan of a file.
+	planModel.modality, .numberOfBeams		Modality of the file and number of beams in the first fraction group.
+	planModel.beams							beamRecord of every beam in the BeamSequence.
+	planModel.dataset						The DICOM dataset itself.
+	beamRecord								number, name, blocks (blockRecord), controlPoints (controlPointRecord).
+	blockRecord								thickness (mm) and points, the aperture as an (n,2) array (mm at the isocenter).
+	controlPointRecord						index, gantryAngle, collimatorAngle, patientSupportAngle (deg, as in the
+											plan), isocenter (mm), cumulativeMetersetWeight and gantryRotationDirection.
+
+Control points after the first only hold what changes, the values they leave out are taken from the one before.
+'''
+
+# Plans read this session: path: ((mtime, size), plan). A file that has changed replaces its old plan.
+planCache = {}
+
+def loadPlan(fn):
+	info = os.stat(fn)
+	path = os.path.abspath(fn)
+	stamp = (info.st_mtime,info.st_size)
+	if (path not in planCache) or (planCache[path][0] != stamp):
+		planCache[path] = (stamp,planModel(fn))
+	return planCache[path][1]
+
+def signedAngle(angle):
+	'''Angles between 181 and 359 deg as negative angles (> -180), as the rotations expect them. Also takes arrays.'''
+	if np.ndim(angle) == 0:
+		angle = float(angle)
+		return angle-360 if 181 < angle < 359 else angle
+	angle = np.asarray(angle,dtype=float)
+	return np.where((angle > 181) & (angle < 359),angle-360,angle)
+
+def turn(a,b,direction=None):
+	'''Angle (deg) from a to b: positive for CW, negative for CC, otherwise the short way round.'''
+	if direction == 'CW':
+		return (b-a) % 360
+	if direction == 'CC':
+		return -((a-b) % 360)
+	return (b-a+180) % 360-180
+
+def interpolate(controlPoints,step=1.0):
+	points = [(p.gantryAngle,p.patientSupportAngle,p.collimatorAngle) for p in controlPoints]
+	angles = [np.array(points[0],dtype=float)]
+	isocenters = [controlPoints[0].isocenter]
+	for a, b, p, q in zip(points[:-1],points[1:],controlPoints[:-1],controlPoints[1:]):
+		change = np.array([turn(a[0],b[0],p.gantryRotationDirection),turn(a[1],b[1]),turn(a[2],b[2])])
+		n = int(np.ceil(np.amax(np.absolute(change))/step))
+		if n == 0:
+			# Control points at the same angles (segments of a static beam) give the one view.
+			continue
+		fraction = np.arange(1,n+1)/n
+		angles.extend(np.array(a)+fraction[:,None]*change)
+		isocenters.extend(p.isocenter+fraction[:,None]*(q.isocenter-p.isocenter))
+	return signedAngle(np.array(angles) % 360), np.array(isocenters)
+
+class controlPointRecord:
+	__slots__ = ('index','gantryAngle','collimatorAngle','patientSupportAngle','isocenter','cumulativeMetersetWeight',
+		'gantryRotationDirection')
+
+	# Record field: DICOM keyword.
+	keywords = {
+		'gantryAngle': 'GantryAngle',
+		'collimatorAngle': 'BeamLimitingDeviceAngle',
+		'patientSupportAngle': 'PatientSupportAngle',
+		'isocenter': 'IsocenterPosition',
+		'cumulativeMetersetWeight': 'CumulativeMetersetWeight',
+		'gantryRotationDirection': 'GantryRotationDirection',
+	}
+
+	def __init__(self,item,previous=None):
+		self.index = int(getattr(item,'ControlPointIndex',0 if previous is None else previous.index+1))
+		for field, keyword in self.keywords.items():
+			value = getattr(item,keyword,None)
+			if value is None:
+				value = None if previous is None else getattr(previous,field)
+			elif field == 'isocenter':
+				value = np.array(value,dtype=float)
+			elif field != 'gantryRotationDirection':
+				value = float(value)
+			setattr(self,field,value)
+
+class blockRecord:
+	__slots__ = ('thickness','points')
+
+	def __init__(self,item):
+		self.thickness = float(getattr(item,'BlockThickness',0))
+		self.points = np.array(item.BlockData,dtype=float).reshape(-1,2)
+
+class beamRecord:
+	__slots__ = ('number','name','blocks','controlPoints')
+
+	def __init__(self,item):
+		self.number = int(getattr(item,'BeamNumber',0))
+		self.name = str(getattr(item,'BeamName',''))
+		self.blocks = [blockRecord(block) for block in getattr(item,'BlockSequence',[])]
+		self.controlPoints = []
+		for point in getattr(item,'ControlPointSequence',[]):
+			self.controlPoints.append(controlPointRecord(point,self.controlPoints[-1] if len(self.controlPoints) > 0 else None))
+
+class planModel:
+	def __init__(self,fn):
+		self.fn = fn
+		self.lock = threading.Lock()
+		self._dataset = None
+		self._beams = None
+
+	@property
+	def dataset(self):
+		with self.lock:
+			if self._dataset is None:
+				self._dataset = dicom.read_file(self.fn)
+		return self._dataset
+
+	@property
+	def modality(self):
+		return getattr(self.dataset,'Modality',None)
+
+	@property
+	def numberOfBeams(self):
+		return int(self.dataset.FractionGroupSequence[0].NumberOfBeams)
+
+	@property
+	def beams(self):
+		if self._beams is None:
+			beams = [beamRecord(item) for item in self.dataset.BeamSequence]
+			with self.lock:
+				if self._beams is None:
+					self._beams = beams
+		return self._beams
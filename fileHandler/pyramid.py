@@ -0,0 +1,145 @@
+import numpy as np
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from syncmrt.fileHandler.volume import saveVolume, loadVolume, readHeader
+from syncmrt.tools.geometry import axisExtent
+
+'''
+Multi-resolution pyramid of a volume: level k has 2^k times the voxel size (1/8^k of the data). Levels are made when
+first asked for, each from the one above it, and saved next to the volume file so they are only ever made once.
+	volumePyramid(volume,extent,fn,levels)		Pyramid of an array (or memory-mapped/chunked volume). With fn (the
+												volume's file) levels are cached as fn.level<k>.vol.
+	openPyramid(fn,extent)						Pyramid of a volume file (opened once per session and extent).
+	volumePyramid.level(k)						Array, extent and voxel size (along the array axes) of level k.
+	volumePyramid.choose(resolution)			Coarsest level whose voxels are no larger than resolution (mm).
+	volumePyramid.at(resolution)				level(choose(resolution)).
+	volumePyramid.build()						Make every level now.
+
+Each level is the one above it filtered with the [1,3,3,1]/8 binomial along every axis and taken at every other voxel
+(anti-aliased, and centred like a 2x2x2 block mean). An odd last voxel along an axis is dropped, the extent is cropped
+to match. Levels are made a slab at a time on a thread pool and are float32. Extents are (l,r,b,t,f,b) as the rotation
+engines give them (see tools.geometry.axisExtent), a cached level is only used if it was made with the same extent.
+'''
+
+# Output voxels made per slab.
+slabSize = 2**21
+# Binomial taps around each pair of voxels.
+taps = np.array([-1,0,1,2])
+weights = np.array([1,3,3,1],dtype=np.float32)/8
+
+# Pyramids open this session: (filename, extent): pyramid.
+pyramids = {}
+
+def threads(workers=None):
+	if workers is None:
+		workers = os.cpu_count() or 1
+	return workers
+
+def openPyramid(fn,extent=None,levels=4):
+	fn = os.path.abspath(fn)
+	key = (fn,None if extent is None else tuple(np.array(extent,dtype=float)))
+	if key not in pyramids:
+		volume = loadVolume(fn)
+		pyramids[key] = volumePyramid(volume.array,volume.extent if extent is None else extent,fn=fn,levels=levels)
+	return pyramids[key]
+
+def reduceAxis(block,axis,rows=None):
+	'''Filter and halve one axis. rows are the (clipped) tap positions to use, by default those of the whole axis.'''
+	if rows is None:
+		n = block.shape[axis]
+		rows = np.clip(2*np.arange(n//2)[:,None]+taps,0,n-1)
+	out = 0
+	for i in range(len(taps)):
+		out = out+weights[i]*np.take(block,rows[:,i],axis=axis)
+	return out
+
+class volumePyramid:
+	def __init__(self,volume,extent=None,fn=None,levels=4,workers=None):
+		self.fn = fn
+		self.levels = levels
+		self.workers = threads(workers)
+		shape = np.array(volume.shape)
+		# Voxel units if there is no extent.
+		extent = np.array([0,shape[1],0,shape[0],0,shape[2]] if extent is None else extent,dtype=float)
+		pairs = axisExtent(extent)
+		self.pixelSize = np.absolute(pairs[1::2]-pairs[0::2])/shape
+		self.arrays = {0:volume}
+		self.extents = {0:extent}
+		self.lock = threading.Lock()
+
+	def cacheName(self,k):
+		return None if self.fn is None else os.path.splitext(self.fn)[0]+'.level%i.vol'%k
+
+	def source(self):
+		# Identifies the volume file (and extent) the cache was made from.
+		info = os.stat(self.fn)
+		return [info.st_mtime,info.st_size]+self.extents[0].tolist()
+
+	def level(self,k):
+		k = int(min(max(k,0),self.levels-1))
+		with self.lock:
+			for i in range(1,k+1):
+				if i not in self.arrays:
+					self.arrays[i], self.extents[i] = self.load(i)
+		return self.arrays[k], self.extents[k], self.pixelSize*2**k
+
+	def choose(self,resolution):
+		scale = float(resolution)/np.amax(self.pixelSize)
+		# Voxel sizes from a rotated extent are off in the last bits, 2 mm is still twice 1.0000000000000007 mm.
+		return int(min(max(np.floor(np.log2(max(scale,1.0))+1e-9),0),self.levels-1))
+
+	def at(self,resolution):
+		return self.level(self.choose(resolution))
+
+	def build(self):
+		self.level(self.levels-1)
+		return self
+
+	def load(self,k):
+		'''Level k from its cache file if that was made from this volume, otherwise made from level k-1 (and saved).'''
+		fn = self.cacheName(k)
+		if (fn is not None) and os.path.isfile(fn):
+			header, offset = readHeader(fn)
+			if (header is not None) and (header['metadata'].get('source') == self.source()):
+				volume = loadVolume(fn)
+				return volume.array, volume.extent
+		array, extent = self.reduce(self.arrays[k-1],self.extents[k-1])
+		if fn is not None:
+			try:
+				saveVolume(fn,array,extent=extent,pixelSize=self.pixelSize*2**k,source=self.source(),level=k)
+			except OSError:
+				# Read only folder, keep the level for this session only.
+				pass
+		return array, extent
+
+	def reduce(self,volume,extent):
+		shape = np.array(volume.shape)
+		half = shape//2
+		if np.any(half == 0):
+			raise ValueError('Volume of shape %s is too small for another pyramid level.'%(tuple(shape),))
+		out = np.empty(tuple(half),dtype=np.float32)
+
+		def slab(start):
+			# Input rows under the taps of this slab's output rows, read once (the volume may be on disk).
+			stop = min(start+rows,half[0])
+			index = np.clip(2*np.arange(start,stop)[:,None]+taps,0,shape[0]-1)
+			first = int(index.min())
+			block = np.asarray(volume[first:int(index.max())+1],dtype=np.float32)
+			# Smallest axes last, so each pass works on less data.
+			block = reduceAxis(reduceAxis(block,2),1)
+			out[start:stop] = reduceAxis(block,0,index-first)
+
+		rows = max(1,slabSize//max(1,int(half[1]*half[2])))
+		starts = range(0,half[0],rows)
+		if (self.workers > 1) & (len(starts) > 1):
+			with ThreadPoolExecutor(max_workers=self.workers) as pool:
+				list(pool.map(slab,starts))
+		else:
+			for start in starts:
+				slab(start)
+
+		# Crop the extent to the whole pairs of voxels that were kept (along each array axis).
+		pairs = axisExtent(extent)
+		pairs[1::2] = pairs[0::2]+(pairs[1::2]-pairs[0::2])*(2*half)/shape
+		return out, axisExtent(pairs)
@@ -0,0 +1,91 @@
+import json
+import numpy as np
+from syncmrt.fileHandler.chunkedVolume import chunkedVolumeFile, isChunkedVolume
+
+'''
+Volume container: one file holding a 3D array and its geometry (extent, pixel size, isocenter), opened memory-mapped
+so only the slabs that are touched get read from disk.
+	saveVolume(fn,array,extent,pixelSize,isocenter,**metadata)	Write a volume (*.vol), returns the filename.
+	loadVolume(fn,mmap=True)									Open a volume (*.vol, *.vck or plain *.npy), returns a volumeFile
+																(or a chunkedVolumeFile for *.vck, whose array is read a slab at a time).
+	volumeFile.array											The (memory-mapped) array.
+	volumeFile.extent, .pixelSize, .isocenter, .metadata		Geometry saved with the array (None if not saved).
+
+File layout: 8 byte magic, 4 byte header length, JSON header, padding to a page boundary, then the raw C ordered array.
+'''
+
+magic = b'SYNCVOL1'
+# Array data starts on a page boundary so it can be mapped.
+alignment = 4096
+# Bytes written at a time when saving.
+slabSize = 2**26
+
+def saveVolume(fn,array,extent=None,pixelSize=None,isocenter=None,**metadata):
+	array = np.asanyarray(array)
+	geometry = {'extent':extent, 'pixelSize':pixelSize, 'isocenter':isocenter}
+	header = {
+		'shape': list(array.shape),
+		'dtype': np.lib.format.dtype_to_descr(array.dtype),
+		'metadata': metadata,
+	}
+	for key, value in geometry.items():
+		header[key] = None if value is None else np.asarray(value,dtype=float).tolist()
+	header = json.dumps(header).encode('utf-8')
+	# Pad the header with spaces so the data is aligned.
+	header += b' '*(-(len(magic)+4+len(header)) % alignment)
+
+	with open(fn,'wb') as f:
+		f.write(magic)
+		f.write(np.uint32(len(header)).tobytes())
+		f.write(header)
+		# Write in slabs along the first axis so large (or memory-mapped) arrays are never copied whole.
+		if array.ndim > 0 and array.size > 0:
+			rows = max(1,slabSize//max(1,array[0].nbytes))
+			for start in range(0,array.shape[0],rows):
+				f.write(np.ascontiguousarray(array[start:start+rows]).tobytes())
+	return fn
+
+def readHeader(fn):
+	with open(fn,'rb') as f:
+		if f.read(len(magic)) != magic:
+			return None, 0
+		length = int(np.frombuffer(f.read(4),dtype=np.uint32)[0])
+		header = json.loads(f.read(length).decode('utf-8'))
+	return header, len(magic)+4+length
+
+def loadVolume(fn,mmap=True,mode='r'):
+	if isChunkedVolume(fn):
+		return chunkedVolumeFile(fn)
+	return volumeFile(fn,mmap=mmap,mode=mode)
+
+class volumeFile:
+	def __init__(self,fn,mmap=True,mode='r'):
+		self.fn = fn
+		self.extent = None
+		self.pixelSize = None
+		self.isocenter = None
+		self.metadata = {}
+
+		header, offset = readHeader(fn)
+		if header is None:
+			# Plain numpy file, no geometry.
+			self.array = np.load(fn,mmap_mode=mode if mmap else None)
+			return
+
+		dtype = np.dtype(np.lib.format.descr_to_dtype(header['dtype']))
+		shape = tuple(header['shape'])
+		if mmap and (int(np.prod(shape)) > 0):
+			self.array = np.memmap(fn,dtype=dtype,mode=mode,offset=offset,shape=shape)
+		else:
+			with open(fn,'rb') as f:
+				f.seek(offset)
+				self.array = np.fromfile(f,dtype=dtype,count=int(np.prod(shape))).reshape(shape)
+
+		for key in ('extent','pixelSize','isocenter'):
+			if header.get(key) is not None:
+				setattr(self,key,np.array(header[key]))
+		self.metadata = header.get('metadata',{})
+
+	@property
+	def shape(self):
+		return self.array.shape
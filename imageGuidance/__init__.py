@@ -1,6 +1,14 @@
 # __all__ = ["wcs2wcs","dicom","hardware"]
 
-from .optimise import optimiseFiducials
-from .wcs2wcs import affineTransform
+from .optimise import optimiseFiducials, refineFiducials
+from .detect import findFiducials
+from .wcs2wcs import affineTransform, rigidTransform
+from .match import matchMarkers
 from . import patientPositioningSystems
-from syncmrt.tools.cuda import gpuInterface
\ No newline at end of file
+
+def __getattr__(name):
+	# The rotation engine is only loaded when it is asked for, importing imageGuidance never touches a device.
+	if name == 'gpuInterface':
+		from syncmrt.tools import backends
+		return backends.engineClass()
+	raise AttributeError("module %r has no attribute %r"%(__name__,name))
\ No newline at end of file
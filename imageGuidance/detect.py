@@ -0,0 +1,146 @@
+import numpy as np
+from scipy import fft, ndimage
+
+'''
+Automatic fiducial detection over a whole radiograph (DRR or X-ray), the candidates can then be refined with
+optimiseFiducials/refineFiducials.
+	findFiducials(data,extent,markersize,...)	Ranked candidates [x,y,diameter,score] in mm (extent as imshow uses it).
+
+Two detectors, both run at several scales around the nominal marker size:
+	'log'		Scale normalised Laplacian of Gaussian (blobs), the score is a robust z-score of the response.
+	'template'	Normalised cross correlation with a disc the size of the marker, the score is the correlation (-1 to 1).
+The filters are applied in the frequency domain on images larger than fftSize pixels (one forward transform shared by
+every scale), and with separable spatial filters otherwise.
+'''
+
+# Images with more pixels than this are filtered with the FFT.
+fftSize = 2**20
+# Default lowest score kept for each method.
+thresholds = {'log':5.0, 'template':0.5}
+
+def findFiducials(data,extent,markersize,count=None,method='log',scales=(0.75,1.0,1.33),polarity='bright',threshold=None):
+	'''
+	Find candidate fiducials over the whole image.
+	- data is the 2D image, extent [left,right,bottom,top] in mm (row 0 at the top)
+	- markersize is the marker diameter in mm, scales are the multiples of it that are searched
+	- polarity is 'bright' for markers brighter than their surroundings (DRR), 'dark' otherwise
+	- gives out at most count candidates (k,4): x, y (mm), diameter (mm) and score, best first
+	'''
+	if method not in thresholds:
+		raise ValueError('Unknown detection method %s.'%method)
+	if threshold is None:
+		threshold = thresholds[method]
+	image = np.asarray(data,dtype=np.float32)
+	if polarity == 'dark':
+		image = -image
+	extent = np.asarray(extent,dtype=float)
+	# Pixel size (rows, cols) in mm and the marker radius in pixels at each scale.
+	pixelSize = np.absolute(np.array([(extent[3]-extent[2])/image.shape[0],(extent[1]-extent[0])/image.shape[1]]))
+	radii = [np.maximum(0.5*markersize*scale/pixelSize,1.0) for scale in scales]
+
+	if method == 'log':
+		responses = logResponses(image,radii)
+	else:
+		responses = templateResponses(image,radii)
+	best = np.amax(responses,axis=0)
+
+	if method == 'log':
+		# Robust z-score (median and MAD of a subsample, the markers are a tiny part of the image).
+		sample = best[::4,::4]
+		median = np.median(sample)
+		spread = 1.4826*np.median(np.absolute(sample-median))
+		best = (best-median)/max(float(spread),1e-12)
+
+	# Local maxima (at most one per marker footprint) among the pixels over the threshold, away from the edges.
+	margin = np.ceil(np.amax(radii,axis=0)).astype(int)
+	rows, cols = np.nonzero(best[margin[0]:-margin[0],margin[1]:-margin[1]] > threshold)
+	rows += margin[0]
+	cols += margin[1]
+	half = np.ceil(np.amin(radii,axis=0)).astype(int)
+	window = best[np.clip(rows[:,None]+np.arange(-half[0],half[0]+1),0,best.shape[0]-1)[:,:,None],
+		np.clip(cols[:,None]+np.arange(-half[1],half[1]+1),0,best.shape[1]-1)[:,None,:]]
+	score = best[rows,cols]
+	peaks = score >= np.amax(window,axis=(1,2))
+	rows, cols, score = rows[peaks], cols[peaks], score[peaks]
+	order = np.argsort(-score,kind='stable')
+	if count is not None:
+		order = order[:count]
+	rows, cols, score = rows[order], cols[order], score[order]
+
+	# Subpixel position from a parabola through the peak and its neighbours, and the scale that responded most.
+	y = rows+subpixel(best[rows-1,cols],score,best[rows+1,cols])
+	x = cols+subpixel(best[rows,cols-1],score,best[rows,cols+1])
+	diameter = markersize*np.asarray(scales)[np.argmax(responses[:,rows,cols],axis=0)]
+
+	# Pixels to mm.
+	x = extent[0]+(x+0.5)*(extent[1]-extent[0])/image.shape[1]
+	y = extent[3]+(y+0.5)*(extent[2]-extent[3])/image.shape[0]
+	return np.column_stack((x,y,diameter,score))
+
+def subpixel(before,peak,after):
+	curvature = before-2*peak+after
+	with np.errstate(divide='ignore',invalid='ignore'):
+		offset = np.where(curvature < 0,0.5*(before-after)/curvature,0)
+	return np.clip(offset,-0.5,0.5)
+
+def spectrum(image,pad):
+	'''Transform of the image padded by reflection (so the edges don't wrap), with its padded shape.'''
+	padded = np.pad(image,pad,mode='reflect')
+	shape = tuple(fft.next_fast_len(s,real=True) for s in padded.shape)
+	return fft.rfft2(padded,s=shape,workers=-1), shape
+
+def frequencies(shape):
+	return fft.fftfreq(shape[0]).astype(np.float32)[:,None], fft.rfftfreq(shape[1]).astype(np.float32)[None,:]
+
+def logResponses(image,radii):
+	# Blob of radius r responds most at sigma = r/sqrt(2), the response is -sigma^2 laplacian(G*I) (bright is positive).
+	sigmas = [radius/np.sqrt(2) for radius in radii]
+	responses = np.empty((len(sigmas),)+image.shape,dtype=np.float32)
+	if image.size > fftSize:
+		pad = int(np.ceil(3*np.amax(sigmas)))
+		transform, shape = spectrum(image,pad)
+		fy, fx = frequencies(shape)
+		ky = (2*np.pi*fy)**2
+		kx = (2*np.pi*fx)**2
+		for i, (sy,sx) in enumerate(sigmas):
+			# The gaussian is separable, only the laplacian term needs the full grid.
+			kernel = (sy**2*ky+sx**2*kx)*(np.exp(-0.5*sy**2*ky)*np.exp(-0.5*sx**2*kx))
+			out = fft.irfft2(transform*kernel,s=shape,workers=-1)
+			responses[i] = out[pad:pad+image.shape[0],pad:pad+image.shape[1]]
+	else:
+		for i, (sy,sx) in enumerate(sigmas):
+			responses[i] = -(sy**2*ndimage.gaussian_filter(image,(sy,sx),order=(2,0))+
+				sx**2*ndimage.gaussian_filter(image,(sy,sx),order=(0,2)))
+	return responses
+
+def templateResponses(image,radii):
+	# Zero mean disc in a square window twice its size, correlated with the image and normalised by the window's
+	# standard deviation.
+	windows = []
+	for ry, rx in radii:
+		size = (2*int(np.ceil(2*ry))+1,2*int(np.ceil(2*rx))+1)
+		y, x = np.ogrid[:size[0],:size[1]]
+		disc = (((y-size[0]//2)/ry)**2+((x-size[1]//2)/rx)**2 <= 1).astype(np.float32)
+		disc -= disc.mean()
+		windows.append((size,disc/np.sqrt(np.sum(disc**2))))
+
+	responses = np.empty((len(windows),)+image.shape,dtype=np.float32)
+	if image.size > fftSize:
+		pad = max(max(size) for size,disc in windows)
+		transform, shape = spectrum(image,pad)
+	for i, (size,disc) in enumerate(windows):
+		if image.size > fftSize:
+			# Correlation is multiplication by the conjugate of the (centred) template's transform.
+			kernel = np.zeros(shape,dtype=np.float32)
+			kernel[:size[0],:size[1]] = disc
+			kernel = np.roll(kernel,(-(size[0]//2),-(size[1]//2)),axis=(0,1))
+			out = fft.irfft2(transform*np.conj(fft.rfft2(kernel,workers=-1)),s=shape,workers=-1)
+			numerator = out[pad:pad+image.shape[0],pad:pad+image.shape[1]]
+		else:
+			numerator = ndimage.correlate(image,disc,mode='reflect')
+		# Standard deviation of the image under the window (in double, the difference cancels).
+		n = size[0]*size[1]
+		mean = ndimage.uniform_filter(image.astype(np.float64),size,mode='reflect')
+		variance = np.maximum(ndimage.uniform_filter(np.square(image,dtype=np.float64),size,mode='reflect')-mean*mean,0)
+		responses[i] = numerator/np.maximum(np.sqrt(variance*n),1e-6)
+	return responses
@@ -1,3 +1,171 @@
+import numpy as np
+from scipy import ndimage, optimize
+from syncmrt.tools import drr
+from syncmrt.fileHandler.pyramid import volumePyramid
+from syncmrt.tools.geometry import rotationMatrix
+
+'''
+Intensity based 2D/3D registration: find the rigid pose of the CT whose DRRs best match the X-ray images.
+	imageRegistration(image1,points1,image2,points2)		The X-ray images (and any markers picked on them).
+	imageRegistration.register(volume,extent,views,extents)	Register the CT to both images, see drrRegistration.
+	drrRegistration(volume,extent,views,images,extents)		The engine, for any number of views.
+	drrRegistration.register(initial)						Pose [rx,ry,rz (deg), tx,ty,tz (mm)], R and t.
+
+The pose moves CT points x to R(x-c)+c+t, c is the centre of the CT, R = rotationMatrix(rx,ry,rz). Each view is a
+drr.beamGeometry (its R takes the room into the view, BEV axis 2 along the beam) and each image is in that view's
+detector frame: rows along BEV axis 0, columns along BEV axis 1, extent [u0,u1,v0,v1] in mm about the isocenter (as
+drrEngine returns DRRs).
+
+Registration runs coarse to fine over a pyramid (block averaged images, DRRs cast with matching pixels and steps), with
+a Powell search over the 6 parameters at each level. DRRs are cached by level and rotation: for parallel views a
+translation only shifts the DRR on the detector, so searching the translations never casts a ray. Given a
+volumePyramid (rather than an array) each level casts through the coarsest CT level that is as fine as its pixels.
+'''
+
+def similarity(a,b,metric='ncc',bins=32):
+	'''Normalised cross correlation or mutual information (nats) of two images, higher is better.'''
+	a = np.ravel(a)
+	b = np.ravel(b)
+	if metric == 'ncc':
+		a = a-np.mean(a)
+		b = b-np.mean(b)
+		return float(np.sum(a*b)/max(np.sqrt(np.sum(a*a)*np.sum(b*b)),1e-12))
+	elif metric == 'mi':
+		# Joint histogram with bincount, each image binned over its own range.
+		ia = np.clip(((a-a.min())*(bins/max(np.ptp(a),1e-12))).astype(int),0,bins-1)
+		ib = np.clip(((b-b.min())*(bins/max(np.ptp(b),1e-12))).astype(int),0,bins-1)
+		joint = np.bincount(ia*bins+ib,minlength=bins*bins).reshape(bins,bins)/float(a.size)
+		pa = joint.sum(axis=1)[:,None]
+		pb = joint.sum(axis=0)[None,:]
+		inside = joint > 0
+		return float(np.sum(joint[inside]*np.log(joint[inside]/(pa*pb)[inside])))
+	raise ValueError('Unknown similarity metric %s.'%metric)
+
+def downsample(image,extent,factor):
+	'''Block average by factor (anti-aliased), cropping to whole blocks. Returns the image and its extent.'''
+	if factor == 1:
+		return np.asarray(image,dtype=np.float32), np.asarray(extent,dtype=float)
+	rows, cols = (np.array(image.shape)//factor)*factor
+	block = np.asarray(image[:rows,:cols],dtype=np.float32).reshape(rows//factor,factor,cols//factor,factor).mean(axis=(1,3))
+	extent = np.asarray(extent,dtype=float)
+	# The cropped image covers less of the extent.
+	size = np.array([extent[1]-extent[0],extent[3]-extent[2]])/np.array(image.shape)
+	return block, np.array([extent[0],extent[0]+rows*size[0],extent[2],extent[2]+cols*size[1]])
+
+class drrRegistration:
+	def __init__(self,volume,extent,views,images,extents,metric='ncc',levels=3,workers=None):
+		self.pyramid = volume if isinstance(volume,volumePyramid) else None
+		if self.pyramid is not None:
+			volume, extent, pixelSize = self.pyramid.level(0)
+		self.engine = drr.drrEngine(volume,extent,order=1,workers=workers)
+		self.engines = {0:self.engine}
+		self.workers = workers
+		self.center = self.engine.center
+		self.views = views
+		self.metric = metric
+		self.levels = levels
+		# Images for each level (coarsest last) and the DRR pixel size to match.
+		self.images = []
+		for level in range(levels):
+			factor = 2**level
+			self.images.append([downsample(image,ext,factor) for image,ext in zip(images,extents)])
+		# DRRs by (level, rotation): list of (image, extent) per view.
+		self.cache = {}
+		self.casts = 0
+		self.evaluations = 0
+
+	def pixelSize(self,level,view):
+		image, extent = self.images[level][view]
+		return float(np.mean(np.absolute([(extent[1]-extent[0])/image.shape[0],(extent[3]-extent[2])/image.shape[1]])))
+
+	def engineFor(self,level):
+		'''Ray caster for a level, on the pyramid level that matches its finest pixels (the full CT without a pyramid).'''
+		if self.pyramid is None:
+			return self.engine
+		k = self.pyramid.choose(min(self.pixelSize(level,i) for i in range(len(self.views))))
+		if k not in self.engines:
+			volume, extent, pixelSize = self.pyramid.level(k)
+			self.engines[k] = drr.drrEngine(volume,extent,order=1,workers=self.workers)
+		return self.engines[k]
+
+	def drrs(self,level,rotation,translation):
+		'''DRR of every view for a pose, cast or taken from the cache.'''
+		R = rotationMatrix(*rotation).astype(float)
+		parallel = [view.mode != 'divergent' for view in self.views]
+		key = (level,tuple(np.round(rotation,4)))
+		if key not in self.cache:
+			self.cache[key] = {}
+		cached = self.cache[key]
+
+		out, beams, missing = {}, [], []
+		for i, view in enumerate(self.views):
+			if parallel[i] and (i in cached):
+				out[i] = cached[i]
+				continue
+			# Parallel views are cast once per rotation (about the CT centre), divergent views per pose.
+			isocenter = self.center if parallel[i] else self.center-np.dot(R.T,translation)
+			pixel = self.pixelSize(level,i)
+			beams.append(drr.beamGeometry(np.dot(view.R,R),isocenter=isocenter,mode=view.mode,sad=view.sad,sid=view.sid,
+				pixelSize=pixel,step=pixel))
+			missing.append(i)
+		if len(beams) > 0:
+			self.casts += 1
+			for i, result in zip(missing,self.engineFor(level).project(beams)):
+				out[i] = result
+				if parallel[i]:
+					cached[i] = result
+
+		images = []
+		for i, view in enumerate(self.views):
+			image, extent = out[i]
+			if parallel[i]:
+				# Translation shifts the projection on the detector.
+				extent = extent+np.repeat(np.dot(view.R,translation)[:2],2)
+			images.append((image,extent))
+		return images
+
+	def cost(self,pose,level):
+		self.evaluations += 1
+		total = 0
+		for (fixed, fixedExtent), (moving, movingExtent) in zip(self.images[level],self.drrs(level,pose[:3],pose[3:])):
+			total += similarity(fixed,resample(moving,movingExtent,fixed.shape,fixedExtent),self.metric)
+		return -total/len(self.views)
+
+	def register(self,initial=None,steps=(2.0,5.0),tolerance=1e-2,limits=(15.0,30.0)):
+		'''
+		Coarse to fine search from the initial pose [rx,ry,rz,tx,ty,tz] (deg, mm).
+		- steps are the initial rotation (deg) and translation (mm) steps at the finest level, doubled for each coarser one
+		- tolerance is the precision of the result (in steps) at each level
+		- limits are how far (deg, mm) the search may go from the initial pose
+		- gives out the pose, R, t and the similarity at each level (coarsest first)
+		'''
+		pose = np.zeros(6) if initial is None else np.array(initial,dtype=float)
+		limits = np.array([limits[0]]*3+[limits[1]]*3)
+		lower, upper = pose-limits, pose+limits
+		scores = []
+		for level in reversed(range(self.levels)):
+			scale = 2**level
+			# Directions in units of the steps, so one tolerance suits both rotations and translations.
+			units = np.array([steps[0]]*3+[steps[1]]*3)*scale
+			# Bounded, a line search on coarse images can otherwise run off to a far (wrong) optimum.
+			result = optimize.minimize(lambda x: self.cost(x*units,level),pose/units,method='Powell',
+				bounds=list(zip(lower/units,upper/units)),options={'xtol':tolerance,'ftol':1e-5,'maxfev':400})
+			pose = result.x*units
+			scores.append(-result.fun)
+			# Coarse DRRs aren't needed again.
+			self.cache = {key:value for key,value in self.cache.items() if key[0] < level}
+		R = rotationMatrix(*pose[:3]).astype(float)
+		return pose, R, pose[3:], scores
+
+def resample(image,extent,shape,target):
+	'''Image (with extent) sampled at the pixel centres of another grid, 0 outside.'''
+	pixel = np.array([(extent[1]-extent[0])/image.shape[0],(extent[3]-extent[2])/image.shape[1]])
+	u = target[0]+(np.arange(shape[0])+0.5)*(target[1]-target[0])/shape[0]
+	v = target[2]+(np.arange(shape[1])+0.5)*(target[3]-target[2])/shape[1]
+	rows = (u-extent[0])/pixel[0]-0.5
+	cols = (v-extent[2])/pixel[1]-0.5
+	return ndimage.map_coordinates(image,np.meshgrid(rows,cols,indexing='ij'),order=1,mode='constant',cval=0.0)
+
 class imageRegistration:
 	def __init__(self,image1,points1,image2,points2):
 		self.image1 = image1
@@ -5,5 +173,8 @@ class imageRegistration:
 		self.image2 = image2
 		self.points2 = points2
 
-
-
+	def register(self,volume,extent,views,extents,initial=None,**kwargs):
+		'''Register the CT to image1 and image2 (seen by the two views). See drrRegistration for the arguments.'''
+		self.engine = drrRegistration(volume,extent,views,[self.image1,self.image2],extents,**kwargs)
+		self.pose, self.R, self.translation, self.scores = self.engine.register(initial)
+		return self.pose
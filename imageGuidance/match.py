@@ -0,0 +1,94 @@
+import itertools
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from syncmrt.imageGuidance.wcs2wcs import rigidTransform
+
+'''
+Marker matching without known correspondence: unordered CT (left) and X-ray (right) marker sets, of different sizes and
+with missing, extra or mislabelled markers.
+	matchMarkers(leftCS,rightCS,tolerance)	Inlier correspondence and rigid transform (right = R.left + t).
+
+Rigid motion keeps the distance between any two markers, so right pairs are indexed by their distance and each left
+triplet is only paired with right triplets whose three sides agree (within tolerance). Every such hypothesis is solved
+in one batched call and scored by how many markers it brings within tolerance of a marker in the other set (MSAC, a
+truncated squared error), the best is then refined on all of its inliers.
+'''
+
+def matchMarkers(leftCS,rightCS,tolerance=2.0,hypotheses=1000,seed=0):
+	'''
+	Match two unordered marker sets.
+	- leftCS (m,3) and rightCS (k,3) in mm, at least 3 each
+	- tolerance (mm) is the largest distance between matched markers (and between matching pair distances)
+	- hypotheses caps the number of triplet correspondences that are tested (a random subset is used past it)
+	- gives out pairs (p,2) of [left index, right index], R, t and the residual (mm) of each pair
+	  (no pairs and None when no three markers agree)
+	'''
+	l = np.asarray(leftCS,dtype=float)
+	r = np.asarray(rightCS,dtype=float)
+	if (len(l) < 3) | (len(r) < 3):
+		raise ValueError('At least three markers are needed in each set to match them.')
+	rng = np.random.default_rng(seed)
+	dl = np.linalg.norm(l[:,None]-l[None],axis=2)
+	dr = np.linalg.norm(r[:,None]-r[None],axis=2)
+
+	# Index of the right pairs (both orders) sorted by their distance.
+	first, second = np.nonzero(~np.eye(len(r),dtype=bool))
+	order = np.argsort(dr[first,second])
+	first, second = first[order], second[order]
+	index = dr[first,second]
+
+	# Left triplets that aren't close to a line (their sides can't tell the points apart).
+	triplets = np.array(list(itertools.combinations(range(len(l)),3)))
+	a, b, c = triplets.T
+	area = np.linalg.norm(np.cross(l[b]-l[a],l[c]-l[a]),axis=1)
+	triplets = triplets[area > tolerance*np.amax(dl)]
+	if len(triplets) == 0:
+		return noMatch()
+	a, b, c = triplets.T
+
+	# Right pairs that match the first side of each triplet.
+	lower = np.searchsorted(index,dl[a,b]-tolerance,side='left')
+	upper = np.searchsorted(index,dl[a,b]+tolerance,side='right')
+	counts = upper-lower
+	triplet = np.repeat(np.arange(len(triplets)),counts)
+	position = lower[triplet]+np.arange(counts.sum())-np.repeat(np.cumsum(counts)-counts,counts)
+	x, y = first[position], second[position]
+
+	# Third markers that match the other two sides.
+	fits = (np.absolute(dr[x]-dl[a[triplet],c[triplet]][:,None]) <= tolerance) & (np.absolute(dr[y]-dl[b[triplet],c[triplet]][:,None]) <= tolerance)
+	fits[np.arange(len(x)),x] = False
+	fits[np.arange(len(x)),y] = False
+	candidate, z = np.nonzero(fits)
+	if len(candidate) == 0:
+		return noMatch()
+	if len(candidate) > hypotheses:
+		keep = rng.choice(len(candidate),hypotheses,replace=False)
+		candidate, z = candidate[keep], z[keep]
+	left = triplets[triplet[candidate]]
+	right = np.column_stack((x[candidate],y[candidate],z))
+
+	# Solve every hypothesis at once and score it on all markers.
+	R, t, scale, residuals = rigidTransform(l[left],r[right])
+	mapped = np.einsum('hij,nj->hni',R,l)+t[:,None,:]
+	# Squared distances as |a|^2+|b|^2-2a.b, a matrix product rather than an (h,m,k,3) difference.
+	nearest = np.amin(np.sum(mapped**2,axis=2)[:,:,None]+np.sum(r**2,axis=1)[None,None]-2*np.matmul(mapped,r.T),axis=2)
+	cost = np.sum(np.minimum(nearest,tolerance**2),axis=1)
+	best = int(np.argmin(cost))
+	R, t = R[best], t[best]
+
+	# One to one assignment of the markers within tolerance, refit on them and assign again.
+	for i in range(2):
+		pairs = assign(l,r,R,t,tolerance)
+		if len(pairs) < 3:
+			return noMatch()
+		R, t, scale, residuals = rigidTransform(l[pairs[:,0]],r[pairs[:,1]])
+	return pairs, R, t, residuals
+
+def assign(l,r,R,t,tolerance):
+	distance = np.linalg.norm((np.dot(l,R.T)+t)[:,None]-r[None],axis=2)
+	rows, cols = linear_sum_assignment(np.minimum(distance,tolerance*10))
+	inside = distance[rows,cols] <= tolerance
+	return np.column_stack((rows[inside],cols[inside]))
+
+def noMatch():
+	return np.zeros((0,2),dtype=int), None, None, None
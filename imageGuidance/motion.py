@@ -0,0 +1,253 @@
+import asyncio
+import functools
+import threading
+import time
+
+'''
+Motor control. Every motor has the same small interface, so the controller drives beamline motors and simulated ones
+alike:
+	motor.move(value)			Start a move (doesn't wait).
+	motor.stop()				Stop where it is (doesn't wait either).
+	motor.readback, motor.done	Last position read back and whether it is done moving.
+	motor.tolerance				How far from its target a finished move may stop and still be in position (units).
+	motor.subscribe(callback)	callback(readback,done) on every change, from the motor's own thread.
+	motor.kinematics()			Speed (units/s), acceleration (units/s^2, inf for none) and travel limits.
+
+	epicsMotor(base,timeout)					EPICS motor record: VAL to move, RBV and DMOV monitored, STOP to stop. It is
+												in position within its retry deadband (RDBD) or step (MRES). Raises a
+												ConnectionError if the record doesn't answer within timeout (s).
+	simulatedMotor(position,speed,latency)		Stand-in that moves with a trapezoidal velocity profile on a thread of
+												its own.
+	motionController(motors)					Moves several motors at once with asyncio (see move).
+'''
+
+def profileTime(distance,speed,acceleration=float('inf')):
+	'''Time to cover distance with a trapezoidal velocity profile (a triangle if it never reaches speed).'''
+	distance = abs(distance)
+	if acceleration == float('inf'):
+		return distance/speed
+	if distance >= speed**2/acceleration:
+		return distance/speed+speed/acceleration
+	return 2*(distance/acceleration)**0.5
+
+def profileDistance(elapsed,distance,speed,acceleration=float('inf')):
+	'''Distance covered after elapsed seconds of the same profile.'''
+	if acceleration == float('inf'):
+		return min(speed*elapsed,distance)
+	total = profileTime(distance,speed,acceleration)
+	peak = min(speed,(distance*acceleration)**0.5)
+	ramp = peak/acceleration
+	elapsed = min(max(elapsed,0),total)
+	if elapsed < ramp:
+		return 0.5*acceleration*elapsed**2
+	if elapsed > total-ramp:
+		return distance-0.5*acceleration*(total-elapsed)**2
+	return 0.5*acceleration*ramp**2+peak*(elapsed-ramp)
+
+class epicsMotor:
+	def __init__(self,base,timeout=1.0):
+		# Only needed on the beamline, simulated motors work without it.
+		from epics import PV
+		self.base = base
+		self.callbacks = []
+		self.val = PV(base+'.VAL')
+		if not self.val.wait_for_connection(timeout=timeout):
+			raise ConnectionError('Cannot connect to motor record %s.'%base)
+		self.halt = PV(base+'.STOP')
+		self.rbv = PV(base+'.RBV',callback=self.changed)
+		self.dmov = PV(base+'.DMOV',callback=self.changed)
+		# Motor record fields for the speed, time to reach it and the soft limits.
+		self.fields = {field:PV(base+'.'+field) for field in ('VELO','ACCL','LLM','HLM','RDBD','MRES')}
+
+	@property
+	def readback(self):
+		return self.rbv.get(use_monitor=True)
+
+	@property
+	def done(self):
+		return bool(self.dmov.get(use_monitor=True))
+
+	@property
+	def tolerance(self):
+		# The record stops retrying once inside its deadband, which can't be finer than a step.
+		return max(abs(float(self.fields['RDBD'].get())),abs(float(self.fields['MRES'].get())))
+
+	def changed(self,**kwargs):
+		readback, done = self.readback, self.done
+		for callback in self.callbacks:
+			callback(readback,done)
+
+	def subscribe(self,callback):
+		self.callbacks.append(callback)
+
+	def move(self,value):
+		self.val.put(value,wait=False)
+
+	def stop(self):
+		self.halt.put(1)
+
+	def kinematics(self):
+		speed, ramp, lower, upper = [float(self.fields[field].get()) for field in ('VELO','ACCL','LLM','HLM')]
+		# Equal limits mean no limits in a motor record.
+		if lower == upper:
+			lower, upper = -float('inf'), float('inf')
+		return {'speed':speed, 'acceleration':speed/ramp if ramp > 0 else float('inf'), 'lower':lower, 'upper':upper}
+
+class simulatedMotor:
+	'''
+	Motor that starts moving latency (s) after it is told to, speeding up at acceleration (units/s^2, None for at once)
+	to speed (units/s), updating its readback every period (s) and calling its subscribers from its own thread, as
+	channel access would. Stopping only signals the thread, it reports done once it has.
+	'''
+	def __init__(self,position=0.0,speed=1.0,latency=0.01,period=0.005,acceleration=None,lower=None,upper=None,tolerance=1e-3):
+		self.readback = float(position)
+		self.done = True
+		self.speed = speed
+		self.acceleration = float('inf') if acceleration is None else acceleration
+		self.lower = -float('inf') if lower is None else lower
+		self.upper = float('inf') if upper is None else upper
+		self.latency = latency
+		self.period = period
+		self.tolerance = tolerance
+		self.callbacks = []
+		# Each move has its own event, a replaced move's thread only finds out at its next update. The lock keeps it from
+		# writing the readback once it has been replaced.
+		self.halted = threading.Event()
+		self.lock = threading.Lock()
+
+	def subscribe(self,callback):
+		self.callbacks.append(callback)
+
+	def kinematics(self):
+		return {'speed':self.speed, 'acceleration':self.acceleration, 'lower':self.lower, 'upper':self.upper}
+
+	def notify(self):
+		for callback in self.callbacks:
+			callback(self.readback,self.done)
+
+	def move(self,value):
+		# A new move replaces the one in progress.
+		with self.lock:
+			self.halted.set()
+			self.halted = threading.Event()
+			threading.Thread(target=self.run,args=(float(value),self.halted),daemon=True).start()
+
+	def stop(self):
+		# Called from the event loop too, so it never waits on the thread.
+		self.halted.set()
+
+	def current(self,halted):
+		# Whether halted still belongs to the latest move.
+		return self.halted is halted
+
+	def run(self,target,halted):
+		if halted.wait(self.latency):
+			with self.lock:
+				finished = self.current(halted) & (not self.done)
+				self.done |= finished
+			if finished:
+				self.notify()
+			return
+		with self.lock:
+			if not self.current(halted):
+				return
+			start = self.readback
+			self.done = False
+		target = min(max(target,self.lower),self.upper)
+		direction = 1 if target >= start else -1
+		distance = abs(target-start)
+		duration = profileTime(distance,self.speed,self.acceleration)
+		self.notify()
+		begin = time.perf_counter()
+		while not halted.wait(self.period):
+			elapsed = time.perf_counter()-begin
+			with self.lock:
+				if not self.current(halted):
+					return
+				if elapsed >= duration:
+					self.readback = target
+					break
+				self.readback = start+direction*profileDistance(elapsed,distance,self.speed,self.acceleration)
+			self.notify()
+		with self.lock:
+			if not self.current(halted):
+				return
+			self.done = True
+		self.notify()
+
+class motionController:
+	'''
+	Concurrent moves on a set of motors (a dict, name: motor).
+		await move({name:value},timeout)	Start every axis, then wait until all of them are done and in position.
+		stop(names)							Stop motors (all of them by default).
+	A move that times out or is cancelled stops its motors before the error is passed on. A motor that finishes out of
+	position (a limit, or stopped by someone else) fails the move with a RuntimeError. Each motor is in position within
+	its own tolerance, unless one is given here for all of them.
+	'''
+	def __init__(self,motors,tolerance=None):
+		self.motors = motors
+		self.tolerance = tolerance
+		self.loop = None
+		# Axes being waited on: name: [target, future, seen moving, tolerance].
+		self.waiting = {}
+		for name, motor in motors.items():
+			motor.subscribe(functools.partial(self.notify,name))
+
+	def notify(self,name,readback,done):
+		# Motor callbacks come from other threads, hand them to the event loop.
+		if (self.loop is not None) and (name in self.waiting):
+			self.loop.call_soon_threadsafe(self.update,name,readback,done)
+
+	def update(self,name,readback,done):
+		if name not in self.waiting:
+			return
+		target, future, moving, tolerance = self.waiting[name]
+		if future.done():
+			return
+		if not done:
+			self.waiting[name][2] = True
+		elif abs(readback-target) <= tolerance:
+			future.set_result(readback)
+		elif moving:
+			future.set_exception(RuntimeError('Motor %s stopped at %.4g rather than %.4g (within %.2g).'%(name,readback,target,tolerance)))
+
+	async def move(self,targets,timeout=60.0):
+		'''Gives out the final readback of each motor.'''
+		for name in targets:
+			if name not in self.motors:
+				raise KeyError('Attempting to move non-existant motor %s.'%name)
+		self.loop = asyncio.get_running_loop()
+		futures = {}
+		for name, value in targets.items():
+			futures[name] = self.loop.create_future()
+			tolerance = self.motors[name].tolerance if self.tolerance is None else self.tolerance
+			self.waiting[name] = [float(value),futures[name],False,tolerance]
+		for name in targets:
+			self.motors[name].move(self.waiting[name][0])
+		# Motors that were already in position may never call back.
+		for name in targets:
+			self.update(name,self.motors[name].readback,self.motors[name].done)
+
+		try:
+			finished, pending = await asyncio.wait(list(futures.values()),timeout=timeout,return_when=asyncio.FIRST_EXCEPTION)
+			for future in finished:
+				if future.exception() is not None:
+					raise future.exception()
+			if len(pending) > 0:
+				raise asyncio.TimeoutError('Motors %s did not finish moving in %.1f s.'%(
+					', '.join(name for name in futures if futures[name] in pending),timeout))
+		except BaseException:
+			# Timed out, cancelled or a motor failed: nothing keeps moving.
+			self.stop([name for name in futures if not futures[name].done()])
+			raise
+		finally:
+			for name, future in futures.items():
+				if self.waiting.get(name,[None,None])[1] is future:
+					del self.waiting[name]
+				if not future.done():
+					future.cancel()
+		return {name:future.result() for name,future in futures.items()}
+
+	def stop(self,names=None):
+		for name in (self.motors if names is None else names):
+			self.motors[name].stop()
@@ -10,64 +10,76 @@ def optimiseFiducials(pts,data,dims,markersize):
 	- requires pixel data array
 	- gives out points in mm
 	- input should be [row,col]; we have made exceptions to align x/y and row/col in here
+	The data is not modified. See refineFiducials for several images at once.
 	'''
+	return refineFiducials(pts,data,dims,markersize,weighted=False)
+
+def refineFiducials(pts,data,dims,markersize,weighted=True,pct=3):
+	'''
+	Re-center every marker on every image in one call.
+	- pts, data and dims are one set of points (mm), image and pixel size, or lists of them (e.g. both orthogonal images)
+	- markersize in mm, the ROI around each point is 3 marker sizes either side
+	- pixels within pct % of the value under the point are the marker, the connected region closest to the point wins
+	- weighted gives the intensity weighted (subpixel) centroid of the region, otherwise its binary center of mass
+	- gives out points in mm, in the same form as pts; points with no region around them are returned unchanged
+	'''
+	if isinstance(data,(list,tuple)):
+		return [refineImage(np.asarray(p,dtype=float),d,np.asarray(s,dtype=float),markersize,weighted,pct) for p,d,s in zip(pts,data,dims)]
+	return refineImage(np.asarray(pts,dtype=float),data,np.asarray(dims,dtype=float),markersize,weighted,pct)
+
+def refineImage(pts,data,dims,markersize,weighted,pct):
 	dims = np.flip(dims,0)
-	# Create array for optimised points.
-	pts_ctrds = np.zeros((np.shape(pts)))
+	if len(pts) == 0:
+		return np.zeros(np.shape(pts))
 
-	# Turn point measurements (mm) into integers for indexing.
+	# Point measurements (mm) to pixels.
 	pts = pts/dims
 	x_roi = int(markersize*3/dims[0])
 	y_roi = int(markersize*3/dims[1])
+	x = pts[:,0].astype(int)
+	y = pts[:,1].astype(int)
+	data = np.asarray(data)
+	clr = data[y,x]
 
-	# Iterate over number of points.
-	for i in range(np.shape(pts)[0]):
-		# Select the coordinate in the array and sample the value.
-		x = int(pts[i,0])
-		y = int(pts[i,1])
-		clr = data[y,x]
-
-		# Create ROI to look at.
-		roi = data[(y-y_roi):(y+y_roi),(x-x_roi):(x+x_roi)]
-		roi_cnr = np.array([x-x_roi,y-y_roi])
-
-		# Define thresholds of +/- X% of that value.
-		pct = 3
-		thresh_max = clr+np.absolute(clr*(pct/100))
-		thresh_min = clr-np.absolute(clr*(pct/100))
+	# Gather every ROI into one array, shape (n,rows,cols). Outside the image counts as background.
+	rows = y[:,None]-y_roi+np.arange(2*y_roi)
+	cols = x[:,None]-x_roi+np.arange(2*x_roi)
+	inside = ((rows >= 0) & (rows < data.shape[0]))[:,:,None] & ((cols >= 0) & (cols < data.shape[1]))[:,None,:]
+	roi = data[np.clip(rows,0,data.shape[0]-1)[:,:,None],np.clip(cols,0,data.shape[1]-1)[:,None,:]]
+	roi = np.where(inside,roi,0)
 
-		# Mask the image.
-		roi[(roi<thresh_min)] = 0
-		roi[(roi>thresh_max)] = 0
-		# Set remaining values to binary 1.
-		roi[(roi>0)] = 1
+	# Pixels within +/- pct % of the value under each point (zero is background).
+	spread = np.absolute(clr*(pct/100))[:,None,None]
+	mask = (roi >= (clr[:,None,None]-spread)) & (roi <= (clr[:,None,None]+spread)) & (roi != 0)
 
-		# Find connection maps of each element.
-		labels, index = ndimage.label(roi)
+	# Label all ROIs at once, regions can't connect between ROIs.
+	structure = np.zeros((3,3,3),dtype=bool)
+	structure[1] = ndimage.generate_binary_structure(2,1)
+	labels, count = ndimage.label(mask,structure=structure)
+	if count == 0:
+		return pts*dims
 
-		# Create empty array size of indexes.
-		labels_com = np.zeros((index,2))
-		# Get center of mass for each element.
-		for j in range(index):
-			labels_com[j,:] = ndimage.measurements.center_of_mass(roi,labels,j+1)
+	# Centroid of every region from weighted pixel counts.
+	found = labels.ravel()
+	weights = np.absolute(roi).ravel()[found > 0] if weighted else np.ones(np.count_nonzero(found))
+	found = found[found > 0]
+	marker, row, col = np.nonzero(labels)
+	total = np.bincount(found,weights=weights,minlength=count+1)[1:]
+	rows = np.bincount(found,weights=weights*row,minlength=count+1)[1:]/total
+	cols = np.bincount(found,weights=weights*col,minlength=count+1)[1:]/total
+	owner = np.zeros(count+1,dtype=int)
+	owner[found] = marker
+	owner = owner[1:]
 
-		# Flip labels_com L to R to order as x,y.
-		labels_com = np.fliplr(labels_com)
-		labels_com += roi_cnr
+	# Region centroids as x,y in the image and their distance to their marker.
+	centroids = np.column_stack((cols+x[owner]-x_roi,rows+y[owner]-y_roi))
+	distance = np.hypot(*(centroids-pts[owner]).T)
 
-		# Find the CoM that most accurately represents a datapoint.
-		# Test points.
-		test = np.absolute(labels_com-pts[i,:])
-		dist = np.zeros((index,1))
-		# Find the length of each set of points.
-		for j in range(index):
-			dist[j,0] = np.sqrt(test[j,0]**2 + test[j,1]**2)
-		# Find the smallest line.
-		ind = np.argmin(dist)
-		# Set the value.
-		pts_ctrds[i,:] = labels_com[ind,:]
+	# Closest region to each marker.
+	order = np.lexsort((distance,owner))
+	markers, first = np.unique(owner[order],return_index=True)
+	refined = np.array(pts)
+	refined[markers] = centroids[order[first]]
 
-	# Return pts_ctrds to measurement values (mm).
-	pts_ctrds = pts_ctrds*dims
-	# Return centroid refined points as np array.
-	return pts_ctrds
\ No newline at end of file
+	# Return to measurement values (mm).
+	return refined*dims
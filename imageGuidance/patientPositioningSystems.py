@@ -1,44 +1,101 @@
-from epics import PV
+import asyncio
+import numpy as np
+from syncmrt.imageGuidance.motion import epicsMotor, simulatedMotor, motionController
+from syncmrt.imageGuidance import planning, telemetry
 
-''' 
+'''
 CLASS USE:
-system = hutch2b_mrt()
+system = DynMRT()
 
-system.V.get()
-system.V.put(num)
-system.V.info
-system.V.monitor() etc.
+system.write('tx',num)						Start one axis moving.
+system.move({'tx':x,'ty':y,'ry':theta})		Move the axes together and wait for them (await system.controller.move(...)
+											from a coroutine).
+system.stop()
+system.correct(transform)					Apply an affineTransform correction with the fastest motion plan.
+system.read()								Latest readback of each axis, system.telemetry.window(axis) for its history.
+system = DynMRT(simulate=True)				Simulated motors (no beamline needed).
+system.connected							False if the motors couldn't be reached, moving then raises a ConnectionError.
 '''
 
+# Motor records of the MRT stage.
+motors = {
+	'tx': 'SR08ID01SST25:SAMPLEH1',
+	'ty': 'SR08ID01SST25:SAMPLEV',
+	'tz': 'SR08ID01SST25:SAMPLEH2',
+	'ry': 'SR08ID01SST25:ROTATION',
+}
+
+# Component of the correction [x,y,z,theta,phi,gamma] each axis applies. The stage can't rotate about x or z.
+corrections = {'tx':0, 'ty':1, 'tz':2, 'ry':4}
 
 class DynMRT:
 	''' Class that controls the MRT motors in Hutch 2B. '''
-	def __init__(self):
-		''' Setup generic 6 DoF motor process variables (PVs) for MRT stage. '''
-		# self.tx = PV('SR08ID01SST25:SAMPLEH1.VAL')
-		# self.ty = PV('SR08ID01SST25:SAMPLEHV.VAL')
-		# self.tz = PV('SR08ID01SST25:SAMPLEH2.VAL')
-		# self.rx = False
-		# self.ry = PV('SR08ID01SST25:ROTATION.VAL')
-		# self.rz = False
-
-		self.mrt = []
+	def __init__(self,simulate=False,**kwargs):
+		''' Setup generic 6 DoF motor process variables (PVs) for MRT stage. kwargs go to each simulatedMotor. '''
+		self.mrt = {}
+		self.connected = True
 		try:
-			self.mrt['tx'] = PV('SR08ID01SST25:SAMPLEH1.VAL')
-			self.mrt['ty'] = PV('SR08ID01SST25:SAMPLEV.VAL')
-			self.mrt['tz'] = PV('SR08ID01SST25:SAMPLEH2.VAL')
-			self.mrt['ry'] = PV('SR08ID01SST25:ROTATION.VAL')
-		except:
-			print("Cannot connect to motors.")
+			for name, base in motors.items():
+				self.mrt[name] = simulatedMotor(**kwargs) if simulate else epicsMotor(base)
+		except (ImportError,ConnectionError) as error:
+			# No pyepics or a record didn't answer: no axes rather than some of them.
+			print("Cannot connect to motors:",error)
+			self.mrt = {}
+			self.connected = False
+		self.controller = motionController(self.mrt)
+		# Every readback the motors report.
+		self.telemetry = telemetry.recorder()
+		for name, motor in self.mrt.items():
+			self.telemetry.attach(name,motor)
+		# Constraints on the moves (see planning), none are known for this stage.
+		self.before = []
+		self.exclusive = []
+		self.concurrent = None
 
 	def write(self,pv,value):
 		'''Ensure inputs are of correct types, converting float to 3 dec places (0.001 mm)'''
+		self.check()
 		pv = str(pv)
 		value = round(float(value),3)
 		if pv in self.mrt:
-			self.mrt[pv].put(value)
+			self.mrt[pv].move(value)
 		else:
 			print('Attempting to move non-existant motor',pv,'.')
 
+	def move(self,targets,timeout=60.0):
+		'''Move several axes at once (dict of axis: value), returns their final positions.'''
+		self.check()
+		return asyncio.run(self.controller.move(targets,timeout))
+
+	def stop(self):
+		self.controller.stop()
+
+	def check(self):
+		if not self.connected:
+			raise ConnectionError('Not connected to the MRT motors.')
+
+	def plan(self,targets,latency=0.0,settle=0.0):
+		'''Fastest plan from where the axes are to targets (dict of axis: value), see planning.planMotion.'''
+		self.check()
+		axes = {name:planning.axis.fromMotor(motor,latency,settle) for name,motor in self.mrt.items()}
+		positions = {name:motor.readback for name,motor in self.mrt.items()}
+		return planning.planMotion(axes,positions,targets,self.before,self.exclusive,self.concurrent)
+
+	def correct(self,transform,timeout=60.0):
+		'''Move the stage by an affineTransform's translation and rotation, gives out the plan that was run.'''
+		self.check()
+		correction = np.concatenate((np.ravel(transform.translation),[transform.theta,transform.phi,transform.gamma]))
+		if np.any(np.absolute(np.delete(correction,list(corrections.values()))) > 0):
+			print('Rotations about x and z cannot be applied by the MRT stage, only the rotation about y is.')
+		targets = {name:self.mrt[name].readback+correction[i] for name,i in corrections.items() if name in self.mrt}
+		plan = self.plan(targets)
+		asyncio.run(planning.execute(plan,self.controller,timeout))
+		return plan
+
 	def read(self):
-		pass
\ No newline at end of file
+		'''Latest readback of each axis (as the motor has it until it first reports).'''
+		positions = {}
+		for name, motor in self.mrt.items():
+			sample = self.telemetry.latest(name)
+			positions[name] = motor.readback if sample is None else sample[1]
+		return positions
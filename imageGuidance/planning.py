@@ -0,0 +1,173 @@
+import asyncio
+import itertools
+import os
+from syncmrt.imageGuidance.motion import profileTime
+
+'''
+Motion planning for the positioning stage: the shortest schedule of axis moves that reaches a target pose.
+	axis(lower,upper,speed,acceleration,latency,settle)			Travel and kinematics of one motor axis.
+	axis.fromMotor(motor,latency,settle)						The same from a motor (motion.epicsMotor/simulatedMotor).
+	knownMotors(fn)												Motor records in listOfKnownMotorPVs.txt (not commented out).
+	planMotion(axes,positions,targets,before,exclusive,concurrent)	The plan (a motionPlan).
+	sequentialPlan(axes,positions,targets)						One axis after another, in the order given (as DynMRT
+																used to move), for comparison.
+	await execute(plan,controller)								Run a plan on a motion.motionController.
+
+Constraints between axes (only those that move count):
+	before		(a,b) pairs, a has to finish before b starts (e.g. move a detector out before rotating).
+	exclusive	Groups of axes that may not move at the same time (e.g. axes that could collide, or share a drive).
+	concurrent	Most axes moving at once (e.g. the limit of the motor controller), None for no limit.
+A move takes the axis' latency, its trapezoidal profile and its settling time. Every priority order of the moving axes
+is list scheduled (longest first only, past exhaustiveSize axes) and the shortest schedule is kept.
+'''
+
+# Most moving axes for which every priority order is tried.
+exhaustiveSize = 6
+# Times (s) closer than this are the same.
+epsilon = 1e-9
+
+class axis:
+	def __init__(self,lower=-float('inf'),upper=float('inf'),speed=1.0,acceleration=float('inf'),latency=0.0,settle=0.0):
+		self.lower = lower
+		self.upper = upper
+		self.speed = speed
+		self.acceleration = acceleration
+		self.latency = latency
+		self.settle = settle
+
+	@classmethod
+	def fromMotor(cls,motor,latency=0.0,settle=0.0):
+		return cls(latency=latency,settle=settle,**motor.kinematics())
+
+	def duration(self,distance):
+		return self.latency+profileTime(distance,self.speed,self.acceleration)+self.settle
+
+class motionPlan:
+	'''
+	moves		(name, target, start, finish) of every axis that moves, by start time (s).
+	after		Axes each move waits for (those that finish before it starts and constrain it).
+	duration	Time until the last axis is in place (s).
+	'''
+	def __init__(self,moves,after):
+		self.moves = sorted(moves,key=lambda move: move[2])
+		self.after = after
+		self.duration = max([move[3] for move in moves]+[0.0])
+
+	def phases(self):
+		'''Names of the axes that start together, in order.'''
+		phases = []
+		for name, target, start, finish in self.moves:
+			if (len(phases) > 0) and (abs(start-phases[-1][0]) < epsilon):
+				phases[-1][1].append(name)
+			else:
+				phases.append((start,[name]))
+		return [names for start,names in phases]
+
+def knownMotors(fn=None):
+	if fn is None:
+		fn = os.path.join(os.path.dirname(os.path.abspath(__file__)),'listOfKnownMotorPVs.txt')
+	with open(fn) as f:
+		names = [line.strip() for line in f if (line.strip() != '') and not line.strip().startswith('#')]
+	# Some motors are listed twice.
+	return list(dict.fromkeys(names))
+
+def durations(axes,positions,targets,tolerance=1e-3):
+	'''Time for each axis that has to move (axes already within tolerance of their target are left out).'''
+	times = {}
+	for name, target in targets.items():
+		if name not in axes:
+			raise KeyError('No kinematics for axis %s.'%name)
+		if not (axes[name].lower <= target <= axes[name].upper):
+			raise ValueError('Target %.3f for axis %s is outside its limits [%.3f, %.3f].'%(target,name,axes[name].lower,axes[name].upper))
+		distance = abs(target-positions[name])
+		if distance > tolerance:
+			times[name] = axes[name].duration(distance)
+	return times
+
+def listSchedule(order,times,preceding,partners,concurrent):
+	# Start each move as soon as its constraints let it, the first in order first.
+	start, finish = {}, {}
+	waiting = list(order)
+	running = []
+	t = 0.0
+	while len(waiting) > 0:
+		running = [name for name in running if finish[name] > t+epsilon]
+		for name in list(waiting):
+			if (concurrent is not None) and (len(running) >= concurrent):
+				break
+			if any((other not in finish) or (finish[other] > t+epsilon) for other in preceding[name]):
+				continue
+			if any(other in running for other in partners[name]):
+				continue
+			start[name], finish[name] = t, t+times[name]
+			running.append(name)
+			waiting.remove(name)
+		if len(waiting) > 0:
+			later = [finish[name] for name in running if finish[name] > t+epsilon]
+			if len(later) == 0:
+				raise ValueError('The "before" constraints of axes %s form a loop.'%waiting)
+			t = min(later)
+	return start, finish
+
+def planMotion(axes,positions,targets,before=(),exclusive=(),concurrent=None,tolerance=1e-3):
+	'''
+	Fastest schedule from positions to targets (dicts of axis name: value, axes is a dict of name: axis).
+	- before, exclusive and concurrent constrain the moves (see the module)
+	- gives out a motionPlan
+	'''
+	times = durations(axes,positions,targets,tolerance)
+	preceding = {name:[a for a,b in before if (b == name) and (a in times)] for name in times}
+	partners = {name:set(other for group in exclusive if name in group for other in group if (other != name) and (other in times)) for name in times}
+
+	if len(times) == 0:
+		return motionPlan([],{})
+	if (len(before) == 0) and (len(exclusive) == 0) and (concurrent is None):
+		orders = [list(times)]
+	elif len(times) <= exhaustiveSize:
+		orders = itertools.permutations(times)
+	else:
+		orders = [sorted(times,key=lambda name: -times[name])]
+	best = None
+	for order in orders:
+		start, finish = listSchedule(order,times,preceding,partners,concurrent)
+		if (best is None) or (max(finish.values()) < max(best[1].values())-epsilon):
+			best = (start,finish)
+	start, finish = best
+
+	after = {}
+	for name in times:
+		# With a cap on moving axes any move that ended before this one started may have made room for it.
+		after[name] = [other for other in times if (other != name) and (finish[other] <= start[name]+epsilon) and
+			((other in preceding[name]) or (other in partners[name]) or (concurrent is not None))]
+	return motionPlan([(name,targets[name],start[name],finish[name]) for name in times],after)
+
+def sequentialPlan(axes,positions,targets,tolerance=1e-3):
+	times = durations(axes,positions,targets,tolerance)
+	moves, after, t = [], {}, 0.0
+	for name in times:
+		moves.append((name,targets[name],t,t+times[name]))
+		after[name] = [move[0] for move in moves[:-1]]
+		t += times[name]
+	return motionPlan(moves,after)
+
+async def execute(plan,controller,timeout=60.0):
+	'''Start each move once the moves it waits for are done. Gives out the final readback of each axis.'''
+	finished = {name:asyncio.Event() for name,target,start,finish in plan.moves}
+	readbacks = {}
+
+	async def run(name,target):
+		for other in plan.after[name]:
+			await finished[other].wait()
+		readbacks.update(await controller.move({name:target},timeout))
+		finished[name].set()
+
+	tasks = [asyncio.ensure_future(run(name,target)) for name,target,start,finish in plan.moves]
+	try:
+		await asyncio.gather(*tasks)
+	except BaseException:
+		# A move failed or the plan was cancelled, so nothing else starts or keeps moving.
+		for task in tasks:
+			task.cancel()
+		controller.stop([name for name,target,start,finish in plan.moves])
+		raise
+	return readbacks
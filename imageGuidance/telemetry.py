@@ -0,0 +1,146 @@
+import numpy as np
+import threading
+import time
+from syncmrt.imageGuidance.planning import knownMotors
+
+'''
+Readback telemetry: every sample of a set of PVs, with its time stamp, kept in preallocated ring buffers.
+	recorder(capacity)							A ring buffer of capacity samples for each PV, made as PVs are added.
+	recorder.monitor(pvname,name,connect)		Record a PV through channel access (time stamped by the IOC).
+	recorder.monitorKnown(kinds,connect)		Readbacks of the motors in listOfKnownMotorPVs.txt of some kinds (by
+												default tables and slits).
+	recorder.attach(name,motor)					Record a motion motor's readback (time stamped as it arrives).
+	recorder.latest(name)						(time, value) of the last sample, None before the first.
+	recorder.window(name,start,stop)			Times and values of the samples from start to stop (s since the epoch,
+												by default all that are kept).
+	simulatedSource(rate)						Stand-in for channel access, its PV(pvname,callback) gets a new value
+												at rate (Hz) from a thread of its own.
+
+Every buffer has a single writer (the acquisition thread) and no lock. The writer fills the next slot and then moves
+the sample count on. Readers copy what they need and then check the count: samples the writer may have come round to
+overwrite meanwhile are dropped (or read again, for the latest one), so a full buffer reads back capacity-1 samples.
+'''
+
+class ringBuffer:
+	def __init__(self,capacity=2**16):
+		self.capacity = int(capacity)
+		self.times = np.zeros(self.capacity,dtype=np.float64)
+		self.values = np.zeros(self.capacity,dtype=np.float64)
+		# Samples written since the start, the next one goes in slot count % capacity.
+		self.count = 0
+
+	def append(self,t,value):
+		i = self.count % self.capacity
+		self.times[i] = t
+		self.values[i] = value
+		self.count += 1
+
+	def latest(self):
+		while True:
+			count = self.count
+			if count == 0:
+				return None
+			i = (count-1) % self.capacity
+			sample = (float(self.times[i]),float(self.values[i]))
+			# Sample count-1 is overwritten by sample count-1+capacity.
+			if self.count < count-1+self.capacity:
+				return sample
+
+	def window(self,start=None,stop=None):
+		count = self.count
+		first = max(0,count-self.capacity)
+		a, b = first % self.capacity, count % self.capacity
+		if (b > a) or (count == first):
+			times, values = self.times[a:b].copy(), self.values[a:b].copy()
+		else:
+			times = np.concatenate((self.times[a:],self.times[:b]))
+			values = np.concatenate((self.values[a:],self.values[:b]))
+		# Drop the oldest samples if the writer got to their slots while they were copied.
+		overwritten = max(0,self.count-self.capacity+1-first)
+		times, values = times[overwritten:], values[overwritten:]
+		lower = 0 if start is None else np.searchsorted(times,start,side='left')
+		upper = len(times) if stop is None else np.searchsorted(times,stop,side='right')
+		return times[lower:upper], values[lower:upper]
+
+def epicsConnect(pvname,callback):
+	# Only needed on the beamline.
+	from epics import PV
+	return PV(pvname,callback=callback,auto_monitor=True)
+
+class recorder:
+	def __init__(self,capacity=2**16):
+		self.capacity = capacity
+		self.buffers = {}
+		# Channels are kept so their monitors stay alive.
+		self.channels = []
+
+	def buffer(self,name):
+		if name not in self.buffers:
+			self.buffers[name] = ringBuffer(self.capacity)
+		return self.buffers[name]
+
+	def monitor(self,pvname,name=None,connect=None):
+		append = self.buffer(pvname if name is None else name).append
+		def changed(value=None,timestamp=None,**kwargs):
+			append(time.time() if timestamp is None else timestamp,value)
+		self.channels.append((epicsConnect if connect is None else connect)(pvname,changed))
+
+	def monitorKnown(self,kinds=('TBL','SLM','SLW'),connect=None):
+		'''Monitor the readback (RBV) of the known motors whose device (e.g. TBL11, SLM22) is of one of kinds.'''
+		names = [base for base in knownMotors() if base.split(':')[0][-5:].startswith(kinds)]
+		for base in names:
+			self.monitor(base+'.RBV',name=base,connect=connect)
+		return names
+
+	def attach(self,name,motor):
+		append = self.buffer(name).append
+		motor.subscribe(lambda readback, done: append(time.time(),readback))
+
+	def latest(self,name):
+		return self.buffers[name].latest() if name in self.buffers else None
+
+	def window(self,name,start=None,stop=None):
+		return self.buffers[name].window(start,stop)
+
+class simulatedSource:
+	'''
+	Every PV made with PV(pvname,callback) follows a random walk, all of them are updated rate times a second and their
+	callbacks are called from one thread with pvname, value and timestamp keywords (as pyepics calls them).
+	'''
+	def __init__(self,rate=1000.0,seed=0):
+		self.rate = rate
+		self.rng = np.random.default_rng(seed)
+		self.callbacks = []
+		self.updates = 0
+		self.running = threading.Event()
+		self.thread = None
+
+	def PV(self,pvname,callback):
+		self.callbacks.append((pvname,callback))
+		return pvname
+
+	def start(self):
+		self.running.set()
+		self.thread = threading.Thread(target=self.run,daemon=True)
+		self.thread.start()
+
+	def stop(self):
+		self.running.clear()
+		if self.thread is not None:
+			self.thread.join()
+
+	def run(self):
+		values = np.zeros(len(self.callbacks))
+		period = 1.0/self.rate
+		due = time.perf_counter()
+		while self.running.is_set():
+			values += self.rng.normal(0,1e-3,len(values))
+			now = time.time()
+			for (pvname, callback), value in zip(self.callbacks,values.tolist()):
+				callback(pvname=pvname,value=value,timestamp=now)
+			self.updates += len(values)
+			# Keep to the rate on average, catching up without sleeping if behind.
+			due += period
+			delay = due-time.perf_counter()
+			if delay > 0:
+				time.sleep(delay)
@@ -40,12 +40,8 @@ class affineTransform:
 		self.r_ctd = centroid(self.r)
 
 		# Find the LEFT and RIGHT points in terms of their centroids (notation: LEFT Prime, RIGHT Prime)
-		self.lp = np.zeros([self.n,3])
-		self.rp = np.zeros([self.n,3])
-
-		for i in range(self.n):
-			self.lp[i,:] = np.subtract(self.l[i,:],self.l_ctd)
-			self.rp[i,:] = np.subtract(self.r[i,:],self.r_ctd)
+		self.lp = self.l - self.l_ctd
+		self.rp = self.r - self.r_ctd
 
 		# Find the quaternion matrix, N.
 		self.N = quaternion(self.lp,self.rp)
@@ -105,56 +101,79 @@ class affineTransform:
 
 	# Obtain scale factor between coordinate systems. Requires left and right points in reference to centroids.
 	def getscale(self):
-		D = np.zeros((self.n,1))
-		S_l = np.zeros((self.n,1))
-
-		for i in range(self.n):
-			D[i,0] = np.dot(np.array([self.rp[i,:]]),np.dot(self.R,np.array([self.lp[i,:]]).T))[0][0]
-			S_l[i,0] = np.linalg.norm(self.lp[i,:])**2
-
-		self.scale = np.sum(D)/np.sum(S_l)
-
-# Find the centroid of a set of points (pts).
+		# Sum of rp.(R lp) over sum of |lp|^2.
+		self.scale = np.sum(self.rp*np.dot(self.lp,self.R.T))/np.sum(self.lp**2)
+
+# Solve many point set pairs at once.
+def rigidTransform(leftCS,rightCS):
+	'''
+	Batched point based registration (Horn's quaternion method): right = R.left + t for every pair of point sets.
+	- leftCS and rightCS are (n,3) or a stack (batch,n,3) of corresponding points in mm
+	- gives out R (batch,3,3), t (batch,3), scale (batch) and residuals (batch,n), the distance (mm) of each right point
+	  from its fitted left point; the batch axis is dropped for a single pair
+	- scale is the least squares scale between the centred point sets (as affineTransform.scale), it isn't applied to R or t
+	'''
+	l = np.asarray(leftCS,dtype=float)
+	r = np.asarray(rightCS,dtype=float)
+	single = l.ndim == 2
+	if single:
+		l, r = l[None], r[None]
+
+	l_ctd = centroid(l)
+	r_ctd = centroid(r)
+	lp = l-l_ctd[:,None,:]
+	rp = r-r_ctd[:,None,:]
+
+	# Largest eigenvector of each N is the rotation quaternion.
+	val, vec = eigensolve(quaternion(lp,rp))
+	R = np.moveaxis(rotationmatrix(vec[...,0].T),-1,0)
+
+	fitted = np.einsum('bij,bnj->bni',R,lp)
+	scale = np.sum(rp*fitted,axis=(1,2))/np.sum(lp**2,axis=(1,2))
+	t = r_ctd-np.einsum('bij,bj->bi',R,l_ctd)
+	residuals = np.linalg.norm(rp-fitted,axis=2)
+
+	if single:
+		return R[0], t[0], scale[0], residuals[0]
+	return R, t, scale, residuals
+
+# Find the centroid of a set of points (pts), or of each set in a stack.
 def centroid(pts):
-	n = np.shape(pts)[0]
-	ctd = (1/n)*np.sum(pts,axis=0)
-	return ctd
+	return np.mean(pts,axis=-2)
 
-# Pass left and right coordinate system points in and pass out the matrix N.
+# Pass left and right coordinate system points in and pass out the matrix N (one per set for a stack of points).
 def quaternion(l,r):
 	# Calculate sum of products matrix, M.
-	M = np.dot(l.transpose(),r)
+	M = np.einsum('...ni,...nj->...ij',l,r)
 
 	# Calculate xx, xy, xz, yy ... zz. 
-	sxx = M[0,0]
-	sxy = M[0,1]
-	sxz = M[0,2]
-	syx = M[1,0]
-	syy = M[1,1]
-	syz = M[1,2]
-	szx = M[2,0]
-	szy = M[2,1]
-	szz = M[2,2]
+	sxx = M[...,0,0]
+	sxy = M[...,0,1]
+	sxz = M[...,0,2]
+	syx = M[...,1,0]
+	syy = M[...,1,1]
+	syz = M[...,1,2]
+	szx = M[...,2,0]
+	szy = M[...,2,1]
+	szz = M[...,2,2]
 
 	# Calculate N
-	N = np.array([[sxx+syy+szz, syz-szy, szx-sxz, sxy-syx],
-	[syz-szy, sxx-syy-szz, sxy+syx, szx+sxz],
-	[szx-sxz, sxy+syx, -sxx+syy-szz, syz+szy],
-	[sxy-syx, szx+sxz, syz+szy, -sxx-syy+szz]])
+	N = np.stack([np.stack([sxx+syy+szz, syz-szy, szx-sxz, sxy-syx],axis=-1),
+	np.stack([syz-szy, sxx-syy-szz, sxy+syx, szx+sxz],axis=-1),
+	np.stack([szx-sxz, sxy+syx, -sxx+syy-szz, syz+szy],axis=-1),
+	np.stack([sxy-syx, szx+sxz, syz+szy, -sxx-syy+szz],axis=-1)],axis=-2)
 
 	# Return the matrix N
 	return N
 
-#  Find the eigenvector and eigenvalue for a given matrix.
+#  Find the eigenvector and eigenvalue for a given matrix (or stack of them).
 def eigensolve(arr):
-	#  Find the eigen vector and value of the array, arr.
-	e, v = np.linalg.eig(arr)
-
-	#  Find the maximum eigen value and it's corresponding eigen vector.
-	val = np.amax(e)
-	ind = np.argmax(e)
-	i = np.unravel_index(ind,np.shape(e))
-	vec = v[:,i]
+	#  N is symmetric, eigh gives real eigenvalues in ascending order.
+	e, v = np.linalg.eigh(arr)
+
+	#  The maximum eigen value and it's corresponding eigen vector (as a column) are last.
+	val = e[...,-1]
+	vec = v[...,-1:]
 
 	# Return the maximum eigenvalue and corresponding eigenvector.
 	return val, vec
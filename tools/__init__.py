@@ -1 +1 @@
-from syncmrt.tools import cuda
\ No newline at end of file
+from syncmrt.tools import backends
@@ -0,0 +1,52 @@
+import importlib
+import os
+
+'''
+Registry of volume rotation engines. Nothing is imported (and no device is touched) until an engine is first requested.
+	register(name,module,cls,check)		Add an engine, module and cls are strings that are only imported on first use.
+	available()							List of the registered engines that can run on this machine.
+	engineClass(name)					Return the engine class, by default the first available engine (cuda, then cpu).
+	getEngine(name,**kwargs)			Return a new instance of the engine, e.g. getEngine().copyTexture(...).
+
+The environment variable SYNCMRT_ENGINE can be set to force an engine by name.
+'''
+
+def cudaCheck():
+	# Look for a device without creating a context (pycuda.autoinit does that when the module is loaded).
+	try:
+		import pycuda.driver as driver
+		driver.init()
+		return driver.Device.count() > 0
+	except Exception:
+		return False
+
+# Engines in order of preference: name -> (module, class, check).
+engines = {}
+# The engine chosen on first use.
+selected = None
+
+def register(name,module,cls,check=None):
+	engines[name] = (module,cls,check)
+
+def available():
+	return [name for name,(module,cls,check) in engines.items() if (check is None) or check()]
+
+def engineClass(name=None):
+	global selected
+	if name is None:
+		name = os.environ.get('SYNCMRT_ENGINE',None)
+	if name is None:
+		if selected is None:
+			selected = available()[0]
+		name = selected
+	if name not in engines:
+		raise KeyError('Unknown engine %s, expected one of %s.'%(name,list(engines)))
+
+	module, cls, check = engines[name]
+	return getattr(importlib.import_module(module),cls)
+
+def getEngine(name=None,**kwargs):
+	return engineClass(name)(**kwargs)
+
+register('cuda','syncmrt.tools.cuda','gpuInterface',check=cudaCheck)
+register('cpu','syncmrt.tools.cpu','cpuInterface')
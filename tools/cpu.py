@@ -0,0 +1,178 @@
+import numpy as np
+import os
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from syncmrt.tools.kernelCache import cache, sourceKey
+from syncmrt.tools.geometry import rotationMatrix, rotatedShape, rotatedExtent, rotatedIsocenter
+
+'''
+Starts a CPU interface with the same calls as the GPU interface (tools.cuda.gpuInterface).
+	copyTexture(data,dimensions)			Holds the data in host memory for processing.
+	rotate(x,y,z,order='xyz',others...)		X controls vertical axis rotation, Y controls horizontal axis rotation, Z controls into page axis rotation.
+	warmKernel(workers)						Compile the numba kernel now (or load it from numba's file cache).
+
+The rotation mirrors the rotate3D.c kernel: every input voxel is rotated about the array center and
+written to the nearest output voxel. If numba is installed the loop is JIT-compiled (once per process, see
+tools.kernelCache) and run over all cores. The compiled kernel is also kept in numba's file cache, so other
+processes load it rather than compile it again. Otherwise the input is split into tiles along the first axis and
+the tiles are processed on a thread pool (numpy releases the GIL for the heavy lifting).
+'''
+
+# Number of voxels each thread works on at a time.
+tileSize = 2**20
+
+class cpuInterface:
+	def __init__(self,workers=None,jit=True):
+		self.arrIn = None
+		self.arrOut = None
+		# Number of threads to use, defaults to every core.
+		if workers is None:
+			workers = os.cpu_count() or 1
+		self.workers = workers
+		# Use the numba kernel when it is available.
+		self.jit = jit
+
+	def copyTexture(self,data, pixelSize=None, extent=None, isocenter=None):
+		# Convert data to float32 array in Contiguous ordering (only read, so data that already is, e.g. a shared memory
+		# block, isn't copied).
+		self.arrIn = np.ascontiguousarray(data,dtype=np.float32)
+
+		self.pixelSize = pixelSize
+		self.isocenter = isocenter
+		# Extent[l,r,b,t,f,b]
+		self.extent = extent
+		# Trigger for setting bottom left corner as 0,0,0.
+		self.zeroExtent = False
+
+	def rotate(self,x,y,z,order='xyz',x1=None,y1=None,z1=None):
+		# Compute rotation matrix, R.
+		R = rotationMatrix(x,y,z,order=order,z1=z1)
+
+		# Get outshape by taking bounding box of vertice points.
+		outShape = rotatedShape(self.arrIn.shape,R)
+		self.arrOut = np.zeros(outShape,dtype=np.float32,order='C')
+
+		kernel = None
+		if self.jit:
+			kernel = jitKernel(self.workers)
+
+		if kernel is not None:
+			kernel(self.arrIn,self.arrOut,R)
+		else:
+			self.rotateTiles(R)
+
+		# Find new isocenter.
+		self.isocenter = rotatedIsocenter(self.isocenter,R)
+
+		# Find new extent.
+		extent = None
+		if (not(self.pixelSize is None)) & (not(self.extent is None)):
+			extent = rotatedExtent(self.extent,R)
+
+		# Send back array out, extent.
+		return self.arrOut, extent
+
+	def rotateTiles(self,R):
+		'''Numpy fallback: rotate tiles of the first axis on the thread pool.'''
+		# Split the first axis into tiles of roughly tileSize voxels.
+		rows = max(1,tileSize//int(np.prod(self.arrIn.shape[1:])))
+		tiles = [(start,min(start+rows,self.arrIn.shape[0])) for start in range(0,self.arrIn.shape[0],rows)]
+
+		if (self.workers > 1) & (len(tiles) > 1):
+			with ThreadPoolExecutor(max_workers=self.workers) as pool:
+				list(pool.map(lambda tile: rotateTile(self.arrIn,self.arrOut,R,*tile),tiles))
+		else:
+			for tile in tiles:
+				rotateTile(self.arrIn,self.arrOut,R,*tile)
+
+def jitKernel(workers):
+	'''Numba version of rotateTile, compiled once per process. None when numba is not installed.'''
+	try:
+		import numba
+	except ImportError:
+		return None
+	parallel = workers > 1
+	if parallel:
+		threads = min(workers,numba.config.NUMBA_NUM_THREADS)
+		if numba.get_num_threads() != threads:
+			numba.set_num_threads(threads)
+	return cache.get(rotateKernelKeys[parallel],lambda: buildRotateKernel(numba,parallel))
+
+def warmKernel(workers=None):
+	'''Compile (or load) the numba kernel for workers threads by rotating a tiny volume.'''
+	engine = cpuInterface(workers=workers)
+	engine.copyTexture(np.zeros((2,2,2),dtype=np.float32))
+	engine.rotate(0,0,0)
+
+def buildRotateKernel(numba,parallel):
+	# Also tells the serial and parallel kernels apart in numba's file cache (it only looks at what the kernel uses).
+	prange = numba.prange if parallel else range
+
+	def rotate(arrIn,arrOut,R):
+		texX, texY, texZ = arrIn.shape
+		outX, outY, outZ = arrOut.shape
+		out = arrOut.reshape(-1)
+		size = outX*outY*outZ
+
+		# Center array (new origin) and the origin of the output shape.
+		tex0 = np.float32((texX-1)/2)
+		tex1 = np.float32((texY-1)/2)
+		tex2 = np.float32((texZ-1)/2)
+		out0 = np.float32((outX-1)/2)
+		out1 = np.float32((outY-1)/2)
+		out2 = np.float32((outZ-1)/2)
+
+		for x in prange(texX):
+			i = np.float32(x) - tex0
+			for y in range(texY):
+				j = np.float32(y) - tex1
+				for z in range(texZ):
+					k = np.float32(z) - tex2
+					# Rotate points and relocate them in the output shape, rounding half away from zero.
+					p0 = i*R[0,0] + j*R[0,1] + k*R[0,2] + out0
+					p1 = i*R[1,0] + j*R[1,1] + k*R[1,2] + out1
+					p2 = i*R[2,0] + j*R[2,1] + k*R[2,2] + out2
+					n0 = np.int64(np.trunc(p0 + np.copysign(np.float32(0.5),p0)))
+					n1 = np.int64(np.trunc(p1 + np.copysign(np.float32(0.5),p1)))
+					n2 = np.int64(np.trunc(p2 + np.copysign(np.float32(0.5),p2)))
+					idx = n2 + outZ*n1 + outZ*outY*n0
+					if (idx >= 0) and (idx < size):
+						out[idx] = arrIn[x,y,z]
+
+	try:
+		# Saved next to this file (or in the user's cache), so other processes (e.g. a pool rotating the beams) load it.
+		return numba.njit(parallel=parallel,cache=True)(rotate)
+	except RuntimeError:
+		# Nowhere to save it.
+		return numba.njit(parallel=parallel)(rotate)
+
+# Cache keys of the serial and parallel kernels, the source is only read once.
+rotateKernelKeys = {parallel: sourceKey(inspect.getsource(buildRotateKernel),engine='numba',parallel=parallel)
+	for parallel in (False,True)}
+
+def rotateTile(arrIn,arrOut,R,start,stop):
+	'''Rotate the input voxels in rows start:stop of arrIn into arrOut (same maths as rotate3D.c).'''
+	texShape = np.array(arrIn.shape,dtype=np.float32)
+	outShape = np.array(arrOut.shape,dtype=np.float32)
+
+	# Center array (new origin) and the origin of the output shape.
+	texOrigin = (texShape-1)/2
+	outOrigin = (outShape-1)/2
+
+	# Adjust for origin.
+	i = (np.arange(start,stop,dtype=np.float32)-texOrigin[0])[:,None,None]
+	j = (np.arange(arrIn.shape[1],dtype=np.float32)-texOrigin[1])[None,:,None]
+	k = (np.arange(arrIn.shape[2],dtype=np.float32)-texOrigin[2])[None,None,:]
+
+	# Rotate points and relocate them in the output shape, building the flat index as we go.
+	strides = (arrOut.shape[1]*arrOut.shape[2], arrOut.shape[2], 1)
+	idx = np.zeros((stop-start,)+arrIn.shape[1:],dtype=np.int64)
+	for axis in range(3):
+		point = i*R[axis][0] + j*R[axis][1] + k*R[axis][2] + outOrigin[axis]
+		# Round half away from zero (as roundf does).
+		point = np.trunc(point + np.copysign(np.float32(0.5),point))
+		idx += point.astype(np.int64)*strides[axis]
+
+	# Only write voxels that land inside the output array.
+	valid = (idx >= 0) & (idx < arrOut.size)
+	arrOut.reshape(-1)[idx[valid]] = arrIn[start:stop][valid]
@@ -3,9 +3,8 @@ import pycuda.gpuarray as gpuarray
 import pycuda.autoinit
 from pycuda.compiler import SourceModule
 import numpy as np
-import site
-from math import sin, cos
-from syncmrt.tools.quaternions import quaternionMath as q
+from syncmrt.tools.kernelCache import cache, sourceKey, kernelSource
+from syncmrt.tools.geometry import rotationMatrix, rotatedShape, rotatedExtent, rotatedIsocenter
 
 '''
 Starts a GPU interface that we can run kernels from.
@@ -56,61 +55,12 @@ class gpuInterface:
 
 	def rotate(self,x,y,z,order='xyz',x1=None,y1=None,z1=None):
 		# Eventually send a list xyz and compute R based on order dynamically...
-		# Initialise Kernel
-		fp = site.getsitepackages()[0]
-		mod = SourceModule(open(fp+"/syncmrt/tools/cudaKernels/rotate3D.c", "r").read(),keep=True)
-
-		# Default axes.
-		xaxis = np.array(([1,0,0]))
-		yaxis = np.array(([0,1,0]))
-		zaxis = np.array(([0,0,1]))
-
-		if order == 'pat-gant-col':
-			# All angles should go in opposite direction to DICOM standard.
-			# z 	patient support angle
-			# x 	gantry angle
-			# z1 	collimator angle
-
-			rz = q.rotation(z,axis=zaxis)
-			# rx = q.rotation(x,axis=xaxis)
-			# rxi = q.inverse(rx)
-			# tempaxis = q.quaternion(zaxis)
-			# newaxis = q.product(q.product(rx,tempaxis),rxi)
-			# newaxis = np.absolute(newaxis)
-			# rz1 = q.rotation(z1,axis=newaxis[1:])
-
-			# print('newaxis')
-			# print(newaxis)
-
-			# world = q.product(rx,rz)
-			# rotation = q.product(world,rz1)
-			
-			rzi = q.inverse(rz)
-			rz1 = q.rotation(z+z1,axis=zaxis)
-			tempaxis = q.quaternion(xaxis)
-			newaxis = q.product(q.product(rz,tempaxis),rzi)
-			print('newaxis')
-			print(newaxis)
-			rx = q.rotation(x,axis=newaxis[1:])
-			rotation = q.product(rz1,rx)
-
-			R = q.euler(rotation)
-
-			print('rotation')
-			print(R)
-			print('')
-
-		else:
-			# Assume xyz.
-			rx = q.rotation(x,axis=xaxis)
-			ry = q.rotation(y,axis=yaxis)
-			rz = q.rotation(z,axis=zaxis)
-
-			rotation = q.product(q.product(rx,ry),rz)
-			R = q.euler(rotation)
-
-		# Force float32 before we send to c.
-		R = np.float32(R)
+		# Initialise Kernel (compiled once per process).
+		source = kernelSource('rotate3D.c')
+		mod = cache.get(sourceKey(source,keep=True),lambda: SourceModule(source,keep=True))
+
+		# Compute rotation matrix, R.
+		R = rotationMatrix(x,y,z,order=order,z1=z1)
 
 		# Load the *.c function.
 		func = mod.get_function("rotate")
@@ -123,22 +73,7 @@ class gpuInterface:
 		texShape = np.array(self.arrIn.shape).astype(np.float32)
 
 		# Get outshape by taking bounding box of vertice points.
-		vert000 = np.array([0,0,0])
-		vert100 = np.dot(np.array((texShape[0],0,0)),R)
-		vert010 = np.dot(np.array((0,texShape[1],0)),R)
-		vert110 = np.dot(np.array((texShape[0],texShape[1],0)),R)
-		vert001 = np.dot(np.array((0,0,texShape[2])),R)
-		vert101 = np.dot(np.array((texShape[0],0,texShape[2])),R)
-		vert011 = np.dot(np.array((0,texShape[1],texShape[2])),R)
-		vert111 = np.dot(texShape,R)
-		vertices = np.vstack([vert000,vert100,vert010,vert110,vert001,vert101,vert011,vert111])
-
-		# Find minimum and maximum vertice points.
-		minimum = np.amin(vertices,axis=0)
-		maximum = np.amax(vertices,axis=0)
-		# Find the difference between the two as a whole number.
-		shape = maximum-minimum
-		outShape = np.rint(shape).astype(np.int32)
+		outShape = rotatedShape(self.arrIn.shape,R)
 		# Set shape (as float32 for cuda)
 		self.arrOut = np.zeros(outShape,dtype=np.float32,order='C')
 
@@ -166,64 +101,12 @@ class gpuInterface:
 			texrefs=[tex])
 
 		# Find new isocenter.
-		if (not(self.isocenter is None)):
-			self.isocenter = np.dot(self.isocenter,R)
+		self.isocenter = rotatedIsocenter(self.isocenter,R)
 
 		# Find new extent.
-		if (not(self.pixelSize is None)) & (not(self.extent is None)):			
-			# Row col depth is YXZ.
-			row,col,depth = self.arrOut.shape
-
-			# New extent vertices.
-			v000 = np.dot(np.array([self.extent[2],self.extent[0],self.extent[4]]),R)
-			v001 = np.dot(np.array([self.extent[2],self.extent[0],self.extent[5]]),R)
-			v010 = np.dot(np.array([self.extent[3],self.extent[0],self.extent[4]]),R)
-			v011 = np.dot(np.array([self.extent[3],self.extent[0],self.extent[5]]),R)
-			v100 = np.dot(np.array([self.extent[2],self.extent[1],self.extent[4]]),R)
-			v101 = np.dot(np.array([self.extent[2],self.extent[1],self.extent[5]]),R)
-			v110 = np.dot(np.array([self.extent[3],self.extent[1],self.extent[4]]),R)
-			v111 = np.dot(np.array([self.extent[3],self.extent[1],self.extent[5]]),R)
-			vertices = np.vstack([v000,v001,v010,v011,v100,v101,v110,v111])
-
-			# New extent vertices.
-			o000 = np.dot(np.array([-1,-1,-1]),R)
-			o001 = np.dot(np.array([-1,-1, 1]),R)
-			o010 = np.dot(np.array([ 1,-1,-1]),R)
-			o011 = np.dot(np.array([ 1,-1, 1]),R)
-			o100 = np.dot(np.array([-1, 1,-1]),R)
-			o101 = np.dot(np.array([-1, 1, 1]),R)
-			o110 = np.dot(np.array([ 1, 1,-1]),R)
-			o111 = np.dot(np.array([ 1, 1, 1]),R)
-			orientation = np.vstack([o000,o001,o010,o011,o100,o101,o110,o111])
-
-			minimum = np.argmin(orientation,axis=0)
-			maximum = np.argmax(orientation,axis=0)
-
-			blf = np.array([vertices[minimum[0],0],
-				vertices[minimum[1],1],
-				vertices[minimum[2],2]
-				])
-
-			trb = np.array([vertices[maximum[0],0],
-				vertices[maximum[1],1],
-				vertices[maximum[2],2]
-				])
-
-			# New extent (l,r,b,t,f,b).
-			extent = np.array([
-				blf[1],	trb[1],
-				blf[0],	trb[0],
-				blf[2],	trb[2]
-				])
-
-			# print('Params')
-			# print(vertices)
-			# print(orientation)
-			# print(minimum)
-			# print(maximum)
-			# print(blf)
-			# print(trb)
-			# print('')
-
-		 # Send back array out, extent.
-		return self.arrOut, extent
\ No newline at end of file
+		extent = None
+		if (not(self.pixelSize is None)) & (not(self.extent is None)):
+			extent = rotatedExtent(self.extent,R)
+
+		# Send back array out, extent.
+		return self.arrOut, extent
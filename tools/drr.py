@@ -0,0 +1,491 @@
+import numpy as np
+import os
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from scipy import ndimage
+from syncmrt.tools.kernelCache import cache, sourceKey
+from syncmrt.tools.geometry import rotationMatrix, axisExtent
+
+'''
+Digitally reconstructed radiographs (DRRs) ray cast straight through the CT, without rotating the volume.
+	beamGeometry(R,isocenter,...)		Orientation of a beam (rotation R, as used by the rotation engines) and its
+										parallel (synchrotron) or divergent (source/detector distances) geometry.
+	beamGeometry.fromAngles(...)		Geometry from gantry, patient support and collimator angles (deg).
+	beamGeometry.fromViews(...)			Geometry of every view of an arc, from (n,3) angles and isocenters.
+	drrEngine(volume,extent)			Holds the CT; extent (l,r,b,t,f,b) in mm as the rotation engines give it.
+	drrEngine.project(beams)			DRR image and extent for every beam, all rays of all beams in one batch.
+	drrEngine.sweep(beams,arc)			DRRs (views,u,v, float32) and extent of views that differ only in orientation
+										and isocenter (e.g. every step of an arc), all on one detector. arc=False
+										casts every view ray by ray even when they make an arc.
+
+Rays are clipped to the CT and sampled with trilinear (or nearest voxel) interpolation, the sum is scaled by the step
+length in voxels so a parallel DRR is comparable to summing a rotated volume along its depth. Points outside the CT
+count as background (0, as the rotation padding). With numba installed the rays are cast by a compiled kernel over all cores, otherwise tiles of rays are
+interpolated with scipy on a thread pool.
+
+A sweep sizes its detector and depth range to the sphere around the isocenter that holds the whole CT, so every view
+has the same rays in the BEV. A ray's start and step are then linear in its detector pixel: each view only needs its
+first ray and how that changes along u and v (six vectors, found from the view's rotation), the kernel makes and clips
+the rays of all views from those without any per ray setup.
+
+Parallel views that all turn about one axis across the beam, about one isocenter (a coplanar arc, the collimator and
+patient support held), lie in the same planes across that axis. The CT is then resampled once into slices across the
+axis and each slice is projected for every view while it is in cache (a sinogram per slice). Every view's DRR is read
+from the sinograms through the same map (detector pixel to slice and lateral position). The slices and their sinograms
+are made a block at a time, only the DRRs are held whole.
+'''
+
+# Number of samples interpolated per tile on the scipy path.
+tileSize = 2**22
+# Number of values in a block of an arc's slices (and in their sinograms).
+blockSize = 2**24
+
+def threads(workers=None):
+	if workers is None:
+		workers = os.cpu_count() or 1
+	return workers
+
+class beamGeometry:
+	def __init__(self,R,isocenter=None,mode='parallel',sad=None,sid=None,pixelSize=None,step=None):
+		# Rotation from the CT into the beam's eye view (BEV axis 2 points along the beam).
+		self.R = np.array(R,dtype=float)
+		self.isocenter = None if isocenter is None else np.array(isocenter,dtype=float)
+		# 'parallel' or 'divergent' (needs the source to isocenter and source to detector distances, mm).
+		self.mode = mode
+		self.sad = sad
+		self.sid = sid
+		# Detector pixel size and sample step (mm), default to the smallest voxel size (magnified onto the detector).
+		self.pixelSize = pixelSize
+		self.step = step
+		if (mode == 'divergent') & ((sad is None) | (sid is None)):
+			raise ValueError('Divergent beams need a source to isocenter (sad) and source to detector (sid) distance.')
+
+	@classmethod
+	def fromAngles(cls,gantry,patientSupport,collimator,**kwargs):
+		# Same rotation gpuInterface.rotate applies for a treatment beam.
+		return cls(rotationMatrix(gantry,0,patientSupport,order='pat-gant-col',z1=collimator),**kwargs)
+
+	@classmethod
+	def fromViews(cls,angles,isocenters,**kwargs):
+		# All rotations in one call.
+		angles = np.array(angles,dtype=float)
+		R = rotationMatrix(angles[:,0],0,angles[:,1],order='pat-gant-col',z1=angles[:,2])
+		return [cls(r,isocenter=c,**kwargs) for r, c in zip(R,isocenters)]
+
+class drrEngine:
+	def __init__(self,volume,extent,order=1,workers=None,jit=True):
+		self.volume = np.ascontiguousarray(volume,dtype=np.float32)
+		# Rays are cast along the array axes.
+		extent = axisExtent(extent)
+		shape = np.array(self.volume.shape)
+		self.spacing = (extent[1::2]-extent[0::2])/shape
+		# Centre of the first voxel and of the whole volume (mm).
+		self.origin = extent[0::2]+0.5*self.spacing
+		self.center = extent[0::2]+0.5*(extent[1::2]-extent[0::2])
+		self.corners = np.array([[extent[2*a+c[a]] for a in range(3)] for c in np.ndindex(2,2,2)])
+		# Interpolation: 1 trilinear, 0 nearest voxel (faster, as the rotation engines resample).
+		self.order = order
+		self.workers = threads(workers)
+		self.jit = jit
+
+	def rays(self,beam):
+		'''Start, step, weight and number of samples of every ray (in voxel coordinates), the detector shape and extent.'''
+		isocenter = self.center if beam.isocenter is None else beam.isocenter
+		pixel = float(np.amin(np.absolute(self.spacing))) if beam.pixelSize is None else float(beam.pixelSize)
+		if (beam.mode == 'divergent') & (beam.pixelSize is None):
+			# Keep the resolution at the isocenter, the detector sees the volume magnified.
+			pixel *= float(beam.sid)/float(beam.sad)
+		step = float(np.amin(np.absolute(self.spacing))) if beam.step is None else float(beam.step)
+
+		# Volume corners in the BEV frame, the depth range to sample is the volume's.
+		corners = np.dot(self.corners-isocenter,beam.R.T)
+		near, far = np.amin(corners[:,2]), np.amax(corners[:,2])
+		samples = max(1,int(np.ceil((far-near)/step)))
+
+		if beam.mode == 'divergent':
+			# Source on the beam axis, detector plane at sid from the source. Project the corners onto the detector.
+			source = np.array([0,0,-float(beam.sad)])
+			plane = float(beam.sid)-float(beam.sad)
+			scale = (plane-source[2])/(corners[:,2]-source[2])
+			footprint = corners[:,:2]*scale[:,None]
+		else:
+			footprint = corners[:,:2]
+
+		lower = np.amin(footprint,axis=0)
+		shape = np.maximum(1,np.ceil((np.amax(footprint,axis=0)-lower)/pixel).astype(int))
+		u = lower[0]+(np.arange(shape[0])+0.5)*pixel
+		v = lower[1]+(np.arange(shape[1])+0.5)*pixel
+		uu, vv = np.meshgrid(u,v,indexing='ij')
+		n = uu.size
+
+		if beam.mode == 'divergent':
+			# Rays from the source to each detector pixel, sampled at even depths through the volume.
+			target = np.column_stack([uu.ravel(),vv.ravel(),np.full(n,plane)])
+			direction = (target-source)/(plane-source[2])
+			start = source+direction*(near+0.5*step-source[2])
+			delta = direction*step
+		else:
+			start = np.column_stack([uu.ravel(),vv.ravel(),np.full(n,near+0.5*step)])
+			delta = np.tile([0,0,step],(n,1))
+
+		# Back into CT voxel coordinates.
+		start = (np.dot(start,beam.R)+isocenter-self.origin)/self.spacing
+		delta = np.dot(delta,beam.R)/self.spacing
+		weight = np.linalg.norm(delta*self.spacing,axis=1)/np.amin(np.absolute(self.spacing))
+		start, samples = self.clip(start,delta,samples)
+
+		extent = np.array([lower[0],lower[0]+shape[0]*pixel,lower[1],lower[1]+shape[1]*pixel])
+		return start, delta, weight, samples, tuple(shape), extent
+
+	def clip(self,start,delta,samples):
+		'''Move each ray's start to where it enters the volume and count the samples until it leaves.'''
+		upper = np.array(self.volume.shape)-1
+		with np.errstate(divide='ignore',invalid='ignore'):
+			a = -start/delta
+			b = (upper-start)/delta
+		still = delta == 0
+		inside = (start >= 0) & (start <= upper)
+		# Axes the ray doesn't move along are either always or never inside.
+		a[still] = np.where(inside[still],-np.inf,np.inf)
+		b[still] = np.where(inside[still],np.inf,-np.inf)
+		first = np.maximum(0,np.ceil(np.amax(np.minimum(a,b),axis=1)))
+		last = np.minimum(samples-1,np.floor(np.amin(np.maximum(a,b),axis=1)))
+		count = np.maximum(0,last-first+1).astype(np.int64)
+		first[count == 0] = 0
+		return start+first[:,None]*delta, count
+
+	def project(self,beams):
+		# Every ray of every beam goes into one batch.
+		batch = [self.rays(beam) for beam in beams]
+		start = np.concatenate([b[0] for b in batch])
+		delta = np.concatenate([b[1] for b in batch])
+		weight = np.concatenate([b[2] for b in batch])
+		samples = np.concatenate([b[3] for b in batch])
+
+		kernel = jitKernel(self.workers,self.order) if self.jit else None
+		if kernel is not None:
+			out = np.zeros(len(start),dtype=np.float64)
+			kernel(self.volume,start,delta,samples,out)
+		else:
+			out = self.castTiles(start,delta,samples)
+		out *= weight
+
+		images = []
+		offset = 0
+		for b in batch:
+			n = int(np.prod(b[4]))
+			images.append((out[offset:offset+n].reshape(b[4]),b[5]))
+			offset += n
+		return images
+
+	def sweep(self,beams,arc=True):
+		# Views share the first beam's mode, distances, pixel size and step.
+		beam = beams[0]
+		pixel = float(np.amin(np.absolute(self.spacing))) if beam.pixelSize is None else float(beam.pixelSize)
+		step = float(np.amin(np.absolute(self.spacing))) if beam.step is None else float(beam.step)
+		isocenters = np.array([self.center if b.isocenter is None else b.isocenter for b in beams],dtype=float)
+		R = np.array([b.R for b in beams],dtype=float)
+
+		# Sphere (about any of the isocenters) the CT fits in, whatever the orientation.
+		radius = float(np.amax(np.linalg.norm(self.corners[None,:,:]-isocenters[:,None,:],axis=2)))
+		samples = max(1,int(np.ceil(2*radius/step)))
+		near = -radius+0.5*step
+		if beam.mode == 'divergent':
+			sad, sid = float(beam.sad), float(beam.sid)
+			if sad <= radius:
+				raise ValueError('The source (sad %.0f mm) is inside the CT (radius %.0f mm).'%(sad,radius))
+			if beam.pixelSize is None:
+				pixel *= sid/sad
+			# Largest magnification is at the near side of the sphere.
+			half = radius*sid/(sad-radius)
+		else:
+			half = radius
+		shape = (max(1,int(np.ceil(2*half/pixel))),)*2
+		lower = -0.5*shape[0]*pixel
+		first = lower+0.5*pixel
+
+		# Ray (i,j) in the BEV: start a+i*du+j*dv, step d+i*e+j*f.
+		if beam.mode == 'divergent':
+			depth = near+sad
+			bev = np.array([[depth*first/sid,depth*first/sid,near],[depth*pixel/sid,0,0],[0,depth*pixel/sid,0],
+				[step*first/sid,step*first/sid,step],[step*pixel/sid,0,0],[0,step*pixel/sid,0]])
+			u = first+np.arange(shape[0])*pixel
+			direction = np.sqrt(1+(u[:,None]**2+u[None,:]**2)/sid**2)
+			weight = step*direction/np.amin(np.absolute(self.spacing))
+		else:
+			bev = np.array([[first,first,near],[pixel,0,0],[0,pixel,0],[0,0,step],[0,0,0],[0,0,0]])
+			weight = np.full(shape,step/np.amin(np.absolute(self.spacing)))
+
+		# Into CT voxel coordinates for every view, only the first ray's start moves with the isocenter.
+		frames = np.einsum('ka,vab->vkb',bev,R)
+		frames[:,0] += isocenters-self.origin
+		frames /= self.spacing
+
+		kernel = jitKernel(self.workers,self.order,buildSweepKernel) if self.jit else None
+		axis = arcAxis(R) if arc & (beam.mode == 'parallel') & np.allclose(isocenters,isocenters[0]) else None
+		if (kernel is not None) & (axis is not None):
+			out = self.sweepArc(R,isocenters[0],axis,shape,first,pixel,step)
+		elif kernel is not None:
+			out = np.zeros((len(beams),)+shape,dtype=np.float32)
+			kernel(self.volume,np.ascontiguousarray(frames),samples,out)
+		else:
+			out = np.zeros((len(beams),)+shape,dtype=np.float32)
+			for k, frame in enumerate(frames):
+				out[k] = self.castFrame(frame,shape,samples)
+		out *= weight
+
+		extent = np.array([lower,-lower,lower,-lower])
+		return out, extent
+
+	def sweepArc(self,R,isocenter,axis,shape,first,pixel,step):
+		'''Sweep of a coplanar parallel arc through sinograms of slices across its axis (see the module notes).'''
+		# Slice frame about the isocenter, step apart: along the axis (n), the first beam (a) and n x a (b).
+		n = axis
+		a = R[0,2]/np.linalg.norm(R[0,2])
+		b = np.cross(n,a)
+		B = np.array([n,a,b])
+		corners = np.dot(self.corners-isocenter,B.T)
+		lower = np.amin(corners,axis=0)
+		# One more row and column than the CT needs, the kernel interpolates into them without bounds checks.
+		size = np.ceil((np.amax(corners,axis=0)-lower)/step).astype(int)+[1,2,2]
+
+		# Each view's beam in the slice plane (a,b), the kernel casts across it at every lateral position.
+		beams = np.column_stack([np.dot(R[:,2],a),np.dot(R[:,2],b)])
+		beams /= np.linalg.norm(beams,axis=1)[:,None]
+		radius = float(np.amax(np.linalg.norm(corners,axis=1)))
+		positions = int(np.ceil(2*radius/step))+1
+		sinogram, detector = jitKernel(self.workers,self.order,buildArcKernels)
+
+		# Detector pixel to slice and lateral position (in steps), the same for every view as they only turn about n.
+		u = first+np.arange(shape[0])*pixel
+		lateral = np.cross(n,R[0,2])
+		lateral /= np.linalg.norm(lateral)
+		section = (u[:,None]*np.dot(R[0,0],n)+u[None,:]*np.dot(R[0,1],n)-lower[0])/step
+		position = (u[:,None]*np.dot(R[0,0],lateral)+u[None,:]*np.dot(R[0,1],lateral)+radius)/step
+
+		# A block of slices at a time (with the next block's first, the detector interpolates between slices), so
+		# neither the resampled CT nor its sinograms are ever held whole. Each pixel is read from the block its slice is in.
+		rows = max(self.workers,min(blockSize//int(size[1]*size[2]),blockSize//(len(R)*positions)))
+		out = np.zeros((len(R),)+tuple(shape),dtype=np.float32)
+		for start in range(0,size[0],rows):
+			count = min(start+rows+1,size[0])-start
+			slices = self.resample(B,isocenter,lower+[start*step,0,0],step,(count,size[1],size[2]))
+			sinograms = np.zeros((count,len(R),positions),dtype=np.float32)
+			sinogram(slices,np.ascontiguousarray(beams),-radius/step,lower[1:]/step,sinograms)
+			detector(sinograms,section-start,position,min(rows,count),out)
+		return out
+
+	def resample(self,B,isocenter,lower,step,shape):
+		'''The CT on a grid step apart along the rows of B from lower (mm about the isocenter), in slabs on the thread pool.'''
+		matrix = (step*B/self.spacing[None,:]).T
+		offset = (isocenter-self.origin+np.dot(lower,B))/self.spacing
+		out = np.zeros(shape,dtype=np.float32)
+		rows = max(1,-(-shape[0]//self.workers))
+
+		def slab(start):
+			stop = min(start+rows,shape[0])
+			ndimage.affine_transform(self.volume,matrix,offset=offset+matrix[:,0]*start,output_shape=(stop-start,)+shape[1:],
+				output=out[start:stop],order=self.order,mode='constant',cval=0.0)
+
+		with ThreadPoolExecutor(max_workers=self.workers) as pool:
+			list(pool.map(slab,range(0,shape[0],rows)))
+		return out
+
+	def castFrame(self,frame,shape,samples):
+		'''Scipy fallback for one view of a sweep.'''
+		i, j = np.meshgrid(np.arange(shape[0]),np.arange(shape[1]),indexing='ij')
+		i, j = i.reshape(-1,1), j.reshape(-1,1)
+		start = frame[0]+i*frame[1]+j*frame[2]
+		delta = frame[3]+i*frame[4]+j*frame[5]
+		start, count = self.clip(start,delta,samples)
+		return self.castTiles(start,delta,count).reshape(shape)
+
+	def castTiles(self,start,delta,samples):
+		'''Scipy fallback: interpolate tiles of rays on the thread pool.'''
+		out = np.zeros(len(start),dtype=np.float64)
+		rows = max(1,tileSize//max(1,int(np.amax(samples,initial=0))))
+
+		def cast(first):
+			last = min(first+rows,len(start))
+			n = int(np.amax(samples[first:last]))
+			if n == 0:
+				return
+			steps = np.arange(n)
+			points = start[first:last,None,:]+steps[None,:,None]*delta[first:last,None,:]
+			values = ndimage.map_coordinates(self.volume,points.reshape(-1,3).T,order=self.order,mode='constant',cval=0.0)
+			values = values.reshape(last-first,n)
+			# Rays cross different lengths of the volume.
+			values[steps[None,:] >= samples[first:last,None]] = 0
+			out[first:last] = np.sum(values,axis=1)
+
+		firsts = range(0,len(start),rows)
+		if (self.workers > 1) & (len(firsts) > 1):
+			with ThreadPoolExecutor(max_workers=self.workers) as pool:
+				list(pool.map(cast,firsts))
+		else:
+			for first in firsts:
+				cast(first)
+		return out
+
+def jitKernel(workers,order=1,build=None):
+	'''Numba kernel made by build (the ray caster by default), compiled once per process and interpolation order. None
+	when numba is not installed.'''
+	try:
+		import numba
+	except ImportError:
+		return None
+	if build is None:
+		build = buildRayKernel
+	parallel = workers > 1
+	if parallel:
+		threads = min(workers,numba.config.NUMBA_NUM_THREADS)
+		if numba.get_num_threads() != threads:
+			numba.set_num_threads(threads)
+	key = sourceKey(kernelSources[build],engine='numba',parallel=parallel,order=order)
+	return cache.get(key,lambda: build(numba,parallel,order))
+
+def arcAxis(R,tolerance=1e-4):
+	'''Axis (unit vector) every view of R turns about, across all of their beams (R[:,2]), or None if there isn't one.'''
+	beams = R[:,2]
+	turns = np.cross(beams[0],beams)
+	k = int(np.argmax(np.linalg.norm(turns,axis=1)))
+	if np.linalg.norm(turns[k]) < tolerance:
+		return None
+	axis = turns[k]/np.linalg.norm(turns[k])
+	# The beams are across the axis and the detector axes keep their angle to it.
+	if np.amax(np.absolute(np.dot(beams,axis))) > tolerance:
+		return None
+	for row in (0,1):
+		if np.amax(np.absolute(np.dot(R[:,row],axis)-np.dot(R[0,row],axis))) > tolerance:
+			return None
+	return axis
+
+def buildSampler(numba,order):
+	'''Value of the volume at a point (voxel coordinates), 0 outside it.'''
+	nearest = order == 0
+
+	def sample(volume,x,y,z):
+		nx, ny, nz = volume.shape
+		# Rays are clipped to the volume, this only guards against rounding at the faces.
+		if (x < 0) or (y < 0) or (z < 0) or (x > nx-1) or (y > ny-1) or (z > nz-1):
+			return 0.0
+		if nearest:
+			return volume[int(x+0.5),int(y+0.5),int(z+0.5)]
+		# Trilinear interpolation.
+		i, j, k = int(x), int(y), int(z)
+		i1, j1, k1 = min(i+1,nx-1), min(j+1,ny-1), min(k+1,nz-1)
+		fx, fy, fz = x-i, y-j, z-k
+		c00 = volume[i,j,k]*(1-fx)+volume[i1,j,k]*fx
+		c10 = volume[i,j1,k]*(1-fx)+volume[i1,j1,k]*fx
+		c01 = volume[i,j,k1]*(1-fx)+volume[i1,j,k1]*fx
+		c11 = volume[i,j1,k1]*(1-fx)+volume[i1,j1,k1]*fx
+		c0 = c00*(1-fy)+c10*fy
+		c1 = c01*(1-fy)+c11*fy
+		return c0*(1-fz)+c1*fz
+
+	return numba.njit(inline='always')(sample)
+
+def buildRayKernel(numba,parallel,order):
+	prange = numba.prange
+	sample = buildSampler(numba,order)
+
+	def cast(volume,start,delta,samples,out):
+		for r in prange(start.shape[0]):
+			total = 0.0
+			for s in range(samples[r]):
+				total += sample(volume,start[r,0]+s*delta[r,0],start[r,1]+s*delta[r,1],start[r,2]+s*delta[r,2])
+			out[r] = total
+
+	return numba.njit(parallel=parallel)(cast)
+
+def buildSweepKernel(numba,parallel,order):
+	prange = numba.prange
+	sample = buildSampler(numba,order)
+
+	def cast(volume,frames,samples,out):
+		views, nu, nv = out.shape
+		upper = volume.shape
+		for r in prange(views*nu):
+			view, i = r//nu, r % nu
+			# One row of a view per iteration, each thread has its own ray.
+			start = np.empty(3)
+			delta = np.empty(3)
+			f = frames[view]
+			for j in range(nv):
+				first, last = 0.0, samples-1.0
+				for a in range(3):
+					start[a] = f[0,a]+i*f[1,a]+j*f[2,a]
+					delta[a] = f[3,a]+i*f[4,a]+j*f[5,a]
+					# Clip the ray to the volume (as drrEngine.clip).
+					if delta[a] == 0:
+						if (start[a] < 0) or (start[a] > upper[a]-1):
+							last = -1.0
+						continue
+					t0, t1 = -start[a]/delta[a], (upper[a]-1-start[a])/delta[a]
+					first = max(first,np.ceil(min(t0,t1)))
+					last = min(last,np.floor(max(t0,t1)))
+				total = 0.0
+				for s in range(int(first),int(last)+1):
+					total += sample(volume,start[0]+s*delta[0],start[1]+s*delta[1],start[2]+s*delta[2])
+				out[view,i,j] = total
+
+	return numba.njit(parallel=parallel)(cast)
+
+def buildArcKernels(numba,parallel,order):
+	'''Sinograms of the slices of an arc and the DRRs read from them (see drrEngine.sweepArc), both bilinear. These sum
+	in whatever order is fastest (fastmath), the results can differ from the other kernels in the last bits.'''
+	prange = numba.prange
+
+	def sinogram(slices,beams,lateral,lower,out):
+		count, na, nb = slices.shape
+		# Rays stay within the planes but their last row and column.
+		na, nb = na-1, nb-1
+		views, positions = out.shape[1], out.shape[2]
+		for r in prange(count):
+			plane = slices[r]
+			for view in range(views):
+				c, s = beams[view,0], beams[view,1]
+				for p in range(positions):
+					# Ray through (lateral+p)*(-s,c) along (c,s), in steps about the isocenter, into slice indices.
+					a0 = -(lateral+p)*s-lower[0]
+					b0 = (lateral+p)*c-lower[1]
+					first, last = -1e18, 1e18
+					if c != 0:
+						t0, t1 = -a0/c, (na-1-a0)/c
+						first, last = max(first,min(t0,t1)), min(last,max(t0,t1))
+					elif (a0 < 0) or (a0 > na-1):
+						continue
+					if s != 0:
+						t0, t1 = -b0/s, (nb-1-b0)/s
+						first, last = max(first,min(t0,t1)), min(last,max(t0,t1))
+					elif (b0 < 0) or (b0 > nb-1):
+						continue
+					total = 0.0
+					for t in range(int(np.ceil(first)),int(np.floor(last))+1):
+						x, y = a0+t*c, b0+t*s
+						i, j = int(x), int(y)
+						fx, fy = x-i, y-j
+						total += (plane[i,j]*(1-fx)+plane[i+1,j]*fx)*(1-fy)+(plane[i,j+1]*(1-fx)+plane[i+1,j+1]*fx)*fy
+					out[r,view,p] = total
+
+	def detector(sinograms,section,position,owned,out):
+		count, positions = sinograms.shape[0], sinograms.shape[2]
+		views, nu, nv = out.shape
+		for r in prange(views*nu):
+			view, i = r//nu, r % nu
+			for j in range(nv):
+				x, y = section[i,j], position[i,j]
+				# Only pixels in the block's own slices (its last slice is the next block's first).
+				if (x < 0) or (y < 0) or (x >= owned) or (x > count-1) or (y > positions-1):
+					continue
+				k, l = int(x), int(y)
+				k1, l1 = min(k+1,count-1), min(l+1,positions-1)
+				fx, fy = x-k, y-l
+				out[view,i,j] = ((sinograms[k,view,l]*(1-fx)+sinograms[k1,view,l]*fx)*(1-fy)
+					+(sinograms[k,view,l1]*(1-fx)+sinograms[k1,view,l1]*fx)*fy)
+
+	return numba.njit(parallel=parallel,fastmath=True)(sinogram), numba.njit(parallel=parallel,fastmath=True)(detector)
+
+# Source of every kernel (with the sampler they share) for the cache keys, only read once.
+kernelSources = {build: inspect.getsource(build)+inspect.getsource(buildSampler)
+	for build in (buildRayKernel,buildSweepKernel,buildArcKernels)}
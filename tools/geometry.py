@@ -0,0 +1,111 @@
+import numpy as np
+from syncmrt.tools import quaternions as q
+
+'''
+Rotation bookkeeping shared by the volume rotation engines (tools.cuda and tools.cpu).
+	rotationMatrix(x,y,z,order,z1)		Rotation matrix, R, for a set of angles (deg) applied in the given order (or arrays of them).
+	rotatedShape(shape,R)				Output array shape (bounding box of the rotated input array).
+	rotatedExtent(extent,R)				Extent (l,r,b,t,f,b) of the rotated array.
+	rotatedIsocenter(isocenter,R)		Location of the isocenter after rotation.
+	axisExtent(extent)					Extent (l,r,b,t,f,b) as pairs along the array axes (rows, columns, depth), or back.
+
+Extents are kept as (l,r,b,t,f,b), as matplotlib shows an array: l,r along the columns (array axis 1) and b,t along the
+rows (axis 0). Anything that works along the array axes (ray casting, resampling, voxel sizes) goes through axisExtent.
+'''
+
+def rotationMatrix(x,y,z,order='xyz',z1=None):
+	# Angles can be arrays (e.g. every step of a beam sweep), giving a stack of matrices (...,3,3).
+	# Default axes.
+	xaxis = np.array(([1,0,0]))
+	yaxis = np.array(([0,1,0]))
+	zaxis = np.array(([0,0,1]))
+
+	if order == 'pat-gant-col':
+		# All angles should go in opposite direction to DICOM standard.
+		# z 	patient support angle
+		# x 	gantry angle
+		# z1 	collimator angle
+		rz = q.rotation(z,axis=zaxis)
+		rz1 = q.rotation(np.add(z,z1),axis=zaxis)
+		# Gantry axis is x turned by the patient support.
+		newaxis = q.rotate(xaxis,rz)
+		rx = q.rotation(x,axis=newaxis)
+		rotation = q.product(rz1,rx)
+
+	else:
+		# Assume xyz.
+		rotation = q.compose(q.rotation(x,axis=xaxis),q.rotation(y,axis=yaxis),q.rotation(z,axis=zaxis))
+
+	# Force float32 before we send to the engines.
+	return np.float32(q.matrix(rotation))
+
+def rotatedShape(shape,R):
+	# Get outshape by taking bounding box of vertice points.
+	shape = np.array(shape).astype(np.float32)
+	corners = np.array([[i,j,k] for i in (0,1) for j in (0,1) for k in (0,1)])
+	vertices = np.dot(corners*shape,R)
+
+	# Find minimum and maximum vertice points.
+	minimum = np.amin(vertices,axis=0)
+	maximum = np.amax(vertices,axis=0)
+	# Find the difference between the two as a whole number.
+	return np.rint(maximum-minimum).astype(np.int32)
+
+def rotatedIsocenter(isocenter,R):
+	# Find new isocenter.
+	if isocenter is None:
+		return None
+	return np.dot(isocenter,R)
+
+def rotatedExtent(extent,R):
+	# Extent goes in and out as (l,r,b,t,f,b).
+	if extent is None:
+		return None
+
+	# New extent vertices. Row col depth is YXZ.
+	v000 = np.dot(np.array([extent[2],extent[0],extent[4]]),R)
+	v001 = np.dot(np.array([extent[2],extent[0],extent[5]]),R)
+	v010 = np.dot(np.array([extent[3],extent[0],extent[4]]),R)
+	v011 = np.dot(np.array([extent[3],extent[0],extent[5]]),R)
+	v100 = np.dot(np.array([extent[2],extent[1],extent[4]]),R)
+	v101 = np.dot(np.array([extent[2],extent[1],extent[5]]),R)
+	v110 = np.dot(np.array([extent[3],extent[1],extent[4]]),R)
+	v111 = np.dot(np.array([extent[3],extent[1],extent[5]]),R)
+	vertices = np.vstack([v000,v001,v010,v011,v100,v101,v110,v111])
+
+	# Orientation of each vertex after rotation.
+	o000 = np.dot(np.array([-1,-1,-1]),R)
+	o001 = np.dot(np.array([-1,-1, 1]),R)
+	o010 = np.dot(np.array([ 1,-1,-1]),R)
+	o011 = np.dot(np.array([ 1,-1, 1]),R)
+	o100 = np.dot(np.array([-1, 1,-1]),R)
+	o101 = np.dot(np.array([-1, 1, 1]),R)
+	o110 = np.dot(np.array([ 1, 1,-1]),R)
+	o111 = np.dot(np.array([ 1, 1, 1]),R)
+	orientation = np.vstack([o000,o001,o010,o011,o100,o101,o110,o111])
+
+	minimum = np.argmin(orientation,axis=0)
+	maximum = np.argmax(orientation,axis=0)
+
+	blf = np.array([vertices[minimum[0],0],
+		vertices[minimum[1],1],
+		vertices[minimum[2],2]
+		])
+
+	trb = np.array([vertices[maximum[0],0],
+		vertices[maximum[1],1],
+		vertices[maximum[2],2]
+		])
+
+	# New extent (l,r,b,t,f,b).
+	return np.array([
+		blf[1],	trb[1],
+		blf[0],	trb[0],
+		blf[2],	trb[2]
+		])
+
+def axisExtent(extent):
+	# Swapping the first two pairs goes either way.
+	if extent is None:
+		return None
+	return np.asarray(extent,dtype=float)[[2,3,0,1,4,5]]
@@ -0,0 +1,54 @@
+import hashlib
+import os
+import threading
+
+'''
+Process-wide cache of compiled kernels (CUDA SourceModules, numba functions) so they are only built once per session.
+	cache.get(key,build)		Return the cached kernel for key, calling build() to compile it on a miss.
+	cache.stats()				Hit/miss counts, e.g. to check repeat calls only pay for the resampling work.
+	cache.clear()				Drop all kernels and reset the counts.
+	sourceKey(source,options)	Cache key made from a hash of the kernel source and its compile options.
+	kernelSource(name)			Source code of a kernel in tools/cudaKernels (read once).
+'''
+
+class kernelCache:
+	def __init__(self):
+		self.kernels = {}
+		self.hits = 0
+		self.misses = 0
+		self.lock = threading.RLock()
+
+	def get(self,key,build):
+		# Compile inside the lock so two threads never build the same kernel.
+		with self.lock:
+			if key in self.kernels:
+				self.hits += 1
+			else:
+				self.misses += 1
+				self.kernels[key] = build()
+			return self.kernels[key]
+
+	def stats(self):
+		with self.lock:
+			return {'hits':self.hits, 'misses':self.misses, 'kernels':len(self.kernels)}
+
+	def clear(self):
+		with self.lock:
+			self.kernels = {}
+			self.hits = 0
+			self.misses = 0
+
+# The cache shared by every engine in the process.
+cache = kernelCache()
+# Kernel sources that have been read from disk.
+sources = {}
+
+def sourceKey(source,**options):
+	return (hashlib.sha1(source.encode()).hexdigest(),tuple(sorted(options.items())))
+
+def kernelSource(name):
+	# Kernels are found next to this file rather than in site-packages.
+	if name not in sources:
+		with open(os.path.join(os.path.dirname(os.path.abspath(__file__)),'cudaKernels',name),'r') as f:
+			sources[name] = f.read()
+	return sources[name]
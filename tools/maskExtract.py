@@ -1,42 +1,112 @@
 '''
 Extract masks from RTPLAN and export as *.DWG for fabrication.
+	rotatePolygons(polygons,angle)		Polygons ((n,2) arrays, mm) of all beams turned by angle (deg, CCW) in one call:
+										a (beams,most points,2) array padded with nan and the number of points of each.
+	rasterise(polygon,extent,shape)		Fraction of every pixel of a grid (extent l,r,b,t in mm along the array axes, as a
+										beam's drrExtent) that is inside the polygon.
+	exportMasks(apertures,maskSize,path)	One DXF drawing (aperture and mask outline) per aperture, on a process pool.
+	mask(fpRtplan)						The block apertures of a plan: extract(), rasterise(index,extent,shape) and
+										export(path,parallel).
+
+Apertures are turned 90 deg CCW from the plan's block coordinates into the beam's eye view. A polygon is rasterised on
+subsamples rows per pixel row: where every edge crosses a row is found for all rows at once and the spans between
+crossings (even-odd) are filled with their exact length across each pixel, so the fractions are exact along the rows
+and within 1/subsamples across them.
 '''
-import dicom
+import multiprocessing
 import numpy as np
-from dxfwrite import DXFEngine as dxf
+import os
+from concurrent.futures import ProcessPoolExecutor
+from syncmrt.fileHandler.plan import loadPlan
+
+def rotatePolygons(polygons,angle=90):
+	counts = np.array([len(polygon) for polygon in polygons],dtype=int)
+	vertices = np.full((len(polygons),max(1,np.amax(counts,initial=0)),2),np.nan)
+	for i, polygon in enumerate(polygons):
+		vertices[i,:counts[i]] = polygon
+	theta = np.deg2rad(angle)
+	# Row vectors, so the transpose of the CCW rotation.
+	R = np.array([[np.cos(theta),np.sin(theta)],[-np.sin(theta),np.cos(theta)]])
+	return np.dot(vertices,R), counts
+
+def rasterise(polygon,extent,shape,subsamples=16):
+	polygon = np.asarray(polygon,dtype=float)
+	polygon = polygon[~np.isnan(polygon).any(axis=1)]
+	extent = np.array(extent,dtype=float)
+	rows, columns = int(shape[0]),int(shape[1])
+	# Vertices in pixels, u along the rows (axis 0) and v along the columns (axis 1).
+	u = (polygon[:,0]-extent[0])/(extent[1]-extent[0])*rows
+	v = (polygon[:,1]-extent[2])/(extent[3]-extent[2])*columns
+	u0, u1, v0, v1 = u, np.roll(u,-1), v, np.roll(v,-1)
+
+	# Where every edge crosses every subsampled row (half open, so a vertex on a row is only counted once).
+	sample = (np.arange(rows*subsamples)+0.5)/subsamples
+	crosses = (u0[None,:] <= sample[:,None]) != (u1[None,:] <= sample[:,None])
+	with np.errstate(divide='ignore',invalid='ignore'):
+		at = v0[None,:]+(sample[:,None]-u0[None,:])*(v1-v0)[None,:]/(u1-u0)[None,:]
+	at = np.sort(np.where(crosses,np.clip(at,0,columns),np.nan),axis=1)
+
+	# A span from a to b covers clip(b-k,0,1)-clip(a-k,0,1) of pixel k: whole pixels up to the one each crossing is in,
+	# plus part of that pixel. Entries (even crossings) count against, exits (odd) for.
+	row, order = np.nonzero(~np.isnan(at))
+	x = at[row,order]
+	sign = np.where(order % 2 == 0,-1.0,1.0)
+	pixel = np.minimum(np.floor(x).astype(int),columns)
+	index = row*(columns+1)+pixel
+	size = rows*subsamples*(columns+1)
+	whole = np.bincount(index,weights=sign,minlength=size).reshape(-1,columns+1)
+	part = np.bincount(index,weights=sign*(x-pixel),minlength=size).reshape(-1,columns+1)
+	coverage = part[:,:columns]-np.cumsum(whole,axis=1)[:,:columns]
+	coverage = coverage.reshape(rows,subsamples,columns).mean(axis=1)
+	return np.clip(coverage,0,1)
+
+def drawMask(job):
+	'''Process pool worker: write one aperture (closed polygon) and the mask outline as a DXF drawing.'''
+	# Only needed to export drawings.
+	from dxfwrite import DXFEngine as dxf
+	fn, points, maskSize = job
+	dwg = dxf.drawing(fn)
+	dwg.add(dxf.polyline(np.vstack((points,points[:1])).tolist()))
+	dwg.add(dxf.rectangle([-maskSize[0]/2,-maskSize[1]/2],maskSize[0],maskSize[1]))
+	dwg.save()
+	return fn
+
+def exportMasks(apertures,maskSize,path='.',parallel=True,maxWorkers=None):
+	'''Write BeamPort<i>.dxf for every aperture, on a process pool (at most maxWorkers processes) if parallel.'''
+	jobs = [(os.path.join(path,'BeamPort'+str(i)+'.dxf'),points,maskSize) for i, points in enumerate(apertures)]
+	if parallel & (len(jobs) > 1):
+		if maxWorkers is None:
+			maxWorkers = os.cpu_count() or 1
+		# Spawned, not forked: the DRR or rotation engines may already have started numba's threads in this session.
+		context = multiprocessing.get_context('spawn')
+		with ProcessPoolExecutor(max_workers=max(1,min(maxWorkers,len(jobs))),mp_context=context) as pool:
+			return list(pool.map(drawMask,jobs))
+	return [drawMask(job) for job in jobs]
 
 class mask:
 	def __init__(self,fpRtplan):
-		self.rtplan = dicom.read_file(fpRtplan)
+		self.rtplan = loadPlan(fpRtplan)
 		self.mask = []
 		self.maskSize = [40,40]
+		# Apertures in the BEV, see rotatePolygons.
+		self.vertices = None
+		self.counts = None
 
 	def extract(self):
 		'''Extract block data from RTPLAN.'''
-		for i in range(int(self.rtplan.FractionGroupSequence[0].NumberOfBeams)):
-			self.mask.append(self.rtplan.BeamSequence[i].BlockSequence[0].BlockData)
+		for i in range(self.rtplan.numberOfBeams):
+			self.mask.append(self.rtplan.beams[i].blocks[0].points.copy())
+		self.vertices, self.counts = rotatePolygons(self.mask,90)
+
+	def aperture(self,index):
+		return self.vertices[index,:self.counts[index]]
+
+	def rasterise(self,index,extent,shape,subsamples=16):
+		'''Aperture of beam index on its projection grid, e.g. rasterise(i,beam.drrExtent,beam.drr.shape).'''
+		return rasterise(self.aperture(index),extent,shape,subsamples)
+
+	def export(self,path='.',parallel=True,maxWorkers=None):
+		return exportMasks([self.aperture(i) for i in range(len(self.mask))],self.maskSize,path,parallel,maxWorkers)
 
-	def export(self):
-		for i in range(len(self.mask)):
-			self.drawmask(i)
-			
 	def drawmask(self,index):
-		numberOfPoints = int(len(self.mask[index])/2)
-
-		# Pair points as x,y.
-		points = []
-		for i in range(numberOfPoints):
-			x = self.mask[index][i*2]
-			y = self.mask[index][i*2+1]
-			points.append([x,y])
-		points.append(points[0])
-
-		# NEED TO ROTATE POINTS BY 90 CCW
-
-		# Create dwg and add lines.
-		fn = 'BeamPort'+str(index)+'.dxf'
-		dwg = dxf.drawing(fn)
-		dwg.add(dxf.polyline(points))
-		dwg.add(dxf.rectangle([-self.maskSize[0]/2,-self.maskSize[1]/2],
-			self.maskSize[0],self.maskSize[1]))
-		dwg.save()
\ No newline at end of file
+		return drawMask(('BeamPort'+str(index)+'.dxf',self.aperture(index),self.maskSize))
@@ -0,0 +1,222 @@
+import numpy as np
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+'''
+Streaming projection of volumes into radiographs. The volume is read a slab at a time (across the projection axis) on
+a thread pool so there is never a full size temporary, and it works on numpy arrays, memory-mapped volumes and chunked
+volume files alike.
+	project(volume,axis,mode,windows)	Sum, max or mean projection along axis. windows is a list of [lower,upper] HU
+										limits; voxels outside every window count as 0 (as mpl2DFigure.imageWindow did).
+	windowedProjector(volume,axis)		Precomputed per-ray histograms, for interactive windowing without re-reading
+										the volume (see the class).
+'''
+
+# Number of voxels read per slab.
+slabSize = 2**22
+
+def threads(workers=None):
+	if workers is None:
+		workers = os.cpu_count() or 1
+	return workers
+
+def windowed(block,windows):
+	'''Zero the voxels in block that fall outside every window (in place).'''
+	if windows is None:
+		return block
+	mask = np.zeros(block.shape,dtype=bool)
+	for lower, upper in windows:
+		mask |= (block > lower) & (block < upper)
+	block[~mask] = 0
+	return block
+
+def slabs(shape,axis):
+	'''Slab keys across an axis we aren't projecting along, with the matching key into the projection.'''
+	slabAxis = 0 if axis != 0 else 1
+	rows = max(1,slabSize//max(1,int(np.prod(shape))//shape[slabAxis]))
+	outAxis = slabAxis if slabAxis < axis else slabAxis-1
+	for start in range(0,shape[slabAxis],rows):
+		stop = min(start+rows,shape[slabAxis])
+		key = [slice(None)]*len(shape)
+		key[slabAxis] = slice(start,stop)
+		target = [slice(None)]*(len(shape)-1)
+		target[outAxis] = slice(start,stop)
+		yield tuple(key), tuple(target)
+
+def project(volume,axis=2,mode='sum',windows=None,workers=None):
+	if mode not in ('sum','max','mean'):
+		raise ValueError('Unknown projection mode %s.'%mode)
+	shape = volume.shape
+	dtype = np.zeros(1,dtype=volume.dtype).sum().dtype if mode in ('sum','mean') else volume.dtype
+	out = np.zeros(shape[:axis]+shape[axis+1:],dtype=dtype)
+
+	def reduce(item):
+		key, target = item
+		block = np.asarray(volume[key])
+		# Windowing has to work on a copy (the volume may be mapped read-only).
+		if windows is not None:
+			block = windowed(np.array(block),windows)
+		if mode == 'max':
+			out[target] = np.amax(block,axis=axis)
+		else:
+			out[target] = np.sum(block,axis=axis)
+
+	items = list(slabs(shape,axis))
+	if (threads(workers) > 1) & (len(items) > 1):
+		with ThreadPoolExecutor(max_workers=threads(workers)) as pool:
+			list(pool.map(reduce,items))
+	else:
+		for item in items:
+			reduce(item)
+
+	if mode == 'mean':
+		return out/shape[axis]
+	return out
+
+def roundEdges(lower,upper,bins):
+	'''At most about bins evenly spaced edges on round values (a 1, 2, 2.5 or 5 step, e.g. every 100 HU) from at or
+	below lower to above upper.'''
+	span = (upper-lower)/max(1,int(bins)) if upper > lower else 1.0
+	magnitude = 10.0**np.floor(np.log10(span))
+	step = next(m*magnitude for m in (1,2,2.5,5,10) if m*magnitude >= span)
+	first, last = int(np.floor(lower/step)), int(np.floor(upper/step))+1
+	return step*np.arange(first,last+1)
+
+class windowedProjector:
+	'''
+	Precomputed per-ray HU histograms for fast windowed projections of one volume along one axis.
+		windowedProjector(volume,axis,bins,workers)		Bins are a number of bins (at most about that many, on round
+														values over the volume's range) or the bin edges. Building
+														reads the volume once (twice if the range has to be found).
+		project(windows,mode)							Sum, mean or max projection for any set of windows.
+		exact(windows)									Whether the histograms give the windows exactly.
+
+	For every ray we keep the cumulative sum and count of the voxels below each bin edge, how many voxels are equal to
+	each edge and the largest voxel in each bin. A windowed sum is then a few lookups per window, a max is a maximum
+	over the bins in the windows. Windows keep project's limits (voxels strictly between them), so a voxel on a lower
+	limit is taken back out. Results are exact when every limit is on an edge (and the edges hold every voxel), any
+	other window is projected from the volume with project.
+	'''
+	def __init__(self,volume,axis=2,bins=64,workers=None):
+		self.volume = volume
+		self.axis = axis
+		self.shape = volume.shape
+		self.depth = volume.shape[axis]
+		self.workers = threads(workers)
+		items = list(slabs(volume.shape,axis))
+		pool = ThreadPoolExecutor(max_workers=self.workers)
+
+		if np.isscalar(bins):
+			# Round edges over the range of the data.
+			ranges = list(pool.map(lambda item: (np.amin(volume[item[0]]),np.amax(volume[item[0]])),items))
+			bins = roundEdges(float(min(r[0] for r in ranges)),float(max(r[1] for r in ranges)),bins)
+		self.edges = np.asarray(bins,dtype=float)
+		n = len(self.edges)-1
+		# Evenly spaced bins can be found with arithmetic rather than a search.
+		steps = np.diff(self.edges)
+		uniform = np.allclose(steps,steps[0])
+
+		pixels = self.shape[:axis]+self.shape[axis+1:]
+		self.sums = np.zeros(pixels+(n+1,),dtype=np.float64)
+		self.counts = np.zeros(pixels+(n+1,),dtype=np.int32)
+		self.equal = np.zeros(pixels+(n+1,),dtype=np.int32)
+		self.maxima = np.full(pixels+(n,),-np.inf,dtype=np.float32)
+		# Whether every voxel is within the edges (given edges might not hold them all).
+		self.covered = True
+
+		def build(item):
+			key, target = item
+			block = np.moveaxis(np.asarray(volume[key]),axis,-1)
+			rays = int(np.prod(block.shape[:-1]))
+			values = block.reshape(rays,-1)
+			if (np.amin(values) < self.edges[0]) | (np.amax(values) >= self.edges[-1]):
+				self.covered = False
+			# Bin of every voxel (voxels outside the edges go in the outer bins) and the count below each edge.
+			if uniform:
+				local = np.clip(np.floor((values-self.edges[0])*(n/(self.edges[-1]-self.edges[0]))).astype(np.int64),0,n-1)
+				# The arithmetic can round a voxel on an edge into the next bin, put it back.
+				local -= (values < self.edges[local]) & (local > 0)
+				local += (values >= self.edges[local+1]) & (local < n-1)
+			else:
+				local = np.clip(np.searchsorted(self.edges,values,side='right')-1,0,n-1)
+			index = local+(np.arange(rays)*n)[:,None]
+			counts = np.zeros((rays,n+1),dtype=np.int64)
+			counts[:,1:] = np.cumsum(np.bincount(index.ravel(),minlength=rays*n).reshape(rays,n),axis=1)
+			equal = np.zeros((rays,n+1),dtype=np.int64)
+			equal[:,:n] = np.bincount(index[values == self.edges[local]],minlength=rays*n).reshape(rays,n)
+			del index, local
+
+			# With each ray sorted, the voxels below an edge are the first counts of them: their sum is a running
+			# total and the largest voxel in a bin is the last one before the next edge.
+			ordered = np.sort(values,axis=1)
+			running = np.zeros((rays,ordered.shape[1]+1),dtype=np.float64)
+			np.cumsum(ordered,axis=1,out=running[:,1:])
+			sums = np.take_along_axis(running,counts,axis=1)
+			last = np.take_along_axis(ordered,np.maximum(counts[:,1:]-1,0),axis=1).astype(np.float32)
+			maxima = np.where(counts[:,1:] > counts[:,:-1],last,-np.inf)
+
+			shape = block.shape[:-1]
+			self.sums[target] = sums.reshape(shape+(n+1,))
+			self.counts[target] = counts.reshape(shape+(n+1,))
+			self.equal[target] = equal.reshape(shape+(n+1,))
+			self.maxima[target] = maxima.reshape(shape+(n,))
+
+		with pool:
+			list(pool.map(build,items))
+
+	def edgeIndex(self,value):
+		return int(np.argmin(np.absolute(self.edges-value)))
+
+	def exact(self,windows):
+		if windows is None:
+			return True
+		limits = np.ravel(np.asarray(windows,dtype=float))
+		return self.covered & all(self.edges[self.edgeIndex(limit)] == limit for limit in limits)
+
+	def ranges(self,windows):
+		'''Windows as merged (first edge, last edge) index pairs.'''
+		if windows is None:
+			return [(0,len(self.edges)-1)]
+		pairs = sorted((self.edgeIndex(lower),self.edgeIndex(upper)) for lower,upper in windows)
+		merged = []
+		for lower, upper in pairs:
+			if upper <= lower:
+				continue
+			# Windows that only touch leave out the voxels on the limit they share, so they stay apart.
+			if (len(merged) > 0) and (lower < merged[-1][1]):
+				merged[-1] = (merged[-1][0],max(merged[-1][1],upper))
+			else:
+				merged.append((lower,upper))
+		return merged
+
+	def project(self,windows=None,mode='sum'):
+		if not self.exact(windows):
+			return project(self.volume,self.axis,mode,windows,self.workers)
+		ranges = self.ranges(windows)
+		pixels = self.sums.shape[:-1]
+		# Voxels on a lower limit are outside the window (unless it is the whole range).
+		strict = windows is not None
+
+		if mode in ('sum','mean'):
+			out = np.zeros(pixels,dtype=np.float64)
+			for lower, upper in ranges:
+				out += self.sums[...,upper]-self.sums[...,lower]-strict*self.edges[lower]*self.equal[...,lower]
+			return out/self.depth if mode == 'mean' else out
+
+		elif mode == 'max':
+			out = np.full(pixels,-np.inf,dtype=np.float32)
+			inside = np.zeros(pixels,dtype=np.int32)
+			for lower, upper in ranges:
+				# The first bin's largest voxel only counts if it is above the limit (otherwise all of them are on it).
+				largest = self.maxima[...,lower]
+				if strict:
+					largest = np.where(largest > self.edges[lower],largest,-np.inf)
+				out = np.maximum(out,largest)
+				if upper > lower+1:
+					out = np.maximum(out,np.amax(self.maxima[...,lower+1:upper],axis=-1))
+				inside += self.counts[...,upper]-self.counts[...,lower]-strict*self.equal[...,lower]
+			# Voxels outside the windows count as 0.
+			out[inside < self.depth] = np.maximum(out[inside < self.depth],0)
+			return out
+
+		raise ValueError('Unknown projection mode %s.'%mode)
@@ -1,55 +1,138 @@
 import numpy as np
 
-class quaternionMath:
-	def __init__(self):
-		pass
+'''
+Quaternion maths on arrays. Quaternions are [w,x,y,z] along the last axis, so a single quaternion is shape (4,) and a
+stack is (N,4) (any leading shape broadcasts). Angles are in degrees.
+	quaternion(v)				Pure quaternion [0,x,y,z] from vectors.
+	rotation(theta,axis)		Rotation quaternion of theta about axis (a unit axis gives a unit quaternion).
+	product(a,b)				Hamilton product a*b.
+	compose(q1,q2,...)			q1*q2*... as one quaternion (rotates by the last one first).
+	conjugate(a), inverse(a), normalise(a)
+	rotate(a,r)					Rotate quaternions or vectors a by r, r*a*r^-1 (as rotationMatrix does for its axes).
+	matrix(q)					Rotation matrix, shape (...,3,3).
+	fromMatrix(R)				Unit quaternion from rotation matrices.
+	toAxisAngle(q)				Angle (deg) and unit axis of unit quaternions.
+	slerp(a,b,t)				Spherical interpolation from a to b at fractions t (shortest arc).
+quaternionMath keeps the previous interface (one quaternion at a time) on top of these.
+'''
+
+def quaternion(v):
+	# Take 3d input and turn into quaternion.
+	v = np.asarray(v)
+	return np.concatenate((np.zeros(v.shape[:-1]+(1,),dtype=v.dtype),v),axis=-1)
 
-	def quaternion(v):
-		# Take 3d input and turn into quaternion.
-		x,y,z = v
-		return np.array(([0,x,y,z]))
+def rotation(theta,axis=None):
+	# Rotation quaternion of angle theta by axis x,y,z.
+	if axis is None:
+		axis = np.array(([1,1,1]))
+	theta = np.deg2rad(np.asarray(theta,dtype=float))[...,None]
+	vector = np.sin(theta/2)*np.asarray(axis)
+	return np.concatenate((np.broadcast_to(np.cos(theta/2),vector.shape[:-1]+(1,)),vector),axis=-1)
 
-	def rotation(theta,axis=None):
-		# Rotation quaternion of angle theta by axis x,y,z.
-		if axis is None:
-			axis = np.array(([1,1,1]))
+def product(a,b):
+	# Hamilton product a*b (applied to a vector, b rotates it first and then a).
+	a0,a1,a2,a3 = np.moveaxis(np.asarray(a),-1,0)
+	b0,b1,b2,b3 = np.moveaxis(np.asarray(b),-1,0)
 
-		theta = np.deg2rad(theta)
-		i,j,k = np.sin(theta/2)*axis
+	q0 = b0*a0 - b1*a1 - b2*a2 - b3*a3
+	q1 = b0*a1 + b1*a0 - b2*a3 + b3*a2
+	q2 = b0*a2 + b1*a3 + b2*a0 - b3*a1
+	q3 = b0*a3 - b1*a2 + b2*a1 + b3*a0
 
-		return np.array([np.cos(theta/2),i,j,k])
+	return np.stack((q0,q1,q2,q3),axis=-1)
 
-	def product(a,b):
-		# Product of two quarternions, b operating on a.
-		a0,a1,a2,a3 = a
-		b0,b1,b2,b3 = b
+def compose(*quaternions):
+	q = quaternions[0]
+	for r in quaternions[1:]:
+		q = product(q,r)
+	return q
 
-		q0 = b0*a0 - b1*a1 - b2*a2 - b3*a3
-		q1 = b0*a1 + b1*a0 - b2*a3 + b3*a2
-		q2 = b0*a2 + b1*a3 + b2*a0 - b3*a1
-		q3 = b0*a3 - b1*a2 + b2*a1 + b3*a0
+def conjugate(a):
+	return np.asarray(a)*np.array([1,-1,-1,-1])
 
-		q = np.array(([q0,q1,q2,q3]))
+def inverse(a):
+	# Inverse of quaternion a
+	a = np.asarray(a)
+	return conjugate(a)/np.sum(a**2,axis=-1,keepdims=True)
 
-		return q
+def normalise(a):
+	a = np.asarray(a)
+	return a/np.linalg.norm(a,axis=-1,keepdims=True)
 
-	def inverse(a):
-		# Inverse of quaternion a
-		a0,a1,a2,a3 = a
-		q = (np.array(([a0,-a1,-a2,-a3])) / (a0**2 + a1**2 + a2**2 + a3**2))
+def rotate(a,r):
+	# Rotate quaternion a, by quaternion r. Vectors (last axis of 3) come back as vectors.
+	a = np.asarray(a)
+	vector = a.shape[-1] == 3
+	if vector:
+		a = quaternion(a)
+	b = product(product(r,a),inverse(r))
+	return b[...,1:] if vector else b
 
-		return q
+def matrix(q):
+	q0,q1,q2,q3 = np.moveaxis(np.asarray(q),-1,0)
+	R = np.array([[(q0**2+q1**2-q2**2-q3**2), 2*(q1*q2-q0*q3), 2*(q1*q3+q0*q2)],
+		[2*(q2*q1+q0*q3), (q0**2-q1**2+q2**2-q3**2), 2*(q2*q3-q0*q1)],
+		[2*(q3*q1-q0*q2), 2*(q3*q2+q0*q1), (q0**2-q1**2-q2**2+q3**2)]])
+	# Matrix axes last.
+	return np.moveaxis(R,(0,1),(-2,-1))
 
-	def euler(q):
-		R = np.array([[(q[0]**2+q[1]**2-q[2]**2-q[3]**2), 2*(q[1]*q[2]-q[0]*q[3]), 2*(q[1]*q[3]+q[0]*q[2])],
-			[2*(q[2]*q[1]+q[0]*q[3]), (q[0]**2-q[1]**2+q[2]**2-q[3]**2), 2*(q[2]*q[3]-q[0]*q[1])],
-			[2*(q[3]*q[1]-q[0]*q[2]), 2*(q[3]*q[2]+q[0]*q[1]), (q[0]**2-q[1]**2-q[2]**2+q[3]**2)]])
+def fromMatrix(R):
+	'''Inverse of matrix(), w >= 0 (Shepperd's method: build from the largest of w, x, y, z for stability).'''
+	R = np.asarray(R,dtype=float)
+	trace = R[...,0,0]+R[...,1,1]+R[...,2,2]
+	# Four times the square of each component, pick the largest for each matrix.
+	squares = np.stack((1+trace,1+2*R[...,0,0]-trace,1+2*R[...,1,1]-trace,1+2*R[...,2,2]-trace),axis=-1)
+	largest = np.argmax(squares,axis=-1)
+	s = np.sqrt(np.maximum(np.take_along_axis(squares,largest[...,None],axis=-1)[...,0],1e-300))
+	# Off-diagonal sums/differences, each gives 4 times a product of two components.
+	wx = R[...,2,1]-R[...,1,2]
+	wy = R[...,0,2]-R[...,2,0]
+	wz = R[...,1,0]-R[...,0,1]
+	xy = R[...,1,0]+R[...,0,1]
+	xz = R[...,0,2]+R[...,2,0]
+	yz = R[...,2,1]+R[...,1,2]
+	candidates = np.stack((
+		np.stack((s*s,wx,wy,wz),axis=-1),
+		np.stack((wx,s*s,xy,xz),axis=-1),
+		np.stack((wy,xy,s*s,yz),axis=-1),
+		np.stack((wz,xz,yz,s*s),axis=-1)),axis=-2)
+	q = np.take_along_axis(candidates,largest[...,None,None],axis=-2)[...,0,:]/(2*s[...,None])
+	return q*np.where(q[...,:1] < 0,-1,1)
 
-		return R
+def toAxisAngle(q):
+	q = normalise(q)
+	q = q*np.where(q[...,:1] < 0,-1,1)
+	sine = np.linalg.norm(q[...,1:],axis=-1)
+	theta = np.rad2deg(2*np.arctan2(sine,q[...,0]))
+	with np.errstate(divide='ignore',invalid='ignore'):
+		axis = np.where(sine[...,None] > 1e-12,q[...,1:]/sine[...,None],np.array([1,0,0]))
+	return theta, axis
 
-	def rotate(a,r):
-		# Rotate quaternion a, by quaternion r.
-		ri = inverse(r)
-		b = product(product(r,a),ri)
+def slerp(a,b,t):
+	a = normalise(a)
+	b = normalise(b)
+	t = np.asarray(t,dtype=float)[...,None]
+	dot = np.sum(a*b,axis=-1,keepdims=True)
+	# Take the short way round.
+	b = np.where(dot < 0,-b,b)
+	dot = np.absolute(dot)
+	omega = np.arccos(np.clip(dot,-1,1))
+	sine = np.sin(omega)
+	# Nearly the same orientation: linear interpolation is exact enough (and doesn't divide by ~0).
+	close = sine < 1e-6
+	with np.errstate(divide='ignore',invalid='ignore'):
+		wa = np.where(close,1-t,np.sin((1-t)*omega)/sine)
+		wb = np.where(close,t,np.sin(t*omega)/sine)
+	return normalise(wa*a+wb*b)
+
+class quaternionMath:
+	'''One quaternion at a time, as before (the functions above do the work and also take arrays).'''
+	def __init__(self):
+		pass
 
-		return b
\ No newline at end of file
+	quaternion = staticmethod(quaternion)
+	rotation = staticmethod(rotation)
+	product = staticmethod(product)
+	inverse = staticmethod(inverse)
+	euler = staticmethod(matrix)
+	rotate = staticmethod(rotate)
@@ -1,136 +1,310 @@
-# write_new.py
-"""Simple example of writing a DICOM file from scratch using pydicom.
-This example does not produce a DICOM standards compliant file as written,
-you will have to change UIDs to valid values and add all required DICOM data
-elements
-"""
-# Copyright (c) 2010-2012 Darcy Mason
-# This file is part of pydicom, released under a modified MIT license.
-#    See the file license.txt included with this distribution, also
-#    available at https://github.com/darcymason/pydicom
-
-from __future__ import print_function
-
-import sys
-import datetime
-import os.path
-import pydicom
-from pydicom.dataset import Dataset, FileDataset
-import pydicom.uid
-
-if __name__ == "__main__":
-    print("---------------------------- ")
-    print("write_new.py example program")
-    print("----------------------------")
-    print("Demonstration of writing a DICOM file using pydicom")
-    print("NOTE: this is only a demo. Writing a DICOM standards compliant file")
-    print("would require official UIDs, and checking the DICOM standard to ensure")
-    print("that all required data elements were present.")
-    print()
-
-    if sys.platform.lower().startswith("win"):
-        filename = r"c:\temp\test.dcm"
-        filename2 = r"c:\temp\test-explBig.dcm"
-    else:
-        homedir = os.path.expanduser("~")
-        filename = os.path.join(homedir, "test.dcm")
-        filename2 = os.path.join(homedir, "test-explBig.dcm")
-
-    print("Setting file meta information...")
-    # Populate required values for file meta information
-    file_meta = Dataset()
-    file_meta.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.1.1.2'  # CT Image Storage
-    file_meta.MediaStorageSOPInstanceUID = "1.2.3"  # !! Need valid UID here for real work
-    file_meta.ImplementationClassUID = "1.2.3.4"  # !!! Need valid UIDs here
-
-    print("Setting dataset values...")
-
-    # Create the FileDataset instance (initially no data elements, but file_meta supplied)
-    ds = FileDataset(filename, {}, file_meta=file_meta, preamble=b"\0" * 128)
-
-    # Add the data elements -- not trying to set all required here. Check DICOM standard
-    ds.PatientName = "Test^Firstname"
-    ds.PatientID = "123456"
-
-    # Set the transfer syntax
-    ds.is_little_endian = True
-    ds.is_implicit_VR = True
-
-    # Set creation date/time
-    dt = datetime.datetime.now()
-    ds.ContentDate = dt.strftime('%Y%m%d')
-    timeStr = dt.strftime('%H%M%S.%f')  # long format with micro seconds
-    ds.ContentTime = timeStr
-
-    print("Writing test file", filename)
-    ds.save_as(filename)
-    print("File saved.")
-
-    # Write as a different transfer syntax
-    ds.file_meta.TransferSyntaxUID = pydicom.uid.ExplicitVRBigEndian  # XXX shouldn't need this but pydicom 0.9.5 bug not recognizing transfer syntax
-    ds.is_little_endian = False
-    ds.is_implicit_VR = False
-
-    print("Writing test file as Big Endian Explicit VR", filename2)
-    ds.save_as(filename2)
-
-
-
-    '''
-    import dicom, dicom.UID
-from dicom.dataset import Dataset, FileDataset
+from dicom.dataset import Dataset
+from dicom.filebase import DicomBytesIO
+from dicom.filewriter import write_data_element
 import numpy as np
-import datetime, time
-
-def write_dicom(pixel_array,filename):
-    """
-    INPUTS:
-    pixel_array: 2D numpy ndarray.  If pixel_array is larger than 2D, errors.
-    filename: string name for the output file.
-    """
-
-    ## This code block was taken from the output of a MATLAB secondary
-    ## capture.  I do not know what the long dotted UIDs mean, but
-    ## this code works.
-    file_meta = Dataset()
-    file_meta.MediaStorageSOPClassUID = 'Secondary Capture Image Storage'
-    file_meta.MediaStorageSOPInstanceUID = '1.3.6.1.4.1.9590.100.1.1.111165684411017669021768385720736873780'
-    file_meta.ImplementationClassUID = '1.3.6.1.4.1.9590.100.1.0.100.4.0'
-    ds = FileDataset(filename, {},file_meta = file_meta,preamble="\0"*128)
-    ds.Modality = 'WSD'
-    ds.ContentDate = str(datetime.date.today()).replace('-','')
-    ds.ContentTime = str(time.time()) #milliseconds since the epoch
-    ds.StudyInstanceUID =  '1.3.6.1.4.1.9590.100.1.1.124313977412360175234271287472804872093'
-    ds.SeriesInstanceUID = '1.3.6.1.4.1.9590.100.1.1.369231118011061003403421859172643143649'
-    ds.SOPInstanceUID =    '1.3.6.1.4.1.9590.100.1.1.111165684411017669021768385720736873780'
-    ds.SOPClassUID = 'Secondary Capture Image Storage'
-    ds.SecondaryCaptureDeviceManufctur = 'Python 2.7.3'
-
-    ## These are the necessary imaging components of the FileDataset object.
-    ds.SamplesPerPixel = 1
-    ds.PhotometricInterpretation = "MONOCHROME2"
-    ds.PixelRepresentation = 0
-    ds.HighBit = 15
-    ds.BitsStored = 16
-    ds.BitsAllocated = 16
-    ds.SmallestImagePixelValue = '\\x00\\x00'
-    ds.LargestImagePixelValue = '\\xff\\xff'
-    ds.Columns = pixel_array.shape[0]
-    ds.Rows = pixel_array.shape[1]
-    if pixel_array.dtype != np.uint16:
-        pixel_array = pixel_array.astype(np.uint16)
-    ds.PixelData = pixel_array.tostring()
-
-    ds.save_as(filename)
-    return
-
-
-
-if __name__ == "__main__":
-#    pixel_array = np.arange(256*256).reshape(256,256)
-#    pixel_array = np.tile(np.arange(256).reshape(16,16),(16,16))
-    x = np.arange(16).reshape(16,1)
-    pixel_array = (x + x.T) * 32
-    pixel_array = np.tile(pixel_array,(16,16))
-    write_dicom(pixel_array,'pretty.dcm')
-'''
\ No newline at end of file
+import os
+import platform
+import struct
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from syncmrt.tools.geometry import axisExtent
+
+'''
+DICOM export of volumes (a CT, a rotated CT or a beam's volume) with the geometry taken from the array's extent.
+	writeSeries(path,array,extent,orientation,...)		A CT Image file for every slice (array axis 2), CT<n>.dcm in
+														path.
+	writeMultiframe(fn,array,extent,orientation,...)	One Enhanced CT file holding every slice as a frame.
+	newUID()											A UID made from a random UUID (2.25.<uuid>).
+
+Extents are (l,r,b,t,f,b) in mm as the rotation engines and importCT give them (see tools.geometry.axisExtent): x along
+the columns, y along the rows and z along the slices, from the outer faces of the voxels. orientation places those axes
+in the patient (DICOM) coordinates, either as a 3x3 matrix with the patient directions of x, y and z as its columns (the
+rotation from the volume to the patient) or as the six values of an ImageOrientationPatient (slices then go along their
+cross product). Without one the axes are the patient's, as for a CT straight from importCT.
+
+Whole numbers that fit in signed 16 bit are stored as they are (HU usually are), anything else is spread over the 16 bit
+range with a rescale slope and intercept.
+
+Headers are encoded by pydicom, element by element: the elements every file of a series shares once, and only the few
+of its own slice for each file. Only the pixel data is streamed: slices are turned into 16 bit pixels by a pool of
+threads and written straight after their header (or to their place in the multi-frame file, with os.pwrite), so only
+the slices being worked on are ever held in memory.
+'''
+
+ctImage = '1.2.840.10008.5.1.4.1.1.2'
+enhancedCtImage = '1.2.840.10008.5.1.4.1.1.2.1'
+explicitLittleEndian = '1.2.840.10008.1.2.1'
+implementationClassUID = '2.25.150398178372403906254155383718716410397'
+
+def threads(workers=None):
+	# Writing is mostly waiting on the disk, use a few more threads than cores.
+	if workers is None:
+		workers = min(32,(os.cpu_count() or 1)*4)
+	return workers
+
+def newUID():
+	return '2.25.%i'%uuid.uuid4().int
+
+def decimal(value):
+	'''Decimal string (DS) of at most 16 characters.'''
+	for digits in range(10,0,-1):
+		text = '%.*g'%(digits,value)
+		if len(text) <= 16:
+			return text
+	raise ValueError('%r does not fit in a decimal string.'%value)
+
+def dataset(**elements):
+	'''Dataset from keywords, lists of dictionaries become sequences.'''
+	ds = Dataset()
+	for keyword, value in elements.items():
+		if isinstance(value,list) and (len(value) > 0) and isinstance(value[0],dict):
+			value = [dataset(**item) for item in value]
+		setattr(ds,keyword,value)
+	return ds
+
+def encode(ds):
+	'''Explicit VR little endian bytes of every element of ds (pydicom encodes them) by tag.'''
+	out = {}
+	for element in ds:
+		fp = DicomBytesIO()
+		fp.is_little_endian = True
+		fp.is_implicit_VR = False
+		write_data_element(fp,element)
+		out[element.tag] = fp.getvalue()
+	return out
+
+def fileMeta(sopClass):
+	'''Encoded file meta information a volume's files share (all but the instance UID).'''
+	return encode(dataset(
+		FileMetaInformationVersion=b'\x00\x01',
+		MediaStorageSOPClassUID=sopClass,
+		TransferSyntaxUID=explicitLittleEndian,
+		ImplementationClassUID=implementationClassUID,
+	))
+
+def header(meta,instance,elements,length):
+	'''Preamble, file meta information, the encoded elements and the header of the pixel data element (length bytes
+	of OW, which follow it).'''
+	meta = dict(meta)
+	meta.update(encode(dataset(MediaStorageSOPInstanceUID=instance)))
+	meta = b''.join(meta[tag] for tag in sorted(meta))
+	meta = b''.join(encode(dataset(FileMetaInformationGroupLength=len(meta))).values())+meta
+	return b'\0'*128+b'DICM'+meta+b''.join(elements[tag] for tag in sorted(elements))+struct.pack('<HH2sHI',0x7FE0,0x0010,b'OW',0,length)
+
+def orientationMatrix(orientation=None):
+	if orientation is None:
+		return np.identity(3)
+	orientation = np.asarray(orientation,dtype=float)
+	if orientation.size == 6:
+		return np.column_stack([orientation[:3],orientation[3:],np.cross(orientation[:3],orientation[3:])])
+	return orientation.reshape(3,3)
+
+def geometry(shape,extent,orientation=None):
+	'''Pixel spacing (between rows, between columns), slice spacing, ImageOrientationPatient and the position of each
+	slice's first voxel (mm, patient coordinates).'''
+	extent = axisExtent(extent)
+	spacing = (extent[1::2]-extent[0::2])/np.array(shape[:3])
+	# Patient directions along the array's axes (rows go along y, columns along x).
+	axes = orientationMatrix(orientation)[:,[1,0,2]]
+	first = extent[0::2]+0.5*spacing
+	local = np.column_stack([np.full(shape[2],first[0]),np.full(shape[2],first[1]),first[2]+np.arange(shape[2])*spacing[2]])
+	# Extents that run backwards turn the directions round.
+	directions = axes*np.sign(spacing)
+	spacing = np.absolute(spacing)
+	return spacing[:2], spacing[2], np.concatenate([directions[:,1],directions[:,0]]), local.dot(axes.T)
+
+def rescale(array,workers=None):
+	'''Slope and intercept that store the array as signed 16 bit (1 and 0 for whole numbers that already fit).'''
+	# Blocks of rows are contiguous, slices (array[:,:,k]) are not and take several times as long to read.
+	rows = max(1,2**22//max(1,array.shape[1]*array.shape[2]))
+	def scan(start):
+		block = np.asarray(array[start:start+rows])
+		whole = (block.dtype.kind != 'f') or bool(np.all(block == np.rint(block)))
+		return float(np.amin(block)), float(np.amax(block)), whole
+	# This is all reading and comparing, more threads than cores only get in each other's way.
+	with ThreadPoolExecutor(max_workers=min(threads(workers),os.cpu_count() or 1)) as pool:
+		scans = list(pool.map(scan,range(0,array.shape[0],rows)))
+	lower, upper = min(s[0] for s in scans), max(s[1] for s in scans)
+	if all(s[2] for s in scans) & (lower >= -32768) & (upper <= 32767):
+		return 1.0, 0.0
+	if upper == lower:
+		return 1.0, float(decimal(lower))
+	# Use the values as they are written, lower goes to -32768 and upper to 32767.
+	slope = float(decimal((upper-lower)/65535))
+	return slope, float(decimal(lower+32768*slope))
+
+def pixels(array,k,slope,intercept):
+	'''Slice k as little endian signed 16 bit pixel data (rows, then columns).'''
+	data = np.asarray(array[:,:,k])
+	if (slope != 1) | (intercept != 0):
+		# Within 16 bits, give or take the rounding of the slope and intercept to decimal strings.
+		data = np.clip(np.rint((data-intercept)/slope),-32768,32767)
+	elif data.dtype.kind == 'f':
+		data = np.rint(data)
+	return data.astype('<i2')
+
+def common(array,extent,orientation,patientName,patientID,patientPosition,description):
+	'''Elements every file of a volume shares (patient, study, series, frame of reference, equipment and pixels).'''
+	pixelSpacing, sliceSpacing, imageOrientation, positions = geometry(array.shape,extent,orientation)
+	now = time.localtime()
+	elements = dataset(
+		StudyDate=time.strftime('%Y%m%d',now),
+		ContentDate=time.strftime('%Y%m%d',now),
+		StudyTime=time.strftime('%H%M%S',now),
+		ContentTime=time.strftime('%H%M%S',now),
+		AccessionNumber='',
+		Modality='CT',
+		Manufacturer='syncmrt',
+		ReferringPhysicianName='',
+		SeriesDescription=description,
+		PatientName=patientName,
+		PatientID=patientID,
+		PatientBirthDate='',
+		PatientSex='',
+		PatientPosition=patientPosition,
+		StudyInstanceUID=newUID(),
+		SeriesInstanceUID=newUID(),
+		StudyID='',
+		SeriesNumber='1',
+		FrameOfReferenceUID=newUID(),
+		PositionReferenceIndicator='',
+		SamplesPerPixel=1,
+		PhotometricInterpretation='MONOCHROME2',
+		Rows=array.shape[0],
+		Columns=array.shape[1],
+		BitsAllocated=16,
+		BitsStored=16,
+		HighBit=15,
+		PixelRepresentation=1,
+	)
+	return pixelSpacing, sliceSpacing, imageOrientation, positions, elements
+
+def writeSeries(path,array,extent,orientation=None,patientName='',patientID='',patientPosition='HFS',description='',workers=None):
+	'''Returns the files, in slice order.'''
+	slope, intercept = rescale(array,workers)
+	pixelSpacing, sliceSpacing, imageOrientation, positions, shared = common(array,extent,orientation,patientName,patientID,patientPosition,description)
+	normal = np.cross(imageOrientation[:3],imageOrientation[3:])
+	shared.update(dataset(
+		ImageType=['DERIVED','SECONDARY','AXIAL' if np.allclose(np.absolute(normal),[0,0,1]) else 'OTHER'],
+		SOPClassUID=ctImage,
+		SliceThickness=decimal(sliceSpacing),
+		KVP='',
+		SpacingBetweenSlices=decimal(sliceSpacing),
+		AcquisitionNumber='',
+		ImageOrientationPatient=[decimal(value) for value in imageOrientation],
+		PixelSpacing=[decimal(value) for value in pixelSpacing],
+		RescaleIntercept=decimal(intercept),
+		RescaleSlope=decimal(slope),
+		RescaleType='HU',
+	))
+	length = array.shape[0]*array.shape[1]*2
+	series = shared.SeriesInstanceUID
+	# The shared elements are encoded once, each file only encodes the elements of its own slice.
+	shared = encode(shared)
+	meta = fileMeta(ctImage)
+	os.makedirs(path,exist_ok=True)
+
+	def write(k):
+		instance = series+'.%i'%(k+1)
+		elements = dict(shared)
+		elements.update(encode(dataset(
+			SOPInstanceUID=instance,
+			InstanceNumber=str(k+1),
+			ImagePositionPatient=[decimal(value) for value in positions[k]],
+			SliceLocation=decimal(positions[k].dot(normal)),
+		)))
+		fn = os.path.join(path,'CT%i.dcm'%(k+1))
+		with open(fn,'wb') as f:
+			f.write(header(meta,instance,elements,length))
+			f.write(pixels(array,k,slope,intercept))
+		return fn
+
+	with ThreadPoolExecutor(max_workers=threads(workers)) as pool:
+		return list(pool.map(write,range(array.shape[2])))
+
+def writeMultiframe(fn,array,extent,orientation=None,patientName='',patientID='',patientPosition='HFS',description='',anatomy=None,workers=None):
+	'''
+	The file is a derived (secondary) Enhanced CT image, so the acquisition macros (only required for ORIGINAL images)
+	are left out. Frames are one stack, indexed by their place in it (Stack ID and In-Stack Position Number). The
+	Frame Anatomy macro needs the body part, anatomy as a (code value, coding scheme, code meaning) triple, e.g.
+	('38266002','SCT','Entire body'); without it the file lacks that mandatory macro.
+	'''
+	slope, intercept = rescale(array,workers)
+	pixelSpacing, sliceSpacing, imageOrientation, positions, ds = common(array,extent,orientation,patientName,patientID,patientPosition,description)
+	instance = newUID()
+	frames = array.shape[2]
+	imageType = ['DERIVED','PRIMARY','VOLUME','NONE']
+	organisation = newUID()
+	shared = dict(
+		PixelMeasuresSequence=[dict(
+			SliceThickness=decimal(sliceSpacing),
+			SpacingBetweenSlices=decimal(sliceSpacing),
+			PixelSpacing=[decimal(value) for value in pixelSpacing],
+		)],
+		PlaneOrientationSequence=[dict(ImageOrientationPatient=[decimal(value) for value in imageOrientation])],
+		PixelValueTransformationSequence=[dict(
+			RescaleIntercept=decimal(intercept),
+			RescaleSlope=decimal(slope),
+			RescaleType='HU',
+		)],
+		CTImageFrameTypeSequence=[dict(
+			FrameType=imageType,
+			PixelPresentation='MONOCHROME',
+			VolumetricProperties='VOLUME',
+			VolumeBasedCalculationTechnique='NONE',
+		)],
+	)
+	if anatomy is not None:
+		shared['FrameAnatomySequence'] = [dict(
+			AnatomicRegionSequence=[dict(CodeValue=anatomy[0],CodingSchemeDesignator=anatomy[1],CodeMeaning=anatomy[2])],
+			FrameLaterality='U',
+		)]
+	ds.update(dataset(
+		ImageType=imageType,
+		SOPClassUID=enhancedCtImage,
+		SOPInstanceUID=instance,
+		ManufacturerModelName='syncmrt',
+		DeviceSerialNumber=platform.node() or 'unknown',
+		SoftwareVersions='syncmrt',
+		InstanceNumber='1',
+		NumberOfFrames=str(frames),
+		PixelPresentation='MONOCHROME',
+		VolumetricProperties='VOLUME',
+		VolumeBasedCalculationTechnique='NONE',
+		BurnedInAnnotation='NO',
+		LossyImageCompression='00',
+		PresentationLUTShape='IDENTITY',
+		AcquisitionContextSequence=[],
+		DimensionOrganizationType='3D',
+		DimensionOrganizationSequence=[dict(DimensionOrganizationUID=organisation)],
+		DimensionIndexSequence=[dict(
+			DimensionOrganizationUID=organisation,
+			DimensionIndexPointer=0x00209056,
+			FunctionalGroupPointer=0x00209111,
+			DimensionDescriptionLabel='Stack',
+		),dict(
+			DimensionOrganizationUID=organisation,
+			DimensionIndexPointer=0x00209057,
+			FunctionalGroupPointer=0x00209111,
+			DimensionDescriptionLabel='Position in stack',
+		)],
+		# Geometry, rescale and frame type are the same for every frame, only the position changes.
+		SharedFunctionalGroupsSequence=[shared],
+		PerFrameFunctionalGroupsSequence=[dict(
+			FrameContentSequence=[dict(StackID='1',InStackPositionNumber=k+1,DimensionIndexValues=[1,k+1])],
+			PlanePositionSequence=[dict(ImagePositionPatient=[decimal(value) for value in positions[k]])],
+		) for k in range(frames)],
+	))
+	length = array.shape[0]*array.shape[1]*2
+
+	with open(fn,'wb') as f:
+		f.write(header(fileMeta(enhancedCtImage),instance,encode(ds),length*frames))
+		start = f.tell()
+		f.flush()
+		# Frames go to their own place in the file, in any order.
+		def write(k):
+			os.pwrite(f.fileno(),pixels(array,k,slope,intercept),start+k*length)
+		with ThreadPoolExecutor(max_workers=threads(workers)) as pool:
+			list(pool.map(write,range(frames)))
+	return fn
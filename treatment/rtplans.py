@@ -1,5 +1,5 @@
-import dicom
 import numpy as np
+from syncmrt.fileHandler.plan import loadPlan
 
 class rtplan:
 	def __init__(self,fp,ds):
@@ -9,18 +9,14 @@ class rtplan:
 
 		# If ds has 1 or more files, then read files.
 		if len(ds) > 0:
-			plan = dicom.read_file(ds[0])
-
-			# Set empty vals.
-			self.gantryAngle = np.zeros(len(plan.BeamSequence))
+			plan = loadPlan(ds[0])
 
 			# Get actual vals.
-			for i in range(len(plan.BeamSequence)):
-				self.gantryAngle[i] = plan.BeamSequence[i].ControlPointSequence[0].GantryAngle
+			self.gantryAngle = np.array([beam.controlPoints[0].gantryAngle for beam in plan.beams])
 
-			self.isoc = plan.BeamSequence[0].ControlPointSequence[0].IsocenterPosition
+			self.isoc = np.array(plan.beams[0].controlPoints[0].isocenter)
 
-			self.outcome = "Loaded " + str(len(plan.BeamSequence)) + " treatment port(s)."
+			self.outcome = "Loaded " + str(len(plan.beams)) + " treatment port(s)."
 
 		else:
 			self.outcome = "No treatment plan files were found."
\ No newline at end of file
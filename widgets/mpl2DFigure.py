@@ -4,7 +4,10 @@ import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from PyQt5 import QtGui, QtCore
-from syncmrt.imageGuidance import optimiseFiducials
+from syncmrt.imageGuidance import optimiseFiducials, findFiducials
+from syncmrt.fileHandler.volume import loadVolume
+from syncmrt.fileHandler.pyramid import openPyramid
+from syncmrt.tools.projection import project, windowedProjector
 
 # from skimage import exposure
 from skimage.external import tifffile as tiff
@@ -32,6 +35,7 @@ class mpl2DFigure:
 		self.markersListOptimised = []
 		self.markerModel = model
 		self._radiographMode = 'sum'
+		self.windowProjector = None
 
 		self.overlay = {}
 		self.isocenter = [0,0]
@@ -65,18 +69,26 @@ class mpl2DFigure:
 
 		self.canvas._pickerActive = False
 
-	def imageLoad(self,fn,extent=np.array([-1,1,-1,1]),imageOrientation='',imageIndex=0):
-		'''imageLoad: Load numpy file in, convert to 2D. Connect callbacks and plot.'''		
+	def imageLoad(self,fn,extent=None,imageOrientation='',imageIndex=0,resolution=None):
+		'''imageLoad: Load volume or numpy file in (memory-mapped), convert to 2D. Connect callbacks and plot.
+		resolution (mm) shows (and windows) a coarser level of a 3D volume (the coarsest with voxels no larger).'''
 		self.imageIndex = imageIndex
-		self.data3d = np.load(fn)
+		volume = loadVolume(fn)
+		self.data3d = volume.array
+		self.windowProjector = None
+		# Use the extent saved with the volume unless one is given.
+		if extent is None:
+			extent = volume.extent if volume.extent is not None else np.array([-1,1,-1,1])
+		if (resolution is not None) and (len(self.data3d.shape) == 3):
+			self.data3d, extent, pixelSize = openPyramid(fn,extent).at(resolution)
 		if len(self.data3d.shape) == 3:
 			# 3D Image (CT/MRI etc).
 			if imageIndex == 0:
-				self.data2d = np.sum(self.data3d,axis=2)
+				self.data2d = project(self.data3d,axis=2,mode='sum')
 				# Extent is L,R,B,T
 				self.extent = extent[:4]
 			elif imageIndex == 1:
-				self.data2d = np.sum(self.data3d,axis=1)
+				self.data2d = project(self.data3d,axis=1,mode='sum')
 				self.extent = np.concatenate((extent[4:6],extent[2:4]))
 		else:
 			# 2D Image (General X-ray).
@@ -116,24 +128,17 @@ class mpl2DFigure:
 
 	def imageWindow(self,windows):
 		'''Mask 3D array, flatten and redraw 2D array. windows as List of Lists(upper and lower limit)'''
-		conditions = ''
-		for window in windows:
-			conditions += '((self.data3d>'+str(window[0])+')&(self.data3d<'+str(window[1])+'))|'
-		conditions = conditions[:-1]
-		mask = eval(conditions)
-		self.data2d = self.data3d*mask
-
 		if self.imageIndex == 0:
 			direction = 2
 		elif self.imageIndex == 1:
 			direction = 1
-			
-		if self._radiographMode == 'max':
-			self.data2d = np.amax(self.data2d,axis=direction)
-		elif self._radiographMode == 'sum':
-			self.data2d = np.sum(self.data2d,axis=direction)
-		else:
-			pass
+
+		# The first window builds per-ray histograms of the volume. Windows with limits on round values (every 100 HU or
+		# so) are then a quick lookup, any other window is projected from the volume as before.
+		if (self.windowProjector is None) or (self.windowProjector.axis != direction):
+			self.windowProjector = windowedProjector(self.data3d,axis=direction)
+		if self._radiographMode in ('max','sum'):
+			self.data2d = self.windowProjector.project(windows,mode=self._radiographMode)
 
 		self.image.set_data(self.data2d)
 		self.image.set_clim(vmin=self.data2d.min())
@@ -154,6 +159,13 @@ class mpl2DFigure:
 			# Refresh views.
 			self.canvas.draw()
 
+	def markerDetect(self,fiducialSize):
+		'''Find fiducials over the whole image and add the best candidates as markers (up to the marker limit).'''
+		candidates = findFiducials(self.data2d,self.extent,fiducialSize,count=self.markersMaximum-self.i)
+		for x, y, diameter, score in candidates:
+			self.markerAdd(x,y)
+		return candidates
+
 	def markerUpdate(self,item):
 		'''Redraw all the markers to their updated positions.'''
 		if self.markerModel._locked: